@@ -0,0 +1,131 @@
+"""Summaries answered from the memory-mapped columns of the latest snapshot.
+
+/summary?mode=snapshot and /distribution read columns.arrow (see
+snapshot.py) instead of the database. The file is memory-mapped and its
+columns are used as NumPy arrays without a copy, so every summary is a
+couple of vectorised passes: period buckets are computed from the dates in
+bulk and totalled with bincount. Results use the same keys and order as
+rollups.read_rollups.
+"""
+import os
+import threading
+
+from snapshot import COLUMNS_FILE, CURRENT, NO_DATE, available, current_path, np, pa
+
+SECONDS_PER_DAY = 86400
+# Upper bounds of the /distribution buckets, in RWF; the last one is open
+AMOUNT_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+
+
+class SnapshotUnavailable(Exception):
+    """No snapshot has been written yet, or pyarrow is not installed."""
+
+
+class Snapshot:
+    """The columns of one published snapshot, as NumPy views of the mapped file."""
+
+    def __init__(self, path):
+        self.path = path
+        source = pa.memory_map(os.path.join(path, COLUMNS_FILE))
+        table = pa.ipc.open_file(source).read_all()
+        self.data_version = int(table.schema.metadata[b"data_version"])
+        types = table.column("transaction_type").combine_chunks()
+        self.type_codes = types.indices.to_numpy()
+        self.type_names = types.dictionary.to_pylist()
+        self.amounts = table.column("amount").combine_chunks().to_numpy()
+        self.dates = table.column("date_seconds").combine_chunks().to_numpy()
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def summary(self, group_by):
+        """Summary rows (key, total_amount, count), like rollups.read_rollups."""
+        if group_by == "type":
+            return self.by_type()
+        return self.by_period(group_by)
+
+    def by_type(self):
+        size = len(self.type_names)
+        totals = np.bincount(self.type_codes, weights=self.amounts, minlength=size)
+        counts = np.bincount(self.type_codes, minlength=size)
+        rows = [
+            (name, int(total), int(count))
+            for name, total, count in zip(self.type_names, totals, counts)
+            if count
+        ]
+        return sorted(rows)
+
+    def by_period(self, period):
+        dated = self.dates != NO_DATE
+        days = self.dates[dated] // SECONDS_PER_DAY
+        amounts = self.amounts[dated]
+        if period == "day":
+            codes = days
+            label = lambda code: str(np.datetime64(int(code), "D"))
+        elif period == "week":
+            # ISO weeks are named after the year of their Thursday; 1970-01-01
+            # was a Thursday, so (days + 3) % 7 is the weekday with Monday as 0
+            codes = days - (days + 3) % 7 + 3
+            label = iso_week
+        elif period == "month":
+            codes = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            label = lambda code: str(np.datetime64(int(code), "M"))
+        else:
+            raise ValueError(f"Unknown period {period!r}")
+        if not len(codes):
+            return []
+        first = codes.min()
+        totals = np.bincount(codes - first, weights=amounts)
+        counts = np.bincount(codes - first)
+        present = np.flatnonzero(counts)
+        return [
+            (label(first + offset), int(totals[offset]), int(counts[offset]))
+            for offset in present
+        ]
+
+    def amount_distribution(self, bounds=AMOUNT_BUCKETS):
+        """(lower, upper, count) per amount bucket; upper is None for the last one."""
+        counts = np.bincount(
+            np.searchsorted(np.asarray(bounds), self.amounts, side="right"),
+            minlength=len(bounds) + 1,
+        )
+        edges = (0,) + tuple(bounds)
+        return [
+            (lower, upper, int(count))
+            for lower, upper, count in zip(edges, tuple(bounds) + (None,), counts)
+        ]
+
+
+def iso_week(thursday):
+    """Rollup week key (2024-W19) of the ISO week whose Thursday is day number thursday."""
+    day = np.datetime64(int(thursday), "D")
+    year = day.astype("datetime64[Y]")
+    week = (day - year.astype("datetime64[D]")).astype(int) // 7 + 1
+    return f"{year}-W{week:02d}"
+
+
+class SnapshotReader:
+    """Opens the published snapshot, switching when a newer one is published."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._snapshot = None
+        self._pointer = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        if not available():
+            raise SnapshotUnavailable("pyarrow is not installed")
+        try:
+            stat = os.stat(os.path.join(self.directory, CURRENT))
+        except FileNotFoundError:
+            raise SnapshotUnavailable("No analytics snapshot has been written yet")
+        pointer = (stat.st_mtime_ns, stat.st_ino)
+        with self._lock:
+            if pointer != self._pointer:
+                path = current_path(self.directory)
+                if path is None:
+                    raise SnapshotUnavailable("No analytics snapshot has been written yet")
+                self._snapshot = Snapshot(path)
+                self._pointer = pointer
+            return self._snapshot
@@ -1,134 +1,203 @@
-from flask import Flask, jsonify, request, redirect, url_for
+from flask import Flask, Response, g, jsonify, request, redirect, stream_with_context, url_for
 from flasgger import Swagger, swag_from
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
-from models import Base, Transaction
+from sqlalchemy import create_engine, func, select
+from models import Transaction
+from analytics import SnapshotReader, SnapshotUnavailable
 from config import Config
+from db_setup import init_db
+from export import MEDIA_TYPES, YIELD_PER, iter_export
+from metrics import CONTENT_TYPE, instrument_engine, metrics, start_request
+from rollups import PERIODS, read_rollups
+from pagination import clamp_page_size, count_cache, keyset_after, keyset_order, next_cursor
+from response_cache import cache_key, data_version_query, read_data_version, response_cache
+from datetime import datetime
 import logging
+import threading
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
-engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-Session = sessionmaker(bind=engine)
+# Set by connect_database on the first request, so importing the app stays cheap
+engine = None
+Session = None
+_connect_lock = threading.Lock()
 
+# Endpoint specs are in specs/*.yml, read when the API docs are first requested
 swagger = Swagger(app)
+snapshots = SnapshotReader(app.config['SNAPSHOT_DIR'])
 
 logging.basicConfig(
     filename=app.config['LOG_FILE'],
     level=logging.INFO,
     format='%(asctime)s %(levelname)s: %(message)s'
 )
+TRANSACTION_COLUMNS = ['id', 'message', 'sender', 'receiver', 'amount', 'date', 'transaction_type']
+
+def transaction_to_dict(t):
+    return {
+        'id': t.id,
+        'message': t.message,
+        'sender': t.sender,
+        'receiver': t.receiver,
+        'amount': t.amount,
+        'date': t.date.isoformat() if t.date else None,
+        'transaction_type': t.transaction_type
+    }
+
+def transactions_page_query(cursor=None, per_page=10):
+    """One keyset page of transactions ordered by (date, id), plus one row to
+    detect more. Raises ValueError for a malformed cursor"""
+    query = select(Transaction)
+    if cursor:
+        query = query.where(keyset_after(Transaction.date, Transaction.id, cursor, int))
+    return query.order_by(*keyset_order(Transaction.date, Transaction.id)).limit(per_page + 1)
+
+def parse_value(args, name, parse, expected):
+    try:
+        return parse(args[name])
+    except ValueError:
+        raise ValueError(f'Invalid {name}: expected {expected}') from None
+
+def transaction_filters(args):
+    """The /filter query parameters (type, date range, amount range) as filter
+    clauses, raising ValueError for a malformed date or amount"""
+    filters = []
+    if args.get('type'):
+        filters.append(Transaction.transaction_type == args.get('type'))
+    if args.get('start_date'):
+        filters.append(Transaction.date >= parse_value(args, 'start_date', datetime.fromisoformat, 'YYYY-MM-DD'))
+    if args.get('end_date'):
+        filters.append(Transaction.date <= parse_value(args, 'end_date', datetime.fromisoformat, 'YYYY-MM-DD'))
+    if args.get('min_amount'):
+        filters.append(Transaction.amount >= parse_value(args, 'min_amount', int, 'an integer'))
+    if args.get('max_amount'):
+        filters.append(Transaction.amount <= parse_value(args, 'max_amount', int, 'an integer'))
+    return filters
+
+# Registered first, as every other hook and view reads the database
+@app.before_request
+def connect_database():
+    """Create the engine and the tables, patching databases created before the
+    current schema (fingerprints, rollups), on the first request"""
+    global engine, Session
+    if Session is not None:
+        return
+    with _connect_lock:
+        if Session is None:
+            engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+            instrument_engine(engine)
+            Session = init_db(engine)
+
+# Registered before the response cache hooks so that cache hits are measured
+# too, and so that record_metrics runs after every other after_request hook
+@app.before_request
+def start_metrics():
+    g.request_stats = start_request()
+
+@app.after_request
+def record_metrics(response):
+    """Record the request in /metrics once its body has been sent"""
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    method, status = request.method, response.status_code
+    if not response.is_streamed:
+        metrics.finish_request(stats, method, route, status, response.content_length or 0)
+        return response
+    sent = [0]
+    def counted(chunks):
+        for chunk in chunks:
+            sent[0] += len(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield chunk
+    response.response = counted(response.response)
+    response.call_on_close(lambda: metrics.finish_request(stats, method, route, status, sent[0]))
+    return response
+
+# Read endpoints whose responses only change when transactions are loaded
+CACHED_ENDPOINTS = {'get_transactions', 'get_transaction', 'filter_transactions', 'get_summary', 'get_distribution'}
+
+def cached_response(entry):
+    response = Response(entry.body, mimetype=entry.media_type)
+    response.set_etag(entry.etag)
+    return response.make_conditional(request)
+
+@app.before_request
+def serve_cached_response():
+    """Answer repeated GETs from the response cache while the data is unchanged"""
+    if request.method != 'GET' or request.endpoint not in CACHED_ENDPOINTS:
+        return None
+    version = response_cache.data_version(
+        'transactions', lambda: read_data_version(engine, 'transactions')
+    )
+    key = cache_key(request.path, request.args.items(multi=True))
+    entry = response_cache.get(key, version)
+    if entry is not None:
+        return cached_response(entry)
+    g.response_cache_key = (key, version)
+    return None
+
+@app.after_request
+def store_cached_response(response):
+    pending = g.pop('response_cache_key', None)
+    if pending is None or response.status_code != 200 or response.is_streamed:
+        return response
+    key, version = pending
+    entry = response_cache.put(key, version, response.get_data(), response.mimetype)
+    response.set_etag(entry.etag)
+    return response.make_conditional(request)
+
+@app.route('/cache', methods=['GET'])
+def get_cache_stats():
+    """Response cache hit, miss and eviction counters"""
+    return jsonify(response_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request latency, database time, rows and response size per route"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.after_request
+def allow_dashboard_origin(response):
+    # The static dashboard reads /summary from another origin
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+    return response
+
 @app.route('/')
 def redirect_to_docs():
     """Redirect to Swagger documentation"""
     return redirect(url_for('flasgger.apidocs'), code=302)
 
 @app.route('/transactions', methods=['GET'])
-@swag_from({
-    'tags': ['Transactions'],
-    'parameters': [
-        {
-            'name': 'page',
-            'in': 'query',
-            'type': 'integer',
-            'description': 'Page number (default: 1)',
-            'default': 1
-        },
-        {
-            'name': 'per_page',
-            'in': 'query',
-            'type': 'integer',
-            'description': 'Items per page (default: 10)',
-            'default': 10
-        }
-    ],
-    'responses': {
-        200: {
-            'description': 'List of transactions',
-            'schema': {
-                'type': 'object',
-                'properties': {
-                    'transactions': {
-                        'type': 'array',
-                        'items': {
-                            'type': 'object',
-                            'properties': {
-                                'id': {'type': 'integer'},
-                                'message': {'type': 'string'},
-                                'sender': {'type': 'string'},
-                                'receiver': {'type': 'string'},
-                                'amount': {'type': 'integer'},
-                                'date': {'type': 'string'},
-                                'transaction_type': {'type': 'string'}
-                            }
-                        }
-                    },
-                    'total': {'type': 'integer'},
-                    'page': {'type': 'integer'},
-                    'per_page': {'type': 'integer'}
-                }
-            }
-        }
-    }
-})
+@swag_from('specs/get_transactions.yml')
 def get_transactions():
-    """Get paginated list of transactions"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    """Get a page of transactions using keyset (cursor) pagination"""
+    per_page = clamp_page_size(request.args.get('per_page', 10, type=int), 10)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', 'false').lower() in ('1', 'true', 'yes')
+    try:
+        query = transactions_page_query(cursor, per_page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     session = Session()
     try:
-        transactions = session.query(Transaction).limit(per_page).offset((page - 1) * per_page).all()
-        total = session.query(func.count(Transaction.id)).scalar()
-        result = [{
-            'id': t.id,
-            'message': t.message,
-            'sender': t.sender,
-            'receiver': t.receiver,
-            'amount': t.amount,
-            'date': t.date.isoformat() if t.date else None,
-            'transaction_type': t.transaction_type
-        } for t in transactions]
-        return jsonify({
-            'transactions': result,
-            'total': total,
-            'page': page,
+        transactions = session.scalars(query).all()
+        response = {
+            'transactions': [transaction_to_dict(t) for t in transactions[:per_page]],
+            'next_cursor': next_cursor(transactions, per_page),
             'per_page': per_page
-        })
+        }
+        if include_total:
+            version = session.execute(data_version_query('transactions')).scalar() or 0
+            response['total'] = count_cache.get(
+                ('transactions', version), lambda: session.query(func.count(Transaction.id)).scalar()
+            )
+        return jsonify(response)
     finally:
         session.close()
 
 @app.route('/transactions/<int:id>', methods=['GET'])
-@swag_from({
-    'tags': ['Transactions'],
-    'parameters': [
-        {
-            'name': 'id',
-            'in': 'path',
-            'type': 'integer',
-            'required': True,
-            'description': 'Transaction ID'
-        }
-    ],
-    'responses': {
-        200: {
-            'description': 'Transaction details',
-            'schema': {
-                'type': 'object',
-                'properties': {
-                    'id': {'type': 'integer'},
-                    'message': {'type': 'string'},
-                    'sender': {'type': 'string'},
-                    'receiver': {'type': 'string'},
-                    'amount': {'type': 'integer'},
-                    'date': {'type': 'string'},
-                    'transaction_type': {'type': 'string'}
-                }
-            }
-        },
-        404: {'description': 'Transaction not found'}
-    }
-})
+@swag_from('specs/get_transaction.yml')
 def get_transaction(id):
     """Get details of a specific transaction"""
     session = Session()
@@ -136,158 +205,110 @@ def get_transaction(id):
         transaction = session.query(Transaction).get(id)
         if not transaction:
             return jsonify({'error': 'Transaction not found'}), 404
-        return jsonify({
-            'id': transaction.id,
-            'message': transaction.message,
-            'sender': transaction.sender,
-            'receiver': transaction.receiver,
-            'amount': transaction.amount,
-            'date': transaction.date.isoformat() if transaction.date else None,
-            'transaction_type': transaction.transaction_type
-        })
+        return jsonify(transaction_to_dict(transaction))
     finally:
         session.close()
 
 @app.route('/filter', methods=['GET'])
-@swag_from({
-    'tags': ['Transactions'],
-    'parameters': [
-        {
-            'name': 'type',
-            'in': 'query',
-            'type': 'string',
-            'description': 'Transaction type (e.g., Incoming Money)'
-        },
-        {
-            'name': 'start_date',
-            'in': 'query',
-            'type': 'string',
-            'description': 'Start date (YYYY-MM-DD)'
-        },
-        {
-            'name': 'end_date',
-            'in': 'query',
-            'type': 'string',
-            'description': 'End date (YYYY-MM-DD)'
-        },
-        {
-            'name': 'min_amount',
-            'in': 'query',
-            'type': 'integer',
-            'description': 'Minimum amount'
-        },
-        {
-            'name': 'max_amount',
-            'in': 'query',
-            'type': 'integer',
-            'description': 'Maximum amount'
-        }
-    ],
-    'responses': {
-        200: {
-            'description': 'Filtered transactions',
-            'schema': {
-                'type': 'array',
-                'items': {
-                    'type': 'object',
-                    'properties': {
-                        'id': {'type': 'integer'},
-                        'message': {'type': 'string'},
-                        'sender': {'type': 'string'},
-                        'receiver': {'type': 'string'},
-                        'amount': {'type': 'integer'},
-                        'date': {'type': 'string'},
-                        'transaction_type': {'type': 'string'}
-                    }
-                }
-            }
-        }
-    }
-})
+@swag_from('specs/filter_transactions.yml')
 def filter_transactions():
     """Filter transactions by type, date, or amount"""
+    try:
+        filters = transaction_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     session = Session()
     try:
-        query = session.query(Transaction)
-        if request.args.get('type'):
-            query = query.filter(Transaction.transaction_type == request.args.get('type'))
-        if request.args.get('start_date'):
-            query = query.filter(Transaction.date >= request.args.get('start_date'))
-        if request.args.get('end_date'):
-            query = query.filter(Transaction.date <= request.args.get('end_date'))
-        if request.args.get('min_amount'):
-            query = query.filter(Transaction.amount >= request.args.get('min_amount', type=int))
-        if request.args.get('max_amount'):
-            query = query.filter(Transaction.amount <= request.args.get('max_amount', type=int))
-        transactions = query.all()
-        result = [{
-            'id': t.id,
-            'message': t.message,
-            'sender': t.sender,
-            'receiver': t.receiver,
-            'amount': t.amount,
-            'date': t.date.isoformat() if t.date else None,
-            'transaction_type': t.transaction_type
-        } for t in transactions]
+        transactions = session.query(Transaction).filter(*filters).all()
+        result = [transaction_to_dict(t) for t in transactions]
         return jsonify(result)
     finally:
         session.close()
 
+@app.route('/export', methods=['GET'])
+@swag_from('specs/export_transactions.yml')
+def export_transactions():
+    """Stream filtered transactions as NDJSON or CSV"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in MEDIA_TYPES:
+        return jsonify({'error': f'Unsupported export format: {fmt}'}), 400
+    # Checked before streaming starts, as errors past that point cannot change the status
+    try:
+        filters = transaction_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        session = Session()
+        try:
+            query = session.query(Transaction).filter(*filters)
+            # yield_per streams rows from a server-side cursor in fixed-size batches
+            rows = query.order_by(*keyset_order(Transaction.date, Transaction.id)).yield_per(YIELD_PER)
+            yield from iter_export(rows, TRANSACTION_COLUMNS, transaction_to_dict, fmt)
+        finally:
+            session.close()
+
+    response = Response(stream_with_context(generate()), mimetype=MEDIA_TYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=transactions.{fmt}'
+    return response
+
 @app.route('/summary', methods=['GET'])
-@swag_from({
-    'tags': ['Transactions'],
-    'parameters': [
-        {
-            'name': 'group_by',
-            'in': 'query',
-            'type': 'string',
-            'enum': ['type', 'month'],
-            'description': 'Group by transaction type or month'
-        }
-    ],
-    'responses': {
-        200: {
-            'description': 'Transaction summaries',
-            'schema': {
-                'type': 'object',
-                'properties': {
-                    'summary': {
-                        'type': 'array',
-                        'items': {
-                            'type': 'object',
-                            'properties': {
-                                'key': {'type': 'string'},
-                                'total_amount': {'type': 'integer'},
-                                'count': {'type': 'integer'}
-                            }
-                        }
-                    }
-                }
-            }
-        }
-    }
-})
+@swag_from('specs/get_summary.yml')
 def get_summary():
-    """Get transaction summaries (by type or month)"""
+    """Get transaction summaries (by type, day, week or month)"""
+    group_by = request.args.get('group_by', 'type')
+    mode = request.args.get('mode', 'rollup')
+    if group_by not in ('type',) + PERIODS or mode not in ('rollup', 'live', 'snapshot'):
+        return jsonify({'error': 'Unsupported group_by or mode'}), 400
+    if mode == 'snapshot':
+        try:
+            snapshot = snapshots.current()
+        except SnapshotUnavailable as e:
+            return jsonify({'error': str(e)}), 503
+        forget_stale_snapshot(snapshot)
+        summary = snapshot.summary(group_by)
+        return jsonify({'summary': [{'key': k, 'total_amount': t, 'count': c} for k, t, c in summary]})
     session = Session()
     try:
-        group_by = request.args.get('group_by', 'type')
-        if group_by == 'type':
+        if mode == 'rollup':
+            summary = read_rollups(session, group_by)
+        elif group_by == 'type':
             summary = session.query(
                 Transaction.transaction_type,
                 func.sum(Transaction.amount).label('total_amount'),
                 func.count(Transaction.id).label('count')
             ).group_by(Transaction.transaction_type).all()
-        else: 
+        elif group_by == 'month':
             summary = session.query(
                 func.strftime('%Y-%m', Transaction.date).label('month'),
                 func.sum(Transaction.amount).label('total_amount'),
                 func.count(Transaction.id).label('count')
             ).group_by(func.strftime('%Y-%m', Transaction.date)).all()
+        else:
+            return jsonify({'error': 'Live summaries only support group_by=type or month'}), 400
         result = [{'key': row[0], 'total_amount': row[1], 'count': row[2]} for row in summary]
         return jsonify({'summary': result})
     finally:
         session.close()
 
+def forget_stale_snapshot(snapshot):
+    """Keep answers from a snapshot that lags the data out of the response cache"""
+    pending = g.get('response_cache_key')
+    if pending and pending[1] != snapshot.data_version:
+        g.pop('response_cache_key')
+
+@app.route('/distribution', methods=['GET'])
+@swag_from('specs/get_distribution.yml')
+def get_distribution():
+    """Get the distribution of transaction amounts"""
+    try:
+        snapshot = snapshots.current()
+    except SnapshotUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    forget_stale_snapshot(snapshot)
+    result = [{'min': lower, 'max': upper, 'count': count}
+              for lower, upper, count in snapshot.amount_distribution()]
+    return jsonify({'distribution': result})
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,882 @@
+"""Micro-benchmarks for the ingestion and query paths.
+
+Run from the backend directory, for example::
+
+    python benchmarks.py classifier --xml modified_sms_v2.xml
+    python benchmarks.py parallel --factor 100 --workers 1,2,4,8
+    python benchmarks.py search --factor 600
+    python benchmarks.py timestamps --factor 20
+    python benchmarks.py amounts --factor 600
+    python benchmarks.py records --rows 1000000
+    python benchmarks.py startup --budget main=1200,app=1000
+    python benchmarks.py analytics --rows 1000000
+    python benchmarks.py unified --sizes 10000,100000
+
+The suite benchmark times the ingest, query and summary paths end to end on
+synthetic archives of several sizes and writes the timings to JSON. Given a
+baseline from an earlier run it flags every case that got slower by more
+than --threshold and exits with status 1::
+
+    python benchmarks.py suite --sizes 1000,10000 --output main.json
+    python benchmarks.py suite --sizes 1000,10000 --output branch.json --baseline main.json
+    python benchmarks.py compare --baseline main.json --output branch.json
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from xml.sax.saxutils import quoteattr
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from bulk_writer import DEFAULT_BATCH_SIZE, BulkWriter
+from classifier import classify
+from config import Config
+from data_cleaning import clean_amount
+from db_setup import init_db
+from generate_sms import generate
+from load_data import load_transactions
+from message_fields import extract_amount, extract_fields, extract_fields_one, field_values
+from migrations import upgrade
+from models import Transaction
+from parallel import DEFAULT_CHUNK_SIZE, chunked, imap_chunks
+from parse_xml import iter_sms_attributes, iter_sms_records, iter_transactions, parse_sms_xml
+from records import SmsRecord, TransactionRecord
+from response_cache import bump_data_version, create_data_versions, response_cache
+from rollups import PERIODS, apply_rollups, rebuild_rollups
+from search import create_search_index, search_sms
+from snapshot import write_snapshot
+from timestamps import epoch_ms_to_datetimes
+from utils import fingerprint
+from sms_data import (
+    IngestionState,
+    SmsData,
+    count_sms,
+    get_all_sms,
+    get_sms_filters,
+    paginate_sms,
+    prepare_database,
+)
+from sms_processing import PARSED, SMSProcessor, parse_sms, parse_sms_chunk
+
+DEFAULT_XML = "modified_sms_v2.xml"
+
+
+def measure(func, items, repeat=5):
+    """Best-of-repeat throughput of func applied to every item, in items/sec."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - started)
+    return len(items) / best
+
+
+def report(title, rows):
+    print(title)
+    print(f"{'variant':<28}{'items/sec':>14}{'speedup':>10}")
+    baseline = rows[0][1]
+    for name, rate in rows:
+        print(f"{name:<28}{rate:>14,.0f}{rate / baseline:>9.2f}x")
+
+
+def load_bodies(xml_file):
+    return [sms.get("body", "") for sms in iter_sms_attributes(xml_file)]
+
+
+def legacy_classify(message):
+    """The if/elif chain SMSProcessor.parse_message used before the rule table."""
+    if "received" in message.lower():
+        return "Incoming Money", "Coming"
+    elif "transferred" in message.lower():
+        return "Transfers To Mobile Numbers", "Going"
+    elif "payment" in message.lower():
+        return "Payments to Code Holders", "Going"
+    elif "bank deposit" in message.lower():
+        return "Bank Deposits", "Coming"
+    elif "to Airtime" in message.lower():
+        return "Airtime Bill Payments", "Going"
+    elif "Cash Power" in message.lower():
+        return "Cash Power Bill Payments", "Going"
+    elif "a transaction of" in message.lower():
+        return "Transactions Initiated by Third Parties", "Going"
+    elif "agent" in message.lower():
+        return "Withdrawals from Agents", "Going"
+    elif "kugura" in message.lower():
+        return "Internet and Voice Bundle Purchases", "Going"
+    elif "failed" in message.lower():
+        return "Failed Transactions", "No change"
+    elif "reversed" in message.lower() or "reversal" in message.lower():
+        return "Reversed Transactions", "both ways"
+    return "Unknown", "Unknown"
+
+
+def bench_classifier(args):
+    bodies = load_bodies(args.xml)
+    mismatches = sum(legacy_classify(body) != classify(body) for body in bodies)
+    report(
+        f"Message classification, {len(bodies)} messages ({mismatches} differ)",
+        [
+            ("if/elif chain", measure(legacy_classify, bodies, args.repeat)),
+            ("rule table", measure(classify, bodies, args.repeat)),
+        ],
+    )
+
+
+def enlarge_archive(xml_file, factor, path):
+    """Write xml_file repeated factor times, shifting dates so no copy is a duplicate."""
+    records = list(iter_sms_attributes(xml_file))
+    with open(path, "w", encoding="utf-8") as out:
+        out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        out.write(f'<smses count="{len(records) * factor}">\n')
+        for copy in range(factor):
+            for sms in records:
+                sms = dict(sms)
+                for key in ("date", "date_sent"):
+                    if sms.get(key, "").isdigit():
+                        sms[key] = str(int(sms[key]) + copy)
+                attributes = " ".join(f"{k}={quoteattr(v)}" for k, v in sms.items())
+                out.write(f"  <sms {attributes} />\n")
+        out.write("</smses>\n")
+    return len(records) * factor
+
+
+def bench_parallel(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "enlarged.xml")
+        count = enlarge_archive(args.xml, args.factor, path)
+        rows = []
+        for workers in args.workers:
+            started = time.perf_counter()
+            for _ in imap_chunks(parse_sms_chunk, iter_sms_records(path), workers):
+                pass
+            rows.append((f"{workers} worker(s)", count / (time.perf_counter() - started)))
+    report(f"Parse/classify stage, {count} messages, {os.cpu_count()} CPUs", rows)
+
+
+SEARCH_TERMS = ["airtime", "jane smith", "kugura", "agent", "reversed", "bank dep"]
+
+
+def load_search_db(engine, xml_file, factor):
+    """Fill smsdata with factor copies of the parsed backup; returns the row count."""
+    rows = [payload for outcome, payload in map(parse_sms, iter_sms_attributes(xml_file))
+            if outcome == PARSED]
+    insert = SmsData.__table__.insert()
+    with engine.begin() as conn:
+        for _ in range(factor):
+            conn.execute(
+                insert,
+                [{**row.as_dict(), "id": uuid.uuid4(), "fingerprint": None} for row in rows],
+            )
+    return len(rows) * factor
+
+
+def time_query(run, repeat):
+    """Best-of-repeat latency of run(), in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def bench_search(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'search.db')}")
+        SQLModel.metadata.create_all(engine)
+        create_search_index(engine)
+        count = load_search_db(engine, args.xml, args.factor)
+        print(f"Search latency over {count:,} messages, first page of 20, best of {args.repeat}")
+        print(f"{'term':<16}{'matches':>10}{'ILIKE ms':>12}{'FTS5 ms':>12}")
+        with Session(engine) as db:
+            for term in SEARCH_TERMS:
+                filters = get_sms_filters(term, None, None, None)
+                ilike = time_query(
+                    lambda: paginate_sms(db, filters, None, 20), args.repeat
+                )
+                ranked = time_query(
+                    lambda: search_sms(db, SmsData, term, [], 20), args.repeat
+                )
+                matches = count_sms(db, filters, ("bench", term))
+                print(f"{term:<16}{matches:>10,}{ilike:>12.2f}{ranked:>12.2f}")
+
+
+def timings(run, repeat, setup=None):
+    """Wall time of each of repeat calls, in seconds.
+
+    setup() runs untimed before every call and its result is passed to run,
+    for cases such as ingestion that need a fresh database each time.
+    """
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        # parse_xml and friends print progress; keep it out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            started = time.perf_counter()
+            run(*args)
+            times.append(time.perf_counter() - started)
+    return times
+
+
+class Suite:
+    """Collects suite timings and prints them as they come in."""
+
+    def __init__(self):
+        self.results = []
+
+    def add(self, case, size, times, items=None):
+        median = statistics.median(times)
+        result = {
+            "case": case,
+            "size": size,
+            "median_s": median,
+            "min_s": min(times),
+            "repeat": len(times),
+        }
+        if items:
+            result["items_per_sec"] = items / median
+        self.results.append(result)
+        rate = f"{result['items_per_sec']:>14,.0f}" if items else f"{'':>14}"
+        print(f"{case:<40}{size:>10,}{median * 1000:>12.2f}{min(times) * 1000:>12.2f}{rate}")
+
+
+def sms_engine(path):
+    """A new smsdata database, set up the way the FastAPI app does at startup."""
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    upgrade(engine, [SmsData, IngestionState])
+    create_search_index(engine)
+    create_data_versions(engine)
+    return engine
+
+
+def transactions_db(path):
+    """A new transactions database, set up the way db_setup does."""
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+    init_db()
+    return Config.SQLALCHEMY_DATABASE_URI
+
+
+def flask_client(database_url):
+    """Test client for the Flask app, reading from database_url."""
+    Config.SQLALCHEMY_DATABASE_URI = database_url
+    import app as flask_app
+    from analytics import SnapshotReader
+
+    # Set here, so the app does not connect to Config's database on the
+    # first request; each call may point it at a different one
+    flask_app.engine = create_engine(database_url)
+    flask_app.Session = sessionmaker(bind=flask_app.engine)
+    flask_app.snapshots = SnapshotReader(Config.SNAPSHOT_DIR)
+    return flask_app.app.test_client()
+
+
+def get_ok(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} answered {response.status_code}")
+    return response.get_json()
+
+
+def bench_ingest(suite, tmp, xml, size, repeat):
+    """Time the ingest paths; returns the (smsdata, transactions) databases they filled."""
+    suite.add("ingest.parse_sms_xml", size, timings(lambda: parse_sms_xml(xml), repeat), size)
+
+    bodies = load_bodies(xml)
+    suite.add(
+        "ingest.SMSProcessor.parse_message",
+        size,
+        timings(lambda: [SMSProcessor.parse_message(body) for body in bodies], repeat),
+        len(bodies),
+    )
+
+    paths = iter(range(repeat))
+    engines = []
+
+    def new_sms_engine():
+        engines.append(sms_engine(os.path.join(tmp, f"sms-{size}-{next(paths)}.db")))
+        return engines[-1]
+
+    def store_sms(engine):
+        with Session(engine) as db:
+            processor = SMSProcessor(
+                db=db, xml_file=xml, log_file=os.path.join(tmp, "unprocessed_sms.log")
+            )
+            result = processor.process_and_store_sms()
+        if "error" in result:
+            raise RuntimeError(result["error"])
+
+    suite.add(
+        "ingest.process_and_store_sms",
+        size,
+        timings(store_sms, repeat, new_sms_engine),
+        size,
+    )
+
+    urls = []
+    databases = iter(range(repeat))
+
+    def new_transactions_db():
+        urls.append(transactions_db(os.path.join(tmp, f"tx-{size}-{next(databases)}.db")))
+        return urls[-1]
+
+    suite.add(
+        "ingest.load_transactions",
+        size,
+        timings(lambda url: load_transactions(xml), repeat, new_transactions_db),
+        size,
+    )
+    return engines[-1], urls[-1]
+
+
+def bench_sms_queries(suite, engine, size, repeat):
+    with Session(engine) as db:
+        # Filter values that are known to match something in this archive
+        sample = db.exec(
+            select(SmsData).where(SmsData.amount.is_not(None), SmsData.date.is_not(None))
+        ).first()
+        filters = {
+            "none": {},
+            "search": {"search": "airtime"},
+            "type": {"type": "Incoming Money"},
+            "date": {"date": sample.date.date()},
+            "amount": {"amount": sample.amount},
+        }
+        for name, values in filters.items():
+            kwargs = {"search": None, "type": None, "date": None, "amount": None, **values}
+            suite.add(
+                f"query.get_all_sms[{name}]",
+                size,
+                timings(lambda: get_all_sms(db, **kwargs), repeat),
+            )
+
+
+# Pages of PAGE_SIZE walked before timing /transactions
+PAGE_DEPTHS = (1, 10, 100)
+PAGE_SIZE = 50
+
+
+def bench_transaction_queries(suite, database_url, size, repeat):
+    client = flask_client(database_url)
+    cursor, depth = None, 1
+    for target in PAGE_DEPTHS:
+        while depth < target and cursor is not False:
+            page = get_ok(client, f"/transactions?per_page={PAGE_SIZE}&cursor={cursor or ''}")
+            cursor, depth = page["next_cursor"] or False, depth + 1
+        if cursor is False:
+            break
+        url = f"/transactions?per_page={PAGE_SIZE}&cursor={cursor or ''}"
+        suite.add(
+            f"query.get_transactions[page {target}]",
+            size,
+            timings(lambda: get_ok(client, url), repeat),
+        )
+
+    for mode in ("rollup", "live", "snapshot"):
+        for group_by in ("type", "month"):
+            url = f"/summary?group_by={group_by}&mode={mode}"
+            suite.add(
+                f"summary.get_summary[{mode}, {group_by}]",
+                size,
+                timings(lambda: get_ok(client, url), repeat),
+            )
+    suite.add(
+        "summary.get_distribution",
+        size,
+        timings(lambda: get_ok(client, "/distribution"), repeat),
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return result["case"], result["size"]
+
+
+def compare(baseline, results, threshold):
+    """Print how results moved against baseline; returns the regressed cases."""
+    before = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    print(f"Compared with {baseline['meta'].get('revision') or 'baseline'}, "
+          f"threshold +{threshold:.0%}")
+    print(f"{'case':<40}{'size':>10}{'before ms':>12}{'after ms':>12}{'change':>10}")
+    for result in results:
+        old = before.get(result_key(result))
+        if old is None:
+            continue
+        change = result["median_s"] / old["median_s"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(result)
+            flag = "  REGRESSION"
+        print(
+            f"{result['case']:<40}{result['size']:>10,}{old['median_s'] * 1000:>12.2f}"
+            f"{result['median_s'] * 1000:>12.2f}{change:>+10.1%}{flag}"
+        )
+    print(f"{len(regressions)} regression(s)")
+    return regressions
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def bench_suite(args):
+    # Every request should reach the database, not the response cache
+    response_cache.maxsize = 0
+    suite = Suite()
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.SNAPSHOT_DIR = os.path.join(tmp, "snapshots")
+        print(f"{'case':<40}{'size':>10}{'median ms':>12}{'min ms':>12}{'items/sec':>14}")
+        for size in args.sizes:
+            xml = os.path.join(tmp, f"synthetic-{size}.xml")
+            generate(xml, size, duplicate_rate=0.01, seed=size)
+            sms, transactions = bench_ingest(suite, tmp, xml, size, args.ingest_repeat)
+            bench_sms_queries(suite, sms, size, args.repeat)
+            bench_transaction_queries(suite, transactions, size, args.repeat)
+            sms.dispose()
+
+    run = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": suite.results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"Wrote {len(suite.results)} results to {args.output}")
+    if args.baseline and compare(load_results(args.baseline), suite.results, args.threshold):
+        sys.exit(1)
+
+
+def bench_compare(args):
+    if not args.baseline:
+        sys.exit("compare needs --baseline")
+    current = load_results(args.output)
+    if compare(load_results(args.baseline), current["results"], args.threshold):
+        sys.exit(1)
+
+
+def legacy_sms_dates(sms):
+    """How sms_processing converted both timestamps before timestamps.py."""
+    date = datetime.fromtimestamp(int(sms["date"]) / 1000).strftime("%Y-%m-%d%H:%M:%S")
+    sent = datetime.fromtimestamp(int(sms["date_sent"]) / 1000).strftime("%Y-%m-%d%H:%M:%S")
+    return (
+        datetime.strptime(date, "%Y-%m-%d%H:%M:%S"),
+        datetime.strptime(sent, "%Y-%m-%d%H:%M:%S"),
+    )
+
+
+def legacy_transaction_date(sms):
+    """How parse_xml converted the date, with the old clean_date, before timestamps.py."""
+    date_str = datetime.fromtimestamp(int(sms["date"]) / 1000).strftime("%Y-%m-%d %H:%M:%S")
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
+            continue
+
+
+def batch_sms_dates(chunk):
+    return (
+        epoch_ms_to_datetimes([sms["date"] for sms in chunk]),
+        epoch_ms_to_datetimes([sms["date_sent"] for sms in chunk]),
+    )
+
+
+def bench_timestamps(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "enlarged.xml")
+        enlarge_archive(args.xml, args.factor, path)
+        records = list(iter_sms_attributes(path))
+    chunks = list(chunked(records, DEFAULT_CHUNK_SIZE))
+    per_chunk = len(records) / len(chunks)
+    if legacy_sms_dates(records[0]) != tuple(d[0] for d in batch_sms_dates(records[:1])):
+        raise SystemExit("batch conversion disagrees with the legacy round trip")
+    report(
+        f"Timestamp conversion, {len(records)} messages (date and date_sent)",
+        [
+            ("strftime/strptime round trip", measure(legacy_sms_dates, records, args.repeat)),
+            ("batches of 1000", measure(batch_sms_dates, chunks, args.repeat) * per_chunk),
+        ],
+    )
+    report(
+        f"Transaction dates, {len(records)} messages",
+        [
+            ("strftime + strptime", measure(legacy_transaction_date, records, args.repeat)),
+            (
+                "batches of 1000",
+                measure(
+                    lambda chunk: epoch_ms_to_datetimes([sms["date"] for sms in chunk]),
+                    chunks,
+                    args.repeat,
+                ) * per_chunk,
+            ),
+        ],
+    )
+
+
+LEGACY_AMOUNT_PATTERN = re.compile(r"(\d+(?:,\d{3})*)\s*RWF")
+
+
+def legacy_sms_amount(message):
+    """How sms_processing.extract_amount read the amount before message_fields.py."""
+    amount_search = LEGACY_AMOUNT_PATTERN.search(message)
+    return float(amount_search.group(1).replace(",", "")) if amount_search else None
+
+
+def legacy_transaction_amount(message):
+    """How parse_xml read the amount before message_fields.py."""
+    if "RWF" in message:
+        return clean_amount(message.split("RWF")[0].split()[-1].replace(",", ""))
+    return None
+
+
+def bench_amounts(args):
+    bodies = load_bodies(args.xml) * args.factor
+    chunks = list(chunked(bodies, DEFAULT_CHUNK_SIZE))
+    per_chunk = len(bodies) / len(chunks)
+    amounts = field_values(extract_fields(bodies).amount)
+    differ = sum(
+        legacy != amount for legacy, amount in zip(map(legacy_sms_amount, bodies), amounts)
+    )
+    report(
+        f"Amount extraction, {len(bodies)} messages ({differ} differ from the smsdata path)",
+        [
+            ("smsdata regex search", measure(legacy_sms_amount, bodies, args.repeat)),
+            ("transactions split", measure(legacy_transaction_amount, bodies, args.repeat)),
+            ("first amount, per message", measure(extract_amount, bodies, args.repeat)),
+            ("all fields, per message", measure(extract_fields_one, bodies, args.repeat)),
+            (
+                f"all fields, chunks of {DEFAULT_CHUNK_SIZE}",
+                measure(extract_fields, chunks, args.repeat) * per_chunk,
+            ),
+            ("all fields, one batch", measure(extract_fields, [bodies], args.repeat) * len(bodies)),
+        ],
+    )
+
+
+def traced_rows(build):
+    """Bytes and allocations per row still held after build(), and its time."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    rows = build()
+    elapsed = time.perf_counter() - started
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    size = sum(stat.size_diff for stat in stats)
+    count = sum(stat.count_diff for stat in stats)
+    return size / len(rows), count / len(rows), elapsed
+
+
+def bench_records(args):
+    records = list(iter_sms_records(args.xml))
+    sms = [payload.as_dict() for _, _, outcome, payload in parse_sms_chunk(records)
+           if outcome == PARSED]
+    transactions = [t.as_dict() for t in iter_transactions(args.xml)]
+
+    # Validated models take minutes per million; their size per row is the same
+    model_rows = min(args.rows, 100000)
+
+    def build(make, values, rows=args.rows):
+        return lambda: [make(values[i % len(values)]) for i in range(rows)]
+
+    print(f"Rows held in memory, {args.rows} per variant (built with tracemalloc on)")
+    print(f"{'variant':<28}{'bytes/row':>12}{'allocs/row':>12}{'build us/row':>14}")
+    for name, make, values, rows in (
+        ("smsdata dict", dict, sms, args.rows),
+        (f"SmsData model ({model_rows})", lambda row: SmsData(**row), sms, model_rows),
+        ("SmsRecord", lambda row: SmsRecord(**row), sms, args.rows),
+        ("transaction dict", dict, transactions, args.rows),
+        ("TransactionRecord", lambda row: TransactionRecord(**row), transactions, args.rows),
+    ):
+        size, count, elapsed = traced_rows(build(make, values, rows))
+        print(f"{name:<28}{size:>12,.0f}{count:>12.1f}{elapsed / rows * 1e6:>14.2f}")
+
+
+ANALYTICS_TYPES = (
+    "Incoming Money", "Payment to Code Holder", "Transfer to Mobile Number",
+    "Bank Deposit", "Airtime Bill Payment", "Cash Power Bill Payment",
+    "Withdrawal from Agent", "Internet and Voice Bundle Purchase", "Unknown",
+)
+
+
+def fill_transactions(database_url, rows, seed=0):
+    """Insert rows synthetic transactions spread over three years, then build the rollups."""
+    engine = create_engine(database_url)
+    rng = random.Random(seed)
+    start = datetime(2022, 1, 1)
+    span = 3 * 365 * 86400
+    batch_size = 50000
+    with engine.begin() as conn:
+        for first in range(0, rows, batch_size):
+            conn.execute(
+                insert(Transaction),
+                [
+                    {
+                        "message": "synthetic",
+                        "amount": rng.choice((None, rng.randrange(100, 2_000_000))),
+                        "date": start + timedelta(seconds=rng.randrange(span)),
+                        "transaction_type": rng.choice(ANALYTICS_TYPES),
+                    }
+                    for _ in range(min(batch_size, rows - first))
+                ],
+            )
+        bump_data_version(conn, "transactions")
+    with sessionmaker(bind=engine)() as session:
+        rebuild_rollups(session)
+    return engine
+
+
+def bench_analytics(args):
+    response_cache.maxsize = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.SNAPSHOT_DIR = os.path.join(tmp, "snapshots")
+        database_url = transactions_db(os.path.join(tmp, "analytics.db"))
+        started = time.perf_counter()
+        engine = fill_transactions(database_url, args.rows)
+        print(f"Inserted {args.rows:,} transactions in {time.perf_counter() - started:.1f}s")
+        snapshot_times = timings(lambda: write_snapshot(engine, Config.SNAPSHOT_DIR), 1)
+        print(f"Wrote the snapshot in {snapshot_times[0]:.1f}s")
+        client = flask_client(database_url)
+
+        print(f"{'summary':<20}{'rollup ms':>12}{'live ms':>12}{'snapshot ms':>14}")
+        for group_by in ("type",) + PERIODS:
+            medians = []
+            for mode in ("rollup", "live", "snapshot"):
+                if mode == "live" and group_by not in ("type", "month"):
+                    medians.append(f"{'-':>12}")
+                    continue
+                url = f"/summary?group_by={group_by}&mode={mode}"
+                times = timings(lambda: get_ok(client, url), args.repeat)
+                medians.append(f"{statistics.median(times) * 1000:>12.2f}")
+            print(f"{group_by:<20}{medians[0]}{medians[1]}{medians[2]:>14}")
+        times = timings(lambda: get_ok(client, "/distribution"), args.repeat)
+        print(f"{'distribution':<20}{'':>12}{'':>12}{statistics.median(times) * 1000:>14.2f}")
+        engine.dispose()
+
+
+# Cold-start budget per API module, in ms of cumulative -X importtime: the
+# baseline's medians (main 886 ms, app 635 ms, measured interleaved with this
+# tree on the same machine). Both now connect at startup rather than at
+# import, so they must come in under it
+STARTUP_BUDGETS = {"main": 880, "app": 630}
+# Modules the API services must leave to ingestion and analytics
+STARTUP_LAZY = ("numpy", "pyarrow", "pyexpat", "sms_processing")
+
+
+def import_times(module):
+    """(name, depth, cumulative us) for every import done by importing module.
+
+    The module is imported in a fresh interpreter against an in-memory SQLite
+    database, so no database server is needed.
+    """
+    env = {**os.environ, "DATABASE_URL": "sqlite://"}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), depth, int(cumulative)))
+    return times
+
+
+def bench_startup(args):
+    """Time importing the API modules and fail when one is over its budget."""
+    budgets = {**STARTUP_BUDGETS, **args.budget}
+    failures = []
+    for module, budget in budgets.items():
+        runs = [import_times(module) for _ in range(args.repeat)]
+        totals = [next(us for name, _, us in run if name == module) / 1000 for run in runs]
+        median = statistics.median(totals)
+        run = runs[totals.index(min(totals))]
+        loaded = sorted({name.split(".")[0] for name, _, _ in run} & set(STARTUP_LAZY))
+        print(f"import {module}: median {median:.0f} ms over {len(runs)} runs, budget {budget} ms")
+        top = sorted(
+            (entry for entry in run if entry[1] == 1), key=lambda entry: entry[2], reverse=True
+        )
+        for name, _, us in top[:10]:
+            print(f"    {name:<36}{us / 1000:>10.1f} ms")
+        if median > budget:
+            failures.append(f"import {module} took {median:.0f} ms, over its {budget} ms budget")
+        if loaded:
+            failures.append(f"import {module} loaded {', '.join(loaded)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+def legacy_load_transactions(xml_file, database_url, batch_size=DEFAULT_BATCH_SIZE):
+    """load_data.load_transactions before it shared SMSProcessor's pass, minus the snapshot."""
+    engine = create_engine(database_url)
+
+    def record_batch(session, rows):
+        apply_rollups(session, rows)
+        bump_data_version(session, "transactions")
+
+    with Session(engine) as session:
+        fingerprints = set(session.scalars(select(Transaction.fingerprint)))
+        with BulkWriter(
+            session, Transaction, batch_size=batch_size, ignore_conflicts=True,
+            after_write=record_batch,
+        ) as writer:
+            for t in iter_transactions(xml_file):
+                t.fingerprint = fingerprint(
+                    *(getattr(t, c) for c in Transaction.FINGERPRINT_COLUMNS)
+                )
+                if t.fingerprint not in fingerprints:
+                    fingerprints.add(t.fingerprint)
+                    writer.add(t)
+    engine.dispose()
+
+
+def bench_unified(args):
+    """Both apps' tables from one pass, against the two pipelines run one after the other."""
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, "unprocessed_sms.log")
+        databases = iter(range(len(args.sizes) * 3 * args.repeat))
+
+        def new_database():
+            database = os.path.join(tmp, f"unified-{next(databases)}.db")
+            engine = create_engine(f"sqlite:///{database}")
+            prepare_database(engine, transactions=True)
+            return engine
+
+        def store(xml, engine, transactions):
+            with Session(engine) as db:
+                result = SMSProcessor(
+                    db=db, xml_file=xml, log_file=log_file, transactions=transactions
+                ).process_and_store_sms()
+            if "error" in result:
+                raise RuntimeError(result["error"])
+
+        def separate(xml, engines):
+            store(xml, engines[0], transactions=False)
+            legacy_load_transactions(xml, str(engines[1].url))
+
+        print(f"smsdata and transactions, median of {args.repeat} runs")
+        print(f"{'messages':>10}{'two pipelines s':>18}{'one pass s':>14}{'ratio':>8}")
+        for size in args.sizes:
+            xml = os.path.join(tmp, f"synthetic-{size}.xml")
+            generate(xml, size, duplicate_rate=0.01, seed=size)
+            two = statistics.median(timings(
+                lambda engines: separate(xml, engines),
+                args.repeat,
+                lambda: (new_database(), new_database()),
+            ))
+            one = statistics.median(timings(
+                lambda engine: store(xml, engine, True), args.repeat, new_database
+            ))
+            print(f"{size:>10,}{two:>18.2f}{one:>14.2f}{one / two:>8.0%}")
+
+
+BENCHMARKS = {
+    "amounts": bench_amounts,
+    "analytics": bench_analytics,
+    "classifier": bench_classifier,
+    "compare": bench_compare,
+    "parallel": bench_parallel,
+    "records": bench_records,
+    "search": bench_search,
+    "startup": bench_startup,
+    "suite": bench_suite,
+    "timestamps": bench_timestamps,
+    "unified": bench_unified,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--xml", default=DEFAULT_XML, help="SMS backup to read")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--factor", type=int, default=20, help="copies of --xml in enlarged archives"
+    )
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[1, 2, 4, 8],
+        help="comma-separated worker counts to compare",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[1000, 10000],
+        help="comma-separated archive sizes for the suite",
+    )
+    parser.add_argument(
+        "--ingest-repeat", type=int, default=3, help="runs of each suite ingest case"
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_results.json",
+        help="suite results, written by suite and read by compare",
+    )
+    parser.add_argument(
+        "--rows", type=int, default=1000000, help="synthetic rows for analytics and records"
+    )
+    parser.add_argument(
+        "--budget",
+        type=lambda value: {
+            module: int(ms) for module, ms in (item.split("=") for item in value.split(","))
+        },
+        default={},
+        help="startup budgets in ms, e.g. main=1200,app=1000",
+    )
+    parser.add_argument("--baseline", help="earlier suite results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="slowdown of the median flagged as a regression (default: 0.2 = 20%%)",
+    )
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
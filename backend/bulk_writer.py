@@ -0,0 +1,128 @@
+import logging
+
+from sqlalchemy import insert
+
+from utils import lazy_import
+
+# Loaded when the first batch is written; the API never needs them
+postgresql = lazy_import("sqlalchemy.dialects.postgresql")
+sqlite = lazy_import("sqlalchemy.dialects.sqlite")
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def insert_ignoring_conflicts(table, dialect_name):
+    """INSERT that silently drops rows violating a unique constraint."""
+    if dialect_name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect_name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect_name in ("mysql", "mariadb"):
+        return insert(table).prefix_with("IGNORE")
+    return insert(table)
+
+
+class BulkWriter:
+    """Buffer rows for a table and insert them in batches.
+
+    Each batch is written with a single executemany INSERT inside one
+    transaction. If a batch fails it is rolled back and retried row by row,
+    so only the offending rows are skipped and logged.
+
+    With ignore_conflicts, rows that collide with a unique index (such as a
+    content fingerprint) are dropped by the database instead of failing the
+    batch, which makes the insert a backstop for in-memory deduplication.
+
+    after_write(session, rows) is called with the rows actually inserted,
+    inside the same transaction, so derived tables stay consistent with them.
+
+    Rows are dicts of column values or records (see records.py); records
+    are turned into dicts only for the INSERT of their batch.
+    """
+
+    def __init__(
+        self,
+        session,
+        model,
+        batch_size=DEFAULT_BATCH_SIZE,
+        ignore_conflicts=False,
+        after_write=None,
+    ):
+        self.session = session
+        self.after_write = after_write
+        self.table = model.__table__
+        self.batch_size = batch_size
+        if ignore_conflicts:
+            dialect_name = session.get_bind().dialect.name
+            self.statement = insert_ignoring_conflicts(self.table, dialect_name)
+        else:
+            self.statement = insert(self.table)
+        self.pending = []
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def full(self):
+        return len(self.pending) >= self.batch_size
+
+    def add(self, row):
+        """Queue a row (a dict or record), flushing a full batch first."""
+        if self.full:
+            self.flush()
+        self.pending.append(row)
+
+    def flush(self):
+        """Write the pending batch and return the number of rows stored."""
+        if not self.pending:
+            return 0
+        rows, self.pending = self.pending, []
+        try:
+            written = self._execute(rows)
+            if self.after_write and written != len(rows):
+                # Some rows were dropped as conflicts and there is no telling
+                # which, so redo the batch row by row
+                self.session.rollback()
+                written = self._insert_rows(rows)
+            else:
+                if self.after_write:
+                    self.after_write(self.session, rows)
+                self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            logging.warning(
+                f"Batch insert of {len(rows)} rows into {self.table.name} failed, "
+                f"retrying row by row. Error: {e}"
+            )
+            written = self._insert_rows(rows)
+        self.written += written
+        return written
+
+    def _execute(self, rows):
+        values = [row if isinstance(row, dict) else row.as_dict() for row in rows]
+        result = self.session.execute(self.statement, values)
+        # Rows dropped by ON CONFLICT DO NOTHING are not counted as written
+        return result.rowcount if result.rowcount >= 0 else len(rows)
+
+    def _insert_rows(self, rows):
+        written = 0
+        for row in rows:
+            try:
+                inserted = self._execute([row])
+                if inserted and self.after_write:
+                    self.after_write(self.session, [row])
+                self.session.commit()
+                written += inserted
+            except Exception as e:
+                self.session.rollback()
+                self.failed += 1
+                logging.error(f"Error inserting row into {self.table.name}: {e}")
+        return written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.pending = []
@@ -0,0 +1,46 @@
+import json
+import os
+
+RULES_FILE = os.getenv(
+    "CLASSIFICATION_RULES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "classification_rules.json"),
+)
+
+
+class MessageClassifier:
+    """Table-driven classifier mapping an SMS body to (message_type, category).
+
+    Rules are checked in order and the first rule with a keyword in the
+    message wins, exactly like the if/elif chain it replaces. The message is
+    lowercased once and the keywords are flattened into a single ordered
+    list, so adding a rule only means adding a row to the rule table.
+    """
+
+    def __init__(self, rules, default):
+        self.default = (default["message_type"], default["category"])
+        self.keywords = [
+            (keyword.lower(), (rule["message_type"], rule["category"]))
+            for rule in rules
+            for keyword in rule["keywords"]
+        ]
+
+    @classmethod
+    def from_file(cls, path=RULES_FILE):
+        with open(path, encoding="utf-8") as f:
+            table = json.load(f)
+        return cls(table["rules"], table["default"])
+
+    def classify(self, message):
+        """Return the (message_type, category) of the first matching rule."""
+        message = message.lower()
+        for keyword, result in self.keywords:
+            if keyword in message:
+                return result
+        return self.default
+
+
+default_classifier = MessageClassifier.from_file()
+
+
+def classify(message):
+    return default_classifier.classify(message)
@@ -7,4 +7,7 @@ load_dotenv()
 class Config:
     SQLALCHEMY_DATABASE_URI = f"{os.getenv('DATABASE_URL')}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    LOG_FILE = os.getenv('LOG_FILE')
\ No newline at end of file
+    LOG_FILE = os.getenv('LOG_FILE')
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 500))
+    # Where load_data writes the Parquet/Arrow snapshot analytics reads
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
\ No newline at end of file
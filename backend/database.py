@@ -0,0 +1,117 @@
+"""Engines, connection pools and request-scoped sessions for the FastAPI app.
+
+Request handlers read through the async engine so they never block the
+event loop; ingestion, exports and migrations use the sync engine from
+worker threads. Both point at the same database and share the settings,
+which are read from the environment (or .env) with the SMS_DB_ prefix,
+e.g. SMS_DB_URL, SMS_DB_POOL_SIZE or SMS_DB_ECHO=true.
+"""
+from functools import cache
+from typing import Annotated
+
+from fastapi import Depends
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from metrics import instrument_engine
+
+# Async DBAPI driver used for each backend
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+
+
+class DatabaseSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="SMS_DB_", env_file=".env", extra="ignore"
+    )
+
+    url: str = "sqlite:///./momo_dashboard.db"
+    # Connections kept open, extra ones allowed under load, and how long a
+    # request waits for a free connection before failing
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    # How long SQLite waits on a locked database before raising, in ms
+    busy_timeout_ms: int = 5000
+    # Log every SQL statement; for debugging only
+    echo: bool = False
+
+
+def enable_sqlite_wal(engine, busy_timeout_ms):
+    """Use WAL so readers are not blocked by a writer, and wait on locks."""
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.close()
+
+
+def engine_options(settings: DatabaseSettings, url):
+    options = {"echo": settings.echo}
+    if url.get_backend_name() == "sqlite":
+        # Pooled connections move between the threads serving requests
+        options["connect_args"] = {"check_same_thread": False}
+    if url.database not in (None, "", ":memory:"):
+        options.update(
+            pool_size=settings.pool_size,
+            max_overflow=settings.max_overflow,
+            pool_timeout=settings.pool_timeout,
+            pool_pre_ping=url.get_backend_name() != "sqlite",
+        )
+    return options
+
+
+def make_engine(settings: DatabaseSettings):
+    url = make_url(settings.url)
+    engine = create_engine(url, **engine_options(settings, url))
+    if url.get_backend_name() == "sqlite":
+        enable_sqlite_wal(engine, settings.busy_timeout_ms)
+    return engine
+
+
+def make_async_engine(settings: DatabaseSettings):
+    url = make_url(settings.url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(
+            f"SMS_DB_URL: no async driver for {backend} databases, "
+            f"use one of {', '.join(ASYNC_DRIVERS)}"
+        )
+    async_url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    engine = create_async_engine(async_url, **engine_options(settings, url))
+    if backend == "sqlite":
+        enable_sqlite_wal(engine.sync_engine, settings.busy_timeout_ms)
+    return engine
+
+
+settings = DatabaseSettings()
+
+
+# The engines are created on first use rather than at import, so importing
+# the app does not load the database drivers or open a pool
+@cache
+def get_engine():
+    engine = make_engine(settings)
+    instrument_engine(engine)
+    return engine
+
+
+@cache
+def get_async_engine():
+    engine = make_async_engine(settings)
+    instrument_engine(engine.sync_engine)
+    return engine
+
+
+async def get_async_session():
+    """One session per request, returned to the pool when the request ends."""
+    async with AsyncSession(get_async_engine()) as session:
+        yield session
+
+
+async_database = Annotated[AsyncSession, Depends(get_async_session)]
@@ -1,12 +1,21 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from models import Base
+from models import Base, Transaction, TransactionRollup
 from config import Config
+from migrations import upgrade
+from response_cache import create_data_versions
+from rollups import ensure_rollups
 
-def init_db():
-    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+def init_db(engine=None):
+    """Create or upgrade the transactions tables and return a sessionmaker for them"""
+    engine = engine or create_engine(Config.SQLALCHEMY_DATABASE_URI)
     Base.metadata.create_all(engine)
-    return sessionmaker(bind=engine)
+    upgrade(engine, [Transaction, TransactionRollup])
+    create_data_versions(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        ensure_rollups(session)
+    return Session
 
 if __name__ == '__main__':
     init_db()
\ No newline at end of file
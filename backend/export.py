@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+
+EXPORT_CHUNK_ROWS = 500
+YIELD_PER = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def iter_export(rows, columns, to_dict, fmt):
+    """Serialise rows lazily as NDJSON or CSV, yielding text chunks.
+
+    rows is expected to be a streamed result (yield_per), so only one chunk
+    of rows is held in memory at a time whatever the size of the export.
+    """
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+        # Send the header straight away so the first byte is not held back
+        yield _drain(buffer)
+
+    pending = 0
+    # NDJSON has no header, so its first row is sent on its own instead
+    started = writer is not None
+    for row in rows:
+        record = to_dict(row)
+        if writer:
+            writer.writerow(record)
+        else:
+            buffer.write(json.dumps(record, default=str))
+            buffer.write("\n")
+        pending += 1
+        if pending >= EXPORT_CHUNK_ROWS or not started:
+            yield _drain(buffer)
+            pending = 0
+            started = True
+    if pending:
+        yield _drain(buffer)
+
+
+def _drain(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
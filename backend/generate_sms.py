@@ -0,0 +1,297 @@
+"""Generate synthetic MoMo SMS backups for scale testing.
+
+Writes XML in the same <smses>/<sms> attribute schema as the phone backup
+(modified_sms_v2.xml), one message at a time, so 10M-message archives can
+be produced without holding them in memory::
+
+    python generate_sms.py --count 1000000 --output sms_1m.xml
+    python generate_sms.py --count 10000 --duplicate-rate 0.05 --unknown-rate 0.01
+
+The mix of message kinds follows the real backup. Amounts, fees and a
+running balance are simulated, and messages arrive at random intervals
+spread over --span-days.
+"""
+import argparse
+import itertools
+import random
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from xml.sax.saxutils import quoteattr
+
+DEFAULT_COUNT = 10_000
+# Share of messages that repeat an earlier one, as backups often do
+DEFAULT_DUPLICATE_RATE = 0.01
+
+# Share of each kind of message, from the classified real backup. The real
+# Airtime and Cash Power messages say "Your payment of" and classify as
+# payments; these are worded so that they reach their own rules instead.
+MESSAGE_MIX = {
+    "payment": 0.4185,
+    "transfer": 0.3495,
+    "bank_deposit": 0.1467,
+    "incoming": 0.0373,
+    "third_party": 0.0201,
+    "bundle": 0.0124,
+    "airtime": 0.0089,
+    "cash_power": 0.0065,
+    "agent_withdrawal": 0.0018,
+    "failed": 0.0018,
+    "reversal": 0.0012,
+}
+
+NAMES = [
+    "Jane Smith", "Samuel Carter", "Linda Green", "Alex Doe", "Robert Brown",
+    "Emily Johnson", "Michael Davis", "Sophia Wilson", "David Miller", "Grace Uwase",
+]
+COMPANIES = [
+    "ESICIA LTD KPAY", "INFORMATION TECHNOLOGY  ENGINEERING CONSTRUCTION   ITEC Ltd",
+    "Future Dynamic  Innovations ltd", "DIRECT PAY LTD", "Data Bundle MTN",
+]
+AGENTS = ["Agent Sophia", "Agent John", "Agent Grace", "Agent Eric"]
+PHONES = ["250791666666", "250790777777", "250788999999", "250795963036", "250788658286"]
+BUNDLES = [
+    ("2000Rwf(1GB)/30days", 2000), ("2,000FRW(2GB)", 2000), ("500FRW(300MB)", 500),
+    ("1,000FRW(2200MB)", 1000), ("5000Rwf(10GB)/30days", 5000),
+]
+UNKNOWN_TEMPLATES = [
+    "<#> Dear Customer, your MTN MoMo application one-time password is :{otp}."
+    "MTN MoMo does not recommend that you share or expose your one-time password "
+    "with anyone. Be Vigilant. RdbS6eMOXvx N/RywfrtIZL>.",
+    "Y'ello! Dial *182# to check your MoMo account. Code {otp}.",
+]
+SERVICE_CENTERS = ["+250788110383", "+250788110381"]
+ACCOUNT = "36521838"
+
+# Recently written messages, the pool duplicates are drawn from
+DUPLICATE_WINDOW = 1000
+
+
+def rwf(amount):
+    return f"{amount:,}"
+
+
+def transfer_fee(amount):
+    if amount <= 1000:
+        return 20
+    if amount <= 10000:
+        return 100
+    return 250
+
+
+class MessageFactory:
+    """Builds message bodies and keeps the account balance consistent."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.balance = rng.randrange(5_000, 50_000, 10)
+
+    def amount(self, low=100, high=50_000):
+        # Log-uniform, rounded like real payments: mostly small amounts
+        value = int(low * (high / low) ** self.rng.random())
+        step = 100 if value < 10_000 else 1000
+        return max(step, value // step * step)
+
+    def txid(self):
+        return self.rng.randrange(10**10, 10**11)
+
+    def spend(self, amount, fee=0):
+        self.balance = max(0, self.balance - amount - fee)
+
+    def body(self, kind, at):
+        rng = self.rng
+        stamp = at.strftime("%Y-%m-%d %H:%M:%S")
+        if kind == "incoming":
+            amount = self.amount()
+            self.balance += amount
+            return (
+                f"You have received {amount} RWF from {rng.choice(NAMES)} "
+                f"(*********{rng.randrange(1000):03d}) on your mobile money account at "
+                f"{stamp}. Message from sender: . Your new balance:{self.balance} RWF. "
+                f"Financial Transaction Id: {self.txid()}."
+            )
+        if kind == "bank_deposit":
+            amount = self.amount(1000, 100_000)
+            self.balance += amount
+            return (
+                f"*113*R*A bank deposit of {amount} RWF has been added to your mobile "
+                f"money account at {stamp}. Your NEW BALANCE :{self.balance} RWF. "
+                f"Cash Deposit::CASH::::0::{PHONES[3]}.Thank you for using MTN MobileMoney.*EN#"
+            )
+        if kind == "payment":
+            amount = self.amount(100, 20_000)
+            self.spend(amount)
+            return (
+                f"TxId: {self.txid()}. Your payment of {rwf(amount)} RWF to "
+                f"{rng.choice(NAMES)} {rng.randrange(10000, 99999)} has been completed at "
+                f"{stamp}. Your new balance: {rwf(self.balance)} RWF. Fee was 0 RWF."
+                f"Kanda*182*16# wiyandikishe muri poromosiyo ya BivaMoMotima, ugire "
+                f"amahirwe yo gutsindira ibihembo bishimishije."
+            )
+        if kind in ("airtime", "cash_power"):
+            amount = self.amount(500, 10_000)
+            self.spend(amount)
+            if kind == "airtime":
+                target, token = "Airtime", ""
+            else:
+                target = "MTN Cash Power"
+                token = "-".join(f"{rng.randrange(100000):05d}" for _ in range(4))
+            return (
+                f"*162*TxId:{self.txid()}*S*{amount} RWF paid to {target} with token "
+                f"{token} at {stamp}. Fee was 0 RWF. Your new balance: {self.balance} RWF "
+                f". Message: - -. *EN#"
+            )
+        if kind == "transfer":
+            amount = self.amount(500, 50_000)
+            fee = transfer_fee(amount)
+            self.spend(amount, fee)
+            return (
+                f"*165*S*{amount} RWF transferred to {rng.choice(NAMES)} "
+                f"({rng.choice(PHONES)}) from {ACCOUNT} at {stamp} . Fee was: {fee} RWF. "
+                f"New balance: {self.balance} RWF. Kugura ama inite cg interineti kuri "
+                f"MoMo, Kanda *182*2*1# .*EN#"
+            )
+        if kind == "third_party":
+            amount = self.amount(500, 20_000)
+            self.spend(amount)
+            return (
+                f"*164*S*Y'ello,A transaction of {amount} RWF by {rng.choice(COMPANIES)} "
+                f"on your MOMO account was successfully completed at {stamp}. Message "
+                f"from debit receiver: {rng.randrange(10**6)}. Your new balance:"
+                f"{self.balance} RWF. Fee was 0 RWF. Financial Transaction Id: "
+                f"{self.txid()}. External Transaction Id: {rng.randrange(16**8):08x}."
+            )
+        if kind == "agent_withdrawal":
+            amount = self.amount(5000, 100_000)
+            fee = max(100, amount // 45)
+            self.spend(amount, fee)
+            return (
+                f"You Abebe Chala CHEBUDIE (*********036) have via agent: "
+                f"{rng.choice(AGENTS)} ({rng.choice(PHONES)}), withdrawn {amount} RWF from "
+                f"your mobile money account: {ACCOUNT} at {stamp} and you can now "
+                f"collect your money in cash. Your new balance: {self.balance} RWF. Fee "
+                f"paid: {fee} RWF. Message from agent: 1. Financial Transaction Id: "
+                f"{self.txid()}."
+            )
+        if kind == "bundle":
+            label, amount = rng.choice(BUNDLES)
+            self.spend(amount)
+            return f"Yello!Umaze kugura {label} igura {rwf(amount)} RWF"
+        if kind == "failed":
+            return (
+                f"*143*R*Y'ello, the transaction with amount {self.amount()} RWF for "
+                f"{rng.choice(COMPANIES)} with message: {rng.randrange(10**12)} failed at "
+                f"{stamp} .Please Contact MobileMoney HelpLine for Assistance.Thank you "
+                f"for using MTN MobileMoney.*EN#"
+            )
+        if kind == "reversal":
+            amount = self.amount(500, 10_000)
+            self.balance += amount
+            return (
+                f"*143*S*Your transaction to {rng.choice(NAMES)} ({rng.choice(PHONES)}) "
+                f"with {amount} RWF has been reversed at {stamp}. Your new balance is "
+                f"{self.balance} RWF. .Thank you for using MTN MobileMoney.*EN#"
+            )
+        raise ValueError(f"Unknown message kind: {kind}")
+
+    def unknown(self):
+        return self.rng.choice(UNKNOWN_TEMPLATES).format(otp=f"{self.rng.randrange(10000):04d}")
+
+
+def sms_line(body, received, sent, service_center):
+    """One <sms> element with the attributes of the real backup, in its order."""
+    readable = received.strftime("%d %b %Y %I:%M:%S %p").lstrip("0").replace(" 0", " ")
+    attributes = [
+        ("protocol", "0"), ("address", "M-Money"),
+        ("date", str(int(received.timestamp() * 1000))), ("type", "1"),
+        ("subject", "null"), ("body", body), ("toa", "null"), ("sc_toa", "null"),
+        ("service_center", service_center), ("read", "1"), ("status", "-1"),
+        ("locked", "0"), ("date_sent", str(int(sent.timestamp()) * 1000)),
+        ("sub_id", "6"), ("readable_date", readable), ("contact_name", "(Unknown)"),
+    ]
+    return "  <sms " + " ".join(f"{k}={quoteattr(v)}" for k, v in attributes) + " />\n"
+
+
+def generate(
+    path,
+    count=DEFAULT_COUNT,
+    duplicate_rate=DEFAULT_DUPLICATE_RATE,
+    unknown_rate=0.005,
+    span_days=365,
+    start=datetime(2024, 1, 1),
+    seed=None,
+):
+    """Stream count synthetic messages to path; returns how many of each kind."""
+    rng = random.Random(seed)
+    factory = MessageFactory(rng)
+    kinds = list(MESSAGE_MIX)
+    cum_weights = list(itertools.accumulate(MESSAGE_MIX.values()))
+    # Mean gap between messages that spreads them over span_days
+    mean_gap = span_days * 86400 / max(count, 1)
+    received = start
+    recent = deque(maxlen=DUPLICATE_WINDOW)
+    counts = dict.fromkeys(kinds + ["unknown", "duplicate"], 0)
+
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as out:
+        out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        out.write(
+            f'<smses count="{count}" backup_set="synthetic" '
+            f'backup_date="{int(time.time() * 1000)}" type="full">\n'
+        )
+        for _ in range(count):
+            if recent and rng.random() < duplicate_rate:
+                # Backups often contain the same SMS twice
+                out.write(rng.choice(recent))
+                counts["duplicate"] += 1
+                continue
+            received += timedelta(
+                seconds=rng.expovariate(1 / mean_gap), microseconds=rng.randrange(1000) * 1000
+            )
+            sent = received - timedelta(seconds=rng.uniform(5, 10))
+            if rng.random() < unknown_rate:
+                kind, body = "unknown", factory.unknown()
+            else:
+                kind = rng.choices(kinds, cum_weights=cum_weights)[0]
+                body = factory.body(kind, sent)
+            line = sms_line(body, received, sent, rng.choice(SERVICE_CENTERS))
+            out.write(line)
+            recent.append(line)
+            counts[kind] += 1
+        out.write("</smses>\n")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help="messages to write")
+    parser.add_argument("--output", default="synthetic_sms.xml")
+    parser.add_argument(
+        "--duplicate-rate", type=float, default=DEFAULT_DUPLICATE_RATE,
+        help=f"share of messages that repeat an earlier one (default: {DEFAULT_DUPLICATE_RATE})",
+    )
+    parser.add_argument(
+        "--unknown-rate", type=float, default=0.005,
+        help="share of messages no rule classifies (default: 0.005)",
+    )
+    parser.add_argument("--span-days", type=float, default=365)
+    parser.add_argument(
+        "--start", type=datetime.fromisoformat, default=datetime(2024, 1, 1),
+        help="date of the first message (ISO format)",
+    )
+    parser.add_argument("--seed", type=int, help="seed for reproducible archives")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate(
+        args.output, args.count, args.duplicate_rate, args.unknown_rate,
+        args.span_days, args.start, args.seed,
+    )
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {args.count:,} messages to {args.output} in {elapsed:.1f}s", file=sys.stderr)
+    for kind, n in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"  {kind:<18}{n:>12,}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
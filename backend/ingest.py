@@ -0,0 +1,81 @@
+"""Ingest an SMS backup into the smsdata table from the command line.
+
+    python ingest.py --xml modified_sms_v2.xml --workers 4
+    python ingest.py --xml modified_sms_v2.xml --profile ingest.prof
+    python ingest.py --xml modified_sms_v2.xml --transactions
+
+With --transactions the same pass also fills the transactions table the
+Flask app reads, so point DATABASE_URL and SMS_DB_URL at the database
+given here and the backup is loaded once for both apps. --transactions
+--no-sms writes the transactions table alone, as load_data.py does.
+
+Prints the ingest result as JSON, and the time spent in each stage to stderr.
+"""
+import argparse
+import json
+import sys
+
+from sqlmodel import Session
+
+from bulk_writer import DEFAULT_BATCH_SIZE
+from config import Config
+from database import make_engine, settings
+from profiling import PROFILERS, StageProfiler
+from sms_data import prepare_database
+from sms_processing import SMSProcessor
+from snapshot import write_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest an SMS backup XML file.")
+    parser.add_argument("--xml", default=SMSProcessor.DEFAULT_XML, help="SMS backup to load")
+    parser.add_argument("--database-url", default=settings.url)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes used to parse and classify messages (default: 1)",
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--profile", metavar="PATH", help="write a profile of the run here")
+    parser.add_argument("--profiler", choices=PROFILERS, default="cprofile")
+    parser.add_argument(
+        "--transactions",
+        action="store_true",
+        help="also write the transactions table of the Flask app in the same pass",
+    )
+    parser.add_argument(
+        "--no-sms",
+        dest="sms",
+        action="store_false",
+        help="with --transactions, write only the transactions table",
+    )
+    args = parser.parse_args()
+
+    # Same pragmas as the API (WAL), so it can keep serving reads meanwhile
+    engine = make_engine(settings.model_copy(update={"url": args.database_url}))
+    if not (args.sms or args.transactions):
+        parser.error("--no-sms needs --transactions")
+    prepare_database(engine, transactions=args.transactions, sms=args.sms)
+    with Session(engine) as db:
+        processor = SMSProcessor(
+            db=db,
+            xml_file=args.xml,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            profile=args.profile,
+            profiler=args.profiler,
+            transactions=args.transactions,
+            sms=args.sms,
+        )
+        result = processor.process_and_store_sms()
+    print(json.dumps(result, indent=2))
+    if result.get("stages"):
+        print(StageProfiler.format_summary(result["stages"]), file=sys.stderr)
+    if result.get("transactions"):
+        # As load_data does, so /summary?mode=snapshot sees the new rows
+        write_snapshot(engine, Config.SNAPSHOT_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Background ingestion jobs for the FastAPI app.
+
+POST /ingest queues a job and returns straight away; a single worker
+thread per database runs the jobs one after another, so two ingests never
+write to the same database at once. The queue is bounded: when it is full
+submit() raises QueueFull and the API answers 429 instead of piling up
+work. Jobs live in memory; the ingestion checkpoints in the database are
+what survive a restart. Shutting down cancels the queued jobs and waits
+for the running one.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlmodel import Session
+
+from bulk_writer import DEFAULT_BATCH_SIZE
+from config import Config
+from sms_data import IngestionState
+from utils import lazy_import
+
+# The ingestion stack is loaded by the first job, not by importing the API
+sms_processing = lazy_import("sms_processing")
+snapshot = lazy_import("snapshot")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+DEFAULT_QUEUE_SIZE = 8
+# Finished jobs kept around for GET /ingest/{job_id}
+JOB_HISTORY = 100
+
+QueueFull = queue.Full
+
+
+class IngestSettings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_prefix="SMS_INGEST_", env_file=".env", extra="ignore"
+    )
+
+    # Jobs waiting behind the running one before POST /ingest answers 429
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    # ?path= must point inside this directory
+    root: str = "."
+    # Where uploaded backups are kept until their job has run
+    upload_dir: Optional[str] = None
+    workers: int = 1
+    batch_size: int = DEFAULT_BATCH_SIZE
+    # Also fill the Flask app's transactions table in the same pass, for
+    # deployments where both apps share this database
+    transactions: bool = False
+
+    def resolve(self, path):
+        """Absolute path of a backup under root, or None if it is outside or missing."""
+        root = os.path.realpath(self.root)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root or not os.path.isfile(resolved):
+            return None
+        return resolved
+
+
+@dataclass
+class IngestJob:
+    xml_file: str
+    # Uploaded files and their checkpoints are deleted once the job has
+    # finished or been cancelled
+    remove_file: bool = False
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: datetime = field(default_factory=datetime.now)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    total_bytes: int = 0
+    bytes_done: int = 0
+    # (offset, time) of the first progress report, the baseline for the ETA
+    baseline: Optional[tuple] = None
+    records: int = 0
+    processed: int = 0
+    skipped: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    def update(self, offset, records, processed, skipped):
+        """Progress callback for SMSProcessor.process_and_store_sms."""
+        if self.baseline is None:
+            self.baseline = (offset, time.monotonic())
+        self.bytes_done = offset
+        self.records = records
+        self.processed = processed
+        self.skipped = skipped
+
+    def to_dict(self):
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started else 0
+        progress = self.bytes_done / self.total_bytes if self.total_bytes else 0
+        if self.status == DONE:
+            progress = 1.0
+        eta = None
+        if self.status == RUNNING and self.baseline:
+            read = self.bytes_done - self.baseline[0]
+            since = time.monotonic() - self.baseline[1]
+            if read > 0 and since > 0:
+                eta = round((self.total_bytes - self.bytes_done) * since / read, 1)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "xml_file": self.xml_file,
+            "created_at": self.created_at.isoformat(),
+            "progress": round(progress, 4),
+            "records": self.records,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_sec": round(self.records / elapsed, 1) if elapsed else 0.0,
+            "eta_seconds": eta,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IngestQueue:
+    """Bounded FIFO of ingestion jobs drained by one worker thread."""
+
+    def __init__(self, engine, maxsize=DEFAULT_QUEUE_SIZE, processor_options=None):
+        self.engine = engine
+        self.processor_options = processor_options or {}
+        self.jobs = {}
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, xml_file, remove_file=False):
+        """Queue xml_file for ingestion. Raises QueueFull when the queue is full."""
+        job = IngestJob(xml_file=xml_file, remove_file=remove_file)
+        with self._lock:
+            self._queue.put_nowait(job)
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._work, name="ingest-worker", daemon=True
+                )
+                self._worker.start()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def shutdown(self, timeout=None):
+        """Cancel the queued jobs, let the worker finish the job in hand, then stop it."""
+        with self._lock:
+            worker = self._worker
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._queue.task_done()
+                if job is not None:
+                    job.status, job.finished = CANCELLED, time.monotonic()
+                    self._remove_upload(job)
+            if worker is not None and worker.is_alive():
+                # The queue was just emptied, so there is room
+                self._queue.put_nowait(None)
+        if worker is not None:
+            worker.join(timeout)
+
+    def _forget_old_jobs(self):
+        finished = [
+            job for job in self.jobs.values() if job.status in (DONE, FAILED, CANCELLED)
+        ]
+        for job in finished[: max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[job.id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _write_snapshot(self):
+        try:
+            snapshot.write_snapshot(self.engine, Config.SNAPSHOT_DIR)
+        except Exception as e:
+            # Analytics keep using the previous snapshot
+            logging.error(f"Error writing analytics snapshot: {e}")
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.started = time.monotonic()
+        try:
+            job.total_bytes = os.path.getsize(job.xml_file)
+            with Session(self.engine) as db:
+                processor = sms_processing.SMSProcessor(
+                    db=db, xml_file=job.xml_file, **self.processor_options
+                )
+                result = processor.process_and_store_sms(progress=job.update)
+            job.result = result
+            if "error" in result:
+                job.status, job.error = FAILED, result["error"]
+            else:
+                job.status = DONE
+            if result.get("transactions"):
+                self._write_snapshot()
+        except Exception as e:
+            logging.error(f"Ingestion job {job.id} failed: {e}")
+            job.status, job.error = FAILED, str(e)
+        finally:
+            self._remove_upload(job)
+            job.finished = time.monotonic()
+
+    def _remove_upload(self, job):
+        """Delete an uploaded backup and its checkpoint, which nothing can resume."""
+        if not job.remove_file:
+            return
+        try:
+            if os.path.exists(job.xml_file):
+                os.remove(job.xml_file)
+            with Session(self.engine) as db:
+                state = db.get(IngestionState, os.path.abspath(job.xml_file))
+                if state is not None:
+                    db.delete(state)
+                    db.commit()
+        except Exception as e:
+            logging.error(f"Error removing upload {job.xml_file}: {e}")
@@ -1,11 +1,19 @@
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
-from models import Transaction
+from sqlmodel import Session
 from config import Config
-from parse_xml import parse_sms_xml
+from sms_data import prepare_database
+from sms_processing import SMSProcessor
+from snapshot import write_snapshot
 import logging
 
-def load_transactions(xml_file):
+def load_transactions(xml_file, batch_size=Config.INGEST_BATCH_SIZE, workers=1, sms=False):
+    """Load an SMS backup into the transactions table.
+
+    Runs SMSProcessor's pass, the same parsing and classification as the
+    FastAPI ingest. With sms=True smsdata is filled too, as by
+    `python ingest.py --transactions`: every batch of smsdata rows is
+    written in one transaction with its transactions rows and their rollups.
+    """
     logging.basicConfig(
         filename=Config.LOG_FILE,
         level=logging.INFO,
@@ -13,33 +21,31 @@ def load_transactions(xml_file):
     )
 
     engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    transactions = parse_sms_xml(xml_file)
     try:
-        for t in transactions:
-            exists = session.query(Transaction).filter_by(
-                message=t['message'],
-                date=t['date']
-            ).first()
-            if not exists:
-                transaction = Transaction(
-                    message=t['message'],
-                    sender=t['sender'],
-                    receiver=t['receiver'],
-                    amount=t['amount'],
-                    date=t['date'],
-                    transaction_type=t['transaction_type']
-                )
-                session.add(transaction)
-        session.commit()
-        logging.info(f"Loaded {len(transactions)} transactions into database")
+        prepare_database(engine, transactions=True, sms=sms)
+        with Session(engine) as session:
+            result = SMSProcessor(
+                db=session, xml_file=xml_file, batch_size=batch_size, workers=workers,
+                transactions=True, sms=sms
+            ).process_and_store_sms()
+        if 'error' in result:
+            logging.error(f"Error loading transactions: {result['error']}")
+            return result
+        logging.info(
+            f"Loaded {result.get('transactions', 0)} transactions "
+            f"into database ({result.get('records_per_sec')} records/sec, "
+            f"peak RSS {result.get('peak_rss_mb')} MB)"
+        )
+        try:
+            write_snapshot(engine, Config.SNAPSHOT_DIR)
+        except Exception as e:
+            # Analytics keep using the previous snapshot
+            logging.error(f"Error writing analytics snapshot: {str(e)}")
+        return result
     except Exception as e:
-        session.rollback()
         logging.error(f"Error loading transactions: {str(e)}")
     finally:
-        session.close()
+        engine.dispose()
 
 if __name__ == '__main__':
-    load_transactions('modified_sms_v2.xml')
\ No newline at end of file
+    load_transactions('modified_sms_v2.xml')
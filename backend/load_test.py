@@ -0,0 +1,140 @@
+"""Load-test /sms with concurrent clients and report throughput and latency.
+
+Starts the FastAPI app under uvicorn (or targets --url) and runs each client
+count for --duration seconds::
+
+    python load_test.py --clients 1,8,32 --duration 10
+
+The response cache is disabled in the started server so every request
+reaches the database; pass --cached to measure cache hits instead. With
+--ingest, ingest.py loads the given backup into the same database at the
+start of every run, to see how reads hold up against a concurrent writer.
+"""
+import argparse
+import itertools
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from database import settings
+
+# Query strings cycled through by the clients
+QUERIES = [
+    {"limit": 50},
+    {"type": "Incoming Money", "limit": 50},
+    {"type": "Payments to Code Holders", "limit": 20},
+    {"amount": 2000, "limit": 20},
+    {"search": "airtime", "limit": 20},
+    {"search": "jane", "mode": "search", "limit": 20},
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url, cached):
+    port = free_port()
+    env = {**os.environ, "SMS_DB_URL": database_url}
+    if not cached:
+        env["RESPONSE_CACHE_SIZE"] = "0"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/cache", timeout=1)
+            return server, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start")
+
+
+def client(url, deadline, latencies, errors):
+    queries = itertools.cycle(QUERIES)
+    with httpx.Client(base_url=url, timeout=30) as http:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = http.get("/sms", params=next(queries))
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                errors.append(1)
+
+
+def start_ingest(xml_file, database_url):
+    return subprocess.Popen(
+        [sys.executable, "ingest.py", "--xml", xml_file, "--database-url", database_url],
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def run(url, clients, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(url, deadline, latencies, errors))
+        for _ in range(clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    median = statistics.median(latencies) if latencies else 0
+    print(
+        f"{clients:>8}{len(latencies):>10}{len(latencies) / elapsed:>12,.1f}"
+        f"{median * 1000:>10.1f}{p95 * 1000:>10.1f}{len(errors):>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="load-test a running server instead")
+    parser.add_argument("--database-url", default=settings.url)
+    parser.add_argument(
+        "--clients",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[1, 8, 32],
+        help="comma-separated client counts to run",
+    )
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--cached", action="store_true", help="keep the response cache on")
+    parser.add_argument("--ingest", metavar="XML", help="ingest this backup during each run")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_server(args.database_url, args.cached)
+    try:
+        print(f"{'clients':>8}{'requests':>10}{'req/sec':>12}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for clients in args.clients:
+            ingest = args.ingest and start_ingest(args.ingest, args.database_url)
+            run(url, clients, args.duration)
+            if ingest:
+                ingest.wait()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
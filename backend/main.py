@@ -1,58 +1,73 @@
 import logging
+import os
+import tempfile
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from datetime import datetime
-from functools import lru_cache
-from typing import Annotated, Optional
+from functools import cache
+from typing import Optional
 
-from fastapi import Depends, FastAPI
-from pydantic_settings import BaseSettings, SettingsConfigDict
-from sqlmodel import Session, SQLModel, create_engine
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
-from sqlalchemy import inspect
+from starlette.routing import Match
 
-from sms_processing import SmsData, SMSProcessor, get_all_sms
-
-log_file = "unprocessed_sms.log"
-# Looger configuration
-logging.basicConfig(
-    filename=log_file,
-    level=logging.WARNING,
-    format="%(asctime)s - %(levelname)s - %(message)s",
+from database import async_database, get_engine
+from export import MEDIA_TYPES, YIELD_PER, iter_export
+from jobs import IngestQueue, IngestSettings, QueueFull
+from metrics import CONTENT_TYPE, metrics, start_request
+from pagination import clamp_page_size, decode_cursor, keyset_order
+from response_cache import (
+    cache_key,
+    etag_matches,
+    read_data_version,
+    response_cache,
+)
+from search import has_search_index, search_sms_async
+from sms_data import (
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_XML,
+    SmsData,
+    count_sms_async,
+    get_all_sms_async,
+    get_sms_filters,
+    paginate_sms_async,
+    prepare_database,
 )
 
+# Logging to unprocessed_sms.log is configured by sms_data
 
-DATABASE_URL = "sqlite:///./momo_dashboard.db?check_same_thread=False"
-
-engine = create_engine(DATABASE_URL, echo=True, connect_args={"check_same_thread": False})
+# Seconds shutdown waits for a running ingest before leaving it behind
+SHUTDOWN_TIMEOUT = 30
 
-@lru_cache()
-def get_session():
-    return Session(engine)
+ingest_settings = IngestSettings()
 
-@asynccontextmanager
-async def get_database():
-    session = Session(engine)
-    try:
-        yield session
-    finally:
-        session.close()
 
-database = Annotated[Session, Depends(get_session)]
+@cache
+def ingest_jobs():
+    """One queue and worker for the app's database, so ingests never overlap"""
+    return IngestQueue(
+        get_engine(),
+        maxsize=ingest_settings.queue_size,
+        processor_options={
+            "workers": ingest_settings.workers,
+            "batch_size": ingest_settings.batch_size,
+            "transactions": ingest_settings.transactions,
+        },
+    )
 
 
 @asynccontextmanager
-@lru_cache(maxsize=200)
 async def lifespan(app: FastAPI):
-    # Create tables at startup
-    SQLModel.metadata.create_all(engine)
-    
-    # Check if tables exist
-    with Session(engine) as session:
-        inspector = inspect(engine)
-        if not inspector.has_table("smsdata"):
-            SQLModel.metadata.create_all(engine)
+    # Connect and create tables at startup rather than at import, patching
+    # databases created before the current schema
+    prepare_database(get_engine(), transactions=ingest_settings.transactions)
     yield
+    # Queued ingests are cancelled. The running one gets time to finish; if
+    # it does not, its checkpoint lets the next job resume it
+    await run_in_threadpool(ingest_jobs().shutdown, SHUTDOWN_TIMEOUT)
 
 
 app = FastAPI(
@@ -62,6 +77,43 @@ app = FastAPI(
     version="0.0.1",
 )
 
+# Read endpoints whose responses only change when SMS data is ingested
+CACHED_PATHS = {"/sms", "/sms/all"}
+
+
+def cached_response(request: Request, entry):
+    headers = {"ETag": f'"{entry.etag}"'}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, headers={**headers, "Content-Type": entry.media_type})
+
+
+@app.middleware("http")
+async def serve_cached_response(request: Request, call_next):
+    """Answer repeated GETs from the response cache while the data is unchanged"""
+    if request.method != "GET" or request.url.path not in CACHED_PATHS:
+        return await call_next(request)
+    # Off the event loop: waiting on the pool here would block the requests
+    # that hold the connections
+    version = await run_in_threadpool(
+        response_cache.data_version,
+        "smsdata",
+        lambda: read_data_version(get_engine(), "smsdata"),
+    )
+    key = cache_key(request.url.path, request.query_params.multi_items())
+    entry = response_cache.get(key, version)
+    if entry is None:
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        entry = response_cache.put(
+            key, version, body, response.headers.get("content-type")
+        )
+    return cached_response(request, entry)
+
+
+# Added after the cache so that it wraps it and cached responses get CORS headers
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -71,20 +123,133 @@ app.add_middleware(
 )
 
 
+def route_path(request: Request):
+    """Path template of the route request matches, e.g. /ingest/{job_id}."""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+# Added last so that it wraps everything else, cache hits included
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    """Record the request in /metrics once its body has been sent"""
+    stats = start_request()
+    response = await call_next(request)
+    route = route_path(request)
+    body = response.body_iterator
+
+    async def counted():
+        sent = 0
+        try:
+            async for chunk in body:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            metrics.finish_request(
+                stats, request.method, route, response.status_code, sent
+            )
+
+    response.body_iterator = counted()
+    return response
+
+
+@app.get("/cache", tags=["SMS Processing"])
+async def get_cache_stats():
+    """Response cache hit, miss and eviction counters"""
+    return response_cache.stats()
+
+
+@app.get("/metrics", tags=["SMS Processing"])
+async def get_metrics():
+    """Request latency, database time, rows and response size per route"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
+def queued(job):
+    return JSONResponse(
+        {**job.to_dict(), "status_url": f"/ingest/{job.id}"}, status_code=202
+    )
+
+
 @app.get("/", tags=["SMS Processing"])
-async def main(db: database):
-    """Process SMS data and return summary"""
-    processor = SMSProcessor(db=db)
-    result = processor.process_and_store_sms()
-    return result
+async def main():
+    """Queue ingestion of the default SMS backup; poll the returned status_url"""
+    try:
+        job = ingest_jobs().submit(os.path.abspath(DEFAULT_XML))
+    except QueueFull:
+        return JSONResponse({"error": "Ingestion queue is full"}, status_code=429)
+    return queued(job)
+
+
+@app.post("/ingest", tags=["SMS Processing"])
+async def submit_ingest(request: Request, path: Optional[str] = None):
+    """Queue an SMS backup for ingestion and return its job.
+
+    Either send the XML backup as the request body, or pass `path` to a
+    backup on the server under SMS_INGEST_ROOT. Jobs run one at a time in
+    the background; poll GET /ingest/{job_id} for progress.
+    """
+    if path:
+        xml_file = ingest_settings.resolve(path)
+        if xml_file is None:
+            return JSONResponse({"error": f"No such backup: {path}"}, status_code=400)
+        remove_file = False
+    else:
+        # Stream the upload to disk rather than holding it in memory; the
+        # writes run in the threadpool so a slow disk does not stall the loop
+        with tempfile.NamedTemporaryFile(
+            "wb", suffix=".xml", dir=ingest_settings.upload_dir, delete=False
+        ) as upload:
+            async for chunk in request.stream():
+                await run_in_threadpool(upload.write, chunk)
+        xml_file, remove_file = upload.name, True
+        if not os.path.getsize(xml_file):
+            os.remove(xml_file)
+            return JSONResponse(
+                {"error": "Send an XML backup as the body or pass ?path="},
+                status_code=400,
+            )
+    try:
+        job = ingest_jobs().submit(xml_file, remove_file=remove_file)
+    except QueueFull:
+        if remove_file:
+            os.remove(xml_file)
+        return JSONResponse({"error": "Ingestion queue is full"}, status_code=429)
+    return queued(job)
+
+
+@app.get("/ingest/{job_id}", tags=["SMS Processing"])
+async def get_ingest_job(job_id: str):
+    """Progress of an ingestion job: status, rows/sec and ETA"""
+    job = ingest_jobs().get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job.to_dict()
+
 
 @app.get("/sms/all", tags=["SMS Processing"])
-async def get_all_sms_data(db: database):
-    """Get all SMS data from the database"""
+async def get_all_sms_data(
+    db: async_database,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    include_total: bool = False,
+):
+    """Get SMS data from the database, one keyset page at a time"""
     try:
-        processor = SMSProcessor(db=db)
-        data = processor.data()
-        return data
+        if cursor:
+            decode_cursor(cursor)
+        items, next_cursor = await paginate_sms_async(
+            db, [], cursor, clamp_page_size(limit, DEFAULT_PAGE_SIZE)
+        )
+        page = {"items": [sms.public_dict() for sms in items], "next_cursor": next_cursor}
+        if include_total:
+            page["total"] = await count_sms_async(db, [], ())
+        return page
+    except ValueError as e:
+        return {"error": str(e)}
     except Exception as e:
         logging.error(f"Error fetching all SMS data: {e}")
         return {"error": str(e)}
@@ -92,16 +257,87 @@ async def get_all_sms_data(db: database):
 
 @app.get("/sms", tags=["SMS Processing"])
 async def get_sms(
-    db: database,
+    db: async_database,
     search: Optional[str] = None,
     type: Optional[str] = None,
     date: Optional[datetime] = None,
     amount: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    include_total: bool = False,
+    mode: str = "filter",
 ):
+    """Filter SMS data page by page, or with mode=search rank full-text matches.
+
+    Search mode returns the best `limit` matches for `search` by relevance,
+    each with a highlighted snippet, instead of a date-ordered page.
+    """
+    if mode not in ("filter", "search"):
+        return {"error": f"Unsupported mode: {mode}. Use filter or search."}
     try:
         if amount:
             amount = float(amount)
-        get_all = get_all_sms(db, search, type, date, amount)
-        return get_all
     except ValueError:
         return {"error": "Invalid amount format. Please provide a valid number."}
+    try:
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    if mode == "search" and search and has_search_index(get_engine()):
+        filters = get_sms_filters(None, type, date, amount)
+        items = await search_sms_async(
+            db, SmsData, search, filters, clamp_page_size(limit, DEFAULT_PAGE_SIZE)
+        )
+        return {"items": items, "next_cursor": None}
+
+    items, next_cursor = await get_all_sms_async(
+        db, search, type, date, amount, cursor, clamp_page_size(limit, DEFAULT_PAGE_SIZE)
+    )
+    page = {"items": [sms.public_dict() for sms in items], "next_cursor": next_cursor}
+    if include_total:
+        filters = get_sms_filters(search, type, date, amount)
+        page["total"] = await count_sms_async(
+            db, filters, (search, type, date, amount)
+        )
+    return page
+
+
+@app.get("/export", tags=["SMS Processing"])
+def export_sms(
+    format: str = "ndjson",
+    search: Optional[str] = None,
+    type: Optional[str] = None,
+    date: Optional[datetime] = None,
+    amount: Optional[float] = None,
+):
+    """Stream SMS data matching the /sms filters as NDJSON or CSV"""
+    if format not in MEDIA_TYPES:
+        return JSONResponse(
+            {"error": f"Unsupported export format: {format}"}, status_code=400
+        )
+    filters = get_sms_filters(search, type, date, amount)
+
+    def generate():
+        # The response outlives the request, so the stream owns its session
+        with Session(get_engine()) as db:
+            query = (
+                select(SmsData)
+                .where(*filters)
+                .order_by(*keyset_order(SmsData.date, SmsData.id))
+                .execution_options(yield_per=YIELD_PER)
+            )
+            rows = db.exec(query)
+            yield from iter_export(
+                rows,
+                SmsData.public_fields(),
+                lambda sms: sms.public_dict(mode="json"),
+                format,
+            )
+
+    return StreamingResponse(
+        generate(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=sms.{format}"},
+    )
@@ -0,0 +1,359 @@
+"""The amount, fee, balance and transaction ID in MoMo message bodies.
+
+Both ingestion paths read these fields from the message text:
+
+- amount: the first "<number> RWF" that is not a fee, a balance or a
+  transaction ID, e.g. "Your payment of 1,000 RWF";
+- fee: the first "<number> RWF" at most LABEL_GAP characters, none of them
+  digits, after "Fee" ("Fee was: 100 RWF");
+- balance: the same after "balance" ("Your NEW BALANCE :40400 RWF");
+- txid: the digits after the first "TxId:" or "Transaction Id:".
+
+A number is a run of digits that may contain thousands separators, and a
+number whose digits are a transaction ID's is not an amount. Numbers
+longer than MAX_DIGITS are treated as missing. When labels of both kinds
+come before a number, the first one names it.
+
+extract_fields() takes a column of bodies and returns one NumPy array per
+field. The bodies are joined into one byte array, the "RWF" markers and the
+labels are found by comparing the 8 bytes at each candidate position as one
+integer, and each number is read from the 8 or 16 bytes around it, so the
+work per batch is about a hundred array operations rather than a regex scan
+per message. extract_fields_one() gives the same fields for a
+single body with regexes, and is used instead when NumPy is not installed.
+extract_amount() is the amount alone, stopping at the first candidate.
+
+    python benchmarks.py amounts --factor 600
+"""
+import math
+import re
+from typing import Any, NamedTuple
+
+from utils import lazy_import
+
+# Optional, extract_fields_one is used per message instead; loaded on first use
+np = lazy_import("numpy")
+
+FIELDS = ("amount", "fee", "balance", "txid")
+# Most characters allowed between a fee or balance label and its number
+LABEL_GAP = 12
+# Longest number read; up to 15 digits fit a float exactly
+MAX_DIGITS = 15
+# Messages joined into one byte array at a time; about 1MB
+EXTRACT_BATCH_SIZE = 5000
+# txid of messages without a transaction ID
+NO_TXID = -1
+
+LABELS = ("Fee", "balance", "Balance", "BALANCE")
+TXID_LABELS = ("TxId:", "Transaction Id:")
+AMOUNT_PATTERN = re.compile(r"(\d+(?:,\d{3})*)\s*RWF", re.ASCII)
+# Matches up to a number that is a fee, a balance or a transaction ID
+LABELLED_PATTERN = re.compile(
+    r"(?:(?:%s)\D{0,%d}|(?:TxId|Transaction Id):\s*)\Z" % ("|".join(LABELS), LABEL_GAP),
+    re.ASCII,
+)
+# The same for fees and balances only; group 1 is set for a fee
+LABEL_PATTERN = re.compile(
+    r"(?:(Fee)|balance|Balance|BALANCE)\D{0,%d}\Z" % LABEL_GAP, re.ASCII
+)
+TXID_PATTERN = re.compile(r"(?:TxId|Transaction Id):\s*(\d+)", re.ASCII)
+# Characters in front of a number that can hold its label
+LABEL_WINDOW = max(map(len, LABELS)) + LABEL_GAP
+
+
+class MessageFields(NamedTuple):
+    """One column per field: float64 amounts with NaN and int64 txids with
+    NO_TXID where a message has none, or lists with None without NumPy."""
+
+    amount: Any
+    fee: Any
+    balance: Any
+    txid: Any
+
+
+def _number(digits):
+    digits = digits.replace(",", "")
+    return int(digits) if len(digits) <= MAX_DIGITS else None
+
+
+def extract_amount(body):
+    """The transaction amount in one message body as a float, or None."""
+    for match in AMOUNT_PATTERN.finditer(body):
+        start = match.start()
+        if LABELLED_PATTERN.search(body, max(0, start - LABEL_WINDOW), start):
+            continue
+        number = _number(match.group(1))
+        return float(number) if number is not None else None
+    return None
+
+
+def extract_fields_one(body):
+    """The fields of one message body as a dict, None for those it lacks."""
+    values = dict.fromkeys(FIELDS)
+    found = set()
+    # Where the transaction IDs' digits start
+    id_starts = set()
+    for match in TXID_PATTERN.finditer(body):
+        if not id_starts:
+            values["txid"] = _number(match.group(1))
+            found.add("txid")
+        id_starts.add(match.start(1))
+    for match in AMOUNT_PATTERN.finditer(body):
+        start = match.start()
+        if start in id_starts:
+            continue
+        label = LABEL_PATTERN.search(body, max(0, start - LABEL_WINDOW), start)
+        name = "amount" if label is None else "fee" if label.group(1) else "balance"
+        if name not in found:
+            number = _number(match.group(1))
+            values[name] = float(number) if number is not None else None
+            found.add(name)
+    return values
+
+
+def extract_fields(bodies):
+    """Extract amount, fee, balance and txid from a sequence of message bodies."""
+    if np is None:
+        rows = [extract_fields_one(body) for body in bodies]
+        return MessageFields(*([row[name] for row in rows] for name in FIELDS))
+    batches = [
+        _extract_with_numpy(bodies[start:start + EXTRACT_BATCH_SIZE])
+        for start in range(0, len(bodies), EXTRACT_BATCH_SIZE)
+    ]
+    if len(batches) == 1:
+        return batches[0]
+    if not batches:
+        return MessageFields(
+            np.empty(0), np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+        )
+    return MessageFields(*(np.concatenate(column) for column in zip(*batches)))
+
+
+def field_values(column):
+    """A column of extract_fields() as a list of Python values, None where missing."""
+    if np is None:
+        return list(column)
+    if column.dtype.kind == "f":
+        return [None if value != value else value for value in column.tolist()]
+    return [None if value == NO_TXID else value for value in column.tolist()]
+
+
+# Joined before and after the bodies, so windows never run off the ends
+PADDING = "\0" * 23
+# Words looked for in the joined bodies: "RWF", then the fee and balance labels
+# and the transaction ID labels, all starting with R, F, T or b / B
+RWF = b"RWF"
+LABEL_WORDS = tuple(label.encode() for label in LABELS)
+TXID_WORDS = tuple(label.encode() for label in TXID_LABELS)
+# Place of each of 16 characters within its half of 8, in the first or
+# second column; a place of -inf weighs 0
+ID_PLACES = [(7 - i, -math.inf) if i < 8 else (-math.inf, 15 - i) for i in range(16)]
+# Place of each of the 8 characters up to a number's last digit, in a
+# number without and with a comma three digits from the end
+NUMBER_PLACES = [(place, place - (place > 3)) for place in range(7, -1, -1)]
+
+
+def _extract_with_numpy(bodies):
+    # Every non-ASCII character becomes one "?", so character distances are
+    # kept; NUL cannot occur in XML text and separates the messages
+    text = "\0".join([PADDING, *bodies, PADDING]).encode("ascii", "replace")
+    buf = np.frombuffer(text, dtype=np.uint8)
+    words = _words(buf)
+    count = len(bodies)
+    lengths = np.fromiter(map(len, bodies), dtype=np.int64, count=count)
+    # Position of the separator after each message
+    ends = np.cumsum(lengths + 1) + len(PADDING)
+
+    # Candidates for the first byte of a word: R, T, F, b and B, plus P, V
+    # and f, which take two passes over the bytes instead of five
+    leads = np.flatnonzero(((buf & np.uint8(0xF9)) == 0x50) | ((buf & np.uint8(0xDB)) == 0x42))
+    heads = words[leads]
+    # Where each word ends
+    found = {
+        word: _match(words, leads, heads, word) + len(word)
+        for word in (RWF,) + LABEL_WORDS + TXID_WORDS
+    }
+
+    # Transaction IDs: the digits after a label and any whitespace
+    id_starts = np.sort(np.concatenate([found[word] for word in TXID_WORDS]))
+    id_starts = _skip_space(buf, id_starts, 1)
+    id_starts = id_starts[_is_digit(buf[id_starts])]
+    ids = _read_ids(words, id_starts)
+
+    # Numbers in front of an "RWF", possibly with whitespace between; those
+    # that are the digits of a transaction ID are skipped
+    number_ends = _skip_space(buf, found[RWF] - len(RWF) - 1, -1)
+    number_ends = number_ends[_is_digit(buf[number_ends])]
+    numbers, number_starts = _read_numbers(buf, words, number_ends)
+    kept = ~_contains(id_starts, number_starts)
+    numbers, number_starts = numbers[kept], number_starts[kept]
+
+    # Fee and balance labels, in order. A label names the number starting at
+    # the first digit after it, if that is at most LABEL_GAP characters on
+    # and in the same message; the first label naming a number wins
+    label_ends = np.concatenate([found[word] for word in LABEL_WORDS])
+    label_kinds = np.repeat(
+        np.array([1 if word == b"Fee" else 2 for word in LABEL_WORDS], dtype=np.int8),
+        [len(found[word]) for word in LABEL_WORDS],
+    )
+    order = np.argsort(label_ends, kind="stable")
+    label_ends, label_kinds = label_ends[order], label_kinds[order]
+    after = np.stack([words[label_ends], words[label_ends + 8]], axis=1).view(np.uint8)
+    stops = label_ends + _first_set_byte((_is_digit(after) | (after == 0)).view(np.uint64))
+    named = np.flatnonzero((stops - label_ends <= LABEL_GAP) & _contains(number_starts, stops))
+    labelled = np.searchsorted(number_starts, stops[named])
+    first = np.diff(labelled, prepend=-1) != 0
+    kinds = np.zeros(len(number_starts), dtype=np.int8)
+    kinds[labelled[first]] = label_kinds[named[first]]
+
+    # The first number of each kind per message: grouped by kind, then by
+    # message, one flat column of count entries per kind
+    order = np.argsort(kinds, kind="stable")
+    keys = kinds[order].astype(np.int64) * count + np.searchsorted(ends, number_starts[order])
+    first = np.flatnonzero(np.diff(keys, prepend=-1))
+    columns = np.full(3 * count, np.nan)
+    columns[keys[first]] = numbers[order[first]]
+    id_messages = np.searchsorted(ends, id_starts)
+    first = np.flatnonzero(np.diff(id_messages, prepend=-1))
+    txids = np.full(count, NO_TXID, dtype=np.int64)
+    txids[id_messages[first]] = ids[first]
+    return MessageFields(*columns.reshape(3, count), txids)
+
+
+def _words(buf):
+    """View whose element i is the little-endian uint64 of buf[i:i + 8]."""
+    return np.ndarray((len(buf) - 7,), dtype="<u8", buffer=buf, strides=(1,))
+
+
+def _word_value(word):
+    return np.uint64(int.from_bytes(word, "little")), np.uint64((1 << 8 * len(word)) - 1)
+
+
+def _match(words, positions, heads, word):
+    """The positions at which word starts; heads are the words at positions."""
+    value, mask = _word_value(word[:8])
+    positions = positions[(heads & mask) == value]
+    if len(word) > 8:
+        value, mask = _word_value(word[8:])
+        positions = positions[(words[positions + 8] & mask) == value]
+    return positions
+
+
+def _top_byte(values):
+    """Index of the highest nonzero byte of uint64s whose bytes are 0 or 1, -1 if none.
+
+    Such a value is well below the next power of two after its highest
+    bit, so its float64 exponent gives that bit.
+    """
+    return (np.frexp(values.astype(np.float64))[1] - 1) >> 3
+
+
+def _first_set_byte(flags):
+    """Index of the first nonzero byte of each row of 0 / 1 bytes viewed as
+    two little-endian uint64s, or 16 if none."""
+    low, high = flags[:, 0].byteswap(), flags[:, 1].byteswap()
+    return np.where(low != 0, 7 - _top_byte(low), 15 - _top_byte(high))
+
+
+def _is_digit(values):
+    return values - np.uint8(48) < 10
+
+
+def _skip_space(buf, positions, step):
+    """Move each position by step while it is on whitespace."""
+    positions = positions.copy()
+    moving = np.arange(len(positions))
+    while len(moving):
+        at = buf[positions[moving]]
+        moving = moving[(at == 32) | (at - np.uint8(9) < 5)]
+        positions[moving] += step
+    return positions
+
+
+def _contains(sorted_positions, positions):
+    """Whether each of positions is one of sorted_positions."""
+    if not len(sorted_positions):
+        return np.zeros(len(positions), dtype=bool)
+    found = np.minimum(np.searchsorted(sorted_positions, positions), len(sorted_positions) - 1)
+    return sorted_positions[found] == positions
+
+
+def _read_ids(words, starts):
+    """Value of the digit runs beginning at starts, NO_TXID past MAX_DIGITS digits.
+
+    The 16 characters from each start are read as two words. The digits in
+    each half are weighted by their place in it, which is exact in float64
+    for 8 digits, and the halves are then shifted to the run's length.
+    """
+    digits = np.stack([words[starts], words[starts + 8]], axis=1).view(np.uint8) - np.uint8(48)
+    lengths = _first_set_byte((digits >= 10).view(np.uint64))
+    halves = (digits * (np.arange(16) < lengths[:, None])) @ 10.0 ** np.array(ID_PLACES)
+    high = halves[:, 0] // 10.0 ** np.maximum(8 - lengths, 0)
+    values = high * 10.0 ** np.maximum(lengths - 8, 0) + halves[:, 1] // 10.0 ** (16 - lengths)
+    return np.where(lengths <= MAX_DIGITS, values.astype(np.int64), NO_TXID)
+
+
+
+def _read_numbers(buf, words, ends):
+    """Value and start of the numbers whose last digit is at ends.
+
+    A comma belongs to the number when exactly three digits follow it and a
+    digit comes before it, which gives the number AMOUNT_PATTERN matches.
+    The 8 characters up to each end are read as one word: in the usual
+    case they hold the whole number, with at most one comma, in front of
+    its last three digits, and the value is one dot product. The other
+    numbers are read one character at a time. Numbers of more than
+    MAX_DIGITS digits are NaN.
+    """
+    # Row i holds the characters ends[i] - 7 .. ends[i], as bytes and as
+    # one little-endian word whose highest byte is the last digit
+    window = words[ends - 7]
+    chars = window.view(np.uint8).reshape(-1, 8)
+    digits = chars - np.uint8(48)
+    numeric = digits < 10
+    # Length of the run of digits and commas the window ends with
+    outside = (~(numeric | (chars == ord(",")))).view(np.uint64)[:, 0]
+    lengths = 7 - _top_byte(outside)
+    # The bytes of that run, as a mask over the word
+    run = ~((np.uint64(1) << (8 * (8 - lengths)).astype(np.uint64)) - np.uint64(1))
+    commas = (chars == ord(",")).view(np.uint64)[:, 0] & run
+    # The comma of a four or more digit number is the window's fifth byte
+    separated = commas == np.uint64(1 << 32)
+    plain = ((commas == 0) | (separated & (lengths > 4))) & (lengths < 8)
+
+    kept = ((digits * numeric).view(np.uint64)[:, 0] & run).view(np.uint8).reshape(-1, 8)
+    values = kept @ 10.0 ** np.array(NUMBER_PLACES)
+    values = np.where(separated, values[:, 1], values[:, 0])
+    starts = ends - lengths + 1
+    other = np.flatnonzero(~plain)
+    if len(other):
+        values[other], starts[other] = _read_backward(buf, ends[other])
+    return values, starts
+
+
+def _read_backward(buf, ends):
+    """_read_numbers one character of every number per step, for any length."""
+    powers = 10.0 ** np.arange(MAX_DIGITS)
+    values = np.zeros(len(ends))
+    digits = np.zeros(len(ends), dtype=np.int64)
+    starts = ends.copy()
+    rows = np.arange(len(ends))
+    positions = ends.copy()
+    # Digits read since the last comma
+    run = np.zeros(len(ends), dtype=np.int64)
+    while len(rows):
+        at = buf[positions]
+        digit = at - np.uint8(48)
+        numeric = digit < 10
+        comma = (at == ord(",")) & (run == 3) & _is_digit(buf[positions - 1])
+        read, digit = rows[numeric], digit[numeric]
+        place = digits[read]
+        exact = place < MAX_DIGITS
+        values[read[exact]] += digit[exact] * powers[place[exact]]
+        digits[read] += 1
+        starts[read] = positions[numeric]
+        more = numeric | comma
+        rows, positions = rows[more], positions[more] - 1
+        run = np.where(numeric, run + 1, 0)[more]
+    values[digits > MAX_DIGITS] = np.nan
+    return values, starts
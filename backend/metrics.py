@@ -0,0 +1,204 @@
+"""Per-request metrics for both apps, served at /metrics in the Prometheus text format.
+
+Every request gets a RequestStats in a context variable. SQLAlchemy cursor
+events on the instrumented engines add query time and count to it, and ORM
+loads add the rows they build, so the numbers belong to one request even
+with many in flight. The middleware in app.py and main.py records them
+against the route template (/transactions/<int:id>, not /transactions/7)
+once the last byte of the response has been sent.
+
+Statements slower than SLOW_QUERY_MS are logged with their parameters,
+inside a request or not, to SLOW_QUERY_LOG when it is set.
+"""
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 10000)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+# Longest statement text written to the slow-query log
+SLOW_QUERY_CHARS = 1000
+
+slow_query_log = logging.getLogger("slow_queries")
+if os.getenv("SLOW_QUERY_LOG"):
+    _handler = logging.FileHandler(os.getenv("SLOW_QUERY_LOG"))
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_log.addHandler(_handler)
+    slow_query_log.propagate = False
+
+
+@dataclass
+class RequestStats:
+    started: float = field(default_factory=time.perf_counter)
+    db_seconds: float = 0.0
+    queries: int = 0
+    rows: int = 0
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def start_request():
+    """Start collecting database stats for the request being handled."""
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def _labels(names, values):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, labels
+        # An unlabelled counter is exported as 0 before its first inc()
+        self._series = {} if labels else {(): 0}
+
+    def inc(self, values=(), amount=1):
+        self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, total in sorted(self._series.items()):
+            labels = _labels(self.labels, values)
+            yield f"{self.name}{{{labels}}} {total}" if labels else f"{self.name} {total}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        # label values -> [cumulative bucket counts, sum, count]
+        self._series = {}
+
+    def observe(self, values, value):
+        series = self._series.setdefault(values, [[0] * len(self.buckets), 0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, (counts, total, count) in sorted(self._series.items()):
+            labels = _labels(self.labels, values)
+            for bound, n in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{{{labels},le="{bound:g}"}} {n}'
+            yield f'{self.name}_bucket{{{labels},le="+Inf"}} {count}'
+            yield f"{self.name}_sum{{{labels}}} {total!r}"
+            yield f"{self.name}_count{{{labels}}} {count}"
+
+
+class Metrics:
+    """Request counters and histograms, labelled by method and route."""
+
+    def __init__(self):
+        route = ("method", "route")
+        self.requests = Counter(
+            "http_requests_total", "Requests served.", route + ("status",)
+        )
+        self.latency = Histogram(
+            "http_request_duration_seconds",
+            "Time from receiving a request to sending its last byte.",
+            route,
+            LATENCY_BUCKETS,
+        )
+        self.db_time = Histogram(
+            "http_request_db_seconds",
+            "Time spent in database queries per request.",
+            route,
+            LATENCY_BUCKETS,
+        )
+        self.queries = Counter(
+            "http_request_db_queries_total", "Database queries run by requests.", route
+        )
+        self.rows = Histogram(
+            "http_request_rows", "ORM rows loaded per request.", route, ROW_BUCKETS
+        )
+        self.response_bytes = Histogram(
+            "http_response_size_bytes", "Response body size.", route, SIZE_BUCKETS
+        )
+        self.slow_queries = Counter(
+            "db_slow_queries_total",
+            "Statements slower than the slow-query threshold.",
+        )
+        self._all = (
+            self.requests, self.latency, self.db_time, self.queries,
+            self.rows, self.response_bytes, self.slow_queries,
+        )
+        self._lock = threading.Lock()
+
+    def finish_request(self, stats, method, route, status, response_bytes):
+        elapsed = time.perf_counter() - stats.started
+        labels = (method, route)
+        with self._lock:
+            self.requests.inc(labels + (str(status),))
+            self.latency.observe(labels, elapsed)
+            self.db_time.observe(labels, stats.db_seconds)
+            self.queries.inc(labels, stats.queries)
+            self.rows.observe(labels, stats.rows)
+            self.response_bytes.observe(labels, response_bytes)
+
+    def slow_query(self):
+        with self._lock:
+            self.slow_queries.inc()
+
+    def render(self):
+        with self._lock:
+            lines = [line for metric in self._all for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrument_engine(engine, slow_query_ms=SLOW_QUERY_MS):
+    """Time every statement run on engine (the sync_engine of an AsyncEngine)."""
+    threshold = slow_query_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.db_seconds += elapsed
+            stats.queries += 1
+        if elapsed >= threshold:
+            metrics.slow_query()
+            sql = " ".join(statement.split())[:SLOW_QUERY_CHARS]
+            slow_query_log.warning(
+                f"Slow query ({elapsed * 1000:.0f} ms): {sql} {parameters!r:.200}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def drop_failed_query(context):
+        started = context.connection.info.get("query_started") if context.connection else None
+        if started:
+            started.pop()
+
+
+@event.listens_for(Mapper, "load")
+def count_loaded_row(target, context):
+    stats = _current.get()
+    if stats is not None:
+        stats.rows += 1
@@ -0,0 +1,78 @@
+import logging
+
+from sqlalchemy import bindparam, inspect, select, text
+
+from utils import fingerprint
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def upgrade(engine, models):
+    """Bring existing tables in line with the given models.
+
+    create_all only creates missing tables, so databases created by an older
+    version of the app are patched here: missing columns are added, content
+    fingerprints are backfilled and missing indexes are created. Every step
+    is idempotent, so this is safe to run on every startup.
+    """
+    for model in models:
+        table = model.__table__
+        table.create(engine, checkfirst=True)
+        add_missing_columns(engine, table)
+        if getattr(model, 'FINGERPRINT_COLUMNS', None):
+            backfill_fingerprints(engine, table, model.FINGERPRINT_COLUMNS)
+        with engine.begin() as conn:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def add_missing_columns(engine, table):
+    existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            logging.info(f"Adding column {table.name}.{column.name}")
+            conn.execute(
+                text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+            )
+
+
+def backfill_fingerprints(engine, table, columns):
+    """Fill in fingerprints for rows stored before the column existed.
+
+    Rows whose content duplicates an earlier row keep a NULL fingerprint so
+    the unique index can still be created.
+    """
+    with engine.begin() as conn:
+        missing = conn.execute(
+            select(table.c.id, *[table.c[name] for name in columns]).where(
+                table.c.fingerprint.is_(None)
+            )
+        ).all()
+        if not missing:
+            return
+        seen = set(
+            conn.execute(
+                select(table.c.fingerprint).where(table.c.fingerprint.is_not(None))
+            ).scalars()
+        )
+        update = (
+            table.update()
+            .where(table.c.id == bindparam('row_id'))
+            .values(fingerprint=bindparam('row_fingerprint'))
+        )
+        batch = []
+        for row in missing:
+            value = fingerprint(*row[1:])
+            if value in seen:
+                continue
+            seen.add(value)
+            batch.append({'row_id': row[0], 'row_fingerprint': value})
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                conn.execute(update, batch)
+                batch = []
+        if batch:
+            conn.execute(update, batch)
+        logging.info(f"Backfilled fingerprints for {len(missing)} rows in {table.name}")
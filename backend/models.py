@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -6,10 +6,36 @@ Base = declarative_base()
 class Transaction(Base):
     __tablename__ = 'transactions'
 
+    # Columns hashed into the fingerprint used to skip duplicate transactions
+    FINGERPRINT_COLUMNS = ('message', 'date')
+    __table_args__ = (
+        # Keyset pagination order
+        Index('ix_transactions_date_id', 'date', 'id'),
+        # /filter and /export: type with a date range, and amount ranges
+        Index('ix_transactions_type_date_id', 'transaction_type', 'date', 'id'),
+        Index('ix_transactions_amount', 'amount'),
+    )
+
     id = Column(Integer, primary_key=True)
     message = Column(String, nullable=False)
     sender = Column(String)
     receiver = Column(String)
     amount = Column(Integer)
     date = Column(DateTime)
-    transaction_type = Column(String)
\ No newline at end of file
+    transaction_type = Column(String)
+    fingerprint = Column(String, unique=True, index=True)
+
+class TransactionRollup(Base):
+    """Pre-aggregated transaction totals per period bucket and type.
+
+    Kept up to date by ingestion so summaries never scan transactions.
+    period is 'all' (bucket ''), 'day' (2024-05-10), 'week' (2024-W19)
+    or 'month' (2024-05).
+    """
+    __tablename__ = 'transaction_rollups'
+
+    period = Column(String, primary_key=True)
+    bucket = Column(String, primary_key=True)
+    transaction_type = Column(String, primary_key=True)
+    total_amount = Column(BigInteger, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
\ No newline at end of file
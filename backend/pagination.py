@@ -0,0 +1,116 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import and_, or_, tuple_
+
+MAX_PAGE_SIZE = 500
+
+
+def clamp_page_size(value, default):
+    """Keep a requested page size between 1 and MAX_PAGE_SIZE."""
+    if not value or value < 1:
+        return default
+    return min(value, MAX_PAGE_SIZE)
+
+
+def encode_cursor(date, row_id):
+    """Opaque token pointing just past the (date, id) of the last row on a page."""
+    payload = json.dumps([date.isoformat() if date else None, str(row_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return the (date, id) stored in a cursor token. Raises ValueError if malformed."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        date, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(date) if date else None), row_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+
+
+def keyset_order(date_column, id_column):
+    return date_column.asc().nulls_first(), id_column.asc()
+
+
+def keyset_after(date_column, id_column, cursor, id_type=str):
+    """Filter selecting the rows that sort after cursor in keyset_order.
+
+    Rows are ordered by (date, id) with NULL dates first, so a page is read
+    with an index range scan however deep it is, unlike LIMIT/OFFSET. The
+    (date, id) > (?, ?) row value is what lets the database seek the
+    (date, id) index; the same test spelled out with OR is planned as a
+    scan of the whole index.
+    """
+    date, row_id = decode_cursor(cursor)
+    row_id = id_type(row_id)
+    if date is None:
+        # Still in the NULL-date prefix: the rest of it, then every dated row
+        return or_(
+            and_(date_column.is_(None), id_column > row_id), date_column.is_not(None)
+        )
+    # NULL dates compare as NULL here, so the prefix is left out as it should be
+    return tuple_(date_column, id_column) > (date, row_id)
+
+
+def next_cursor(rows, limit):
+    """Cursor for the page after rows, which were fetched with limit + 1."""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(last.date, last.id)
+
+
+class CountCache:
+    """Small TTL cache for COUNT(*) results so totals are not recounted per page.
+
+    Callers put the table's data version in the key, so a count taken
+    before an ingest is never served after it.
+    """
+
+    def __init__(self, ttl_seconds=30, maxsize=256):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+        value = compute()
+        self._store(key, value, now)
+        return value
+
+    async def get_async(self, key, compute):
+        """get() for an async compute coroutine function."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+        value = await compute()
+        self._store(key, value, now)
+        return value
+
+    def _store(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+count_cache = CountCache()
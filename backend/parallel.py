@@ -0,0 +1,43 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap_chunks(func, iterable, workers, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Apply func to chunks of iterable in worker processes, yielding results in order.
+
+    func receives a list of items and must return a list of results. Only a
+    bounded number of chunks is in flight at once, so the input is consumed
+    lazily and memory stays flat however long the stream is. With a single
+    worker everything runs in the calling process.
+    """
+    yield from map_chunks(func, chunked(iterable, chunk_size), workers)
+
+
+def map_chunks(func, chunks, workers):
+    """imap_chunks over an iterable of ready-made chunks."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield from func(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(func, chunk))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
@@ -1,74 +1,118 @@
-import xml.etree.ElementTree as ET
-from datetime import datetime
-from data_cleaning import categorize_transaction, clean_amount, clean_date
+import xml.parsers.expat
+from data_cleaning import categorize_transaction
+from message_fields import extract_fields, field_values
+from parallel import DEFAULT_CHUNK_SIZE, chunked
+from records import TransactionRecord
+from timestamps import epoch_ms_to_datetimes
 import os
 
-def parse_sms_xml(xml_file):
-    transactions = []
+READ_CHUNK_SIZE = 64 * 1024
+RESUME_ROOT = b'<smses>'
+
+def iter_sms_records(xml_file, start=0):
+    """Stream (offset, attributes) for every <sms> element in an SMS backup.
+
+    The file is fed to expat in fixed-size chunks and no element tree is
+    built, so memory stays flat however large the backup is. offset is the
+    byte position of the element's opening tag. When start is non-zero,
+    parsing begins at that byte offset, which must be the opening tag of an
+    <sms> element found by an earlier run.
+    """
+    parser = xml.parsers.expat.ParserCreate('utf-8' if start else None)
+    records = []
+    # Offsets reported by expat are relative to the bytes fed to the parser
+    shift = start - len(RESUME_ROOT) if start else 0
+
+    def start_element(name, attributes):
+        if name == 'sms':
+            records.append((parser.CurrentByteIndex + shift, attributes))
+
+    parser.StartElementHandler = start_element
+    with open(xml_file, 'rb') as f:
+        if start:
+            f.seek(start)
+            parser.Parse(RESUME_ROOT, False)
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            parser.Parse(chunk, not chunk)
+            yield from records
+            records.clear()
+            if not chunk:
+                break
+
+def is_sms_offset(xml_file, offset):
+    """Check that a stored offset still points at an <sms> opening tag."""
+    with open(xml_file, 'rb') as f:
+        f.seek(offset)
+        return f.read(5) in (b'<sms ', b'<sms\t', b'<sms\n', b'<sms/')
+
+def iter_sms_attributes(xml_file):
+    """Stream the attributes of every <sms> element in an SMS backup."""
+    for _, attributes in iter_sms_records(xml_file):
+        yield attributes
+
+def iter_transactions(xml_file):
+    """Yield cleaned TransactionRecords one <sms> element at a time."""
     if not os.path.exists(xml_file):
         print(f"Error: XML file {xml_file} does not exist")
-        return transactions
+        return
 
     try:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-
-        print(f"Found root element: {root.tag}")  # Debug print
-        sms_elements = root.findall('sms')
-        print(f"Found {len(sms_elements)} <sms> elements")  # Debug print
+        # Timestamps are converted a chunk at a time
+        for chunk in chunked(iter_sms_attributes(xml_file), DEFAULT_CHUNK_SIZE):
+            dates = epoch_ms_to_datetimes([sms.get('date') for sms in chunk])
+            yield from _iter_chunk_transactions(chunk, dates)
+    except Exception as e:
+        print(f"Error parsing XML file: {str(e)}")
 
-        for sms in sms_elements:
-            try:
-                # Extract data from attributes
-                message = sms.get('body', '')
-                sender = sms.get('address')
-                # Extract receiver and amount from body (basic parsing)
-                receiver = None
-                amount = None
-                if 'from' in message.lower():
-                    # Example: "from Jane Smith (*********013)"
-                    parts = message.split('from')
-                    if '(' in parts[1]:
-                        receiver = parts[1].split('(')[0].strip()
-                elif 'to' in message.lower():
-                    # Example: "to Jane Smith 12845"
-                    parts = message.split('to')
-                    receiver = parts[1].split()[0].strip()
-                # Extract amount (e.g., "2000 RWF" or "1,000 RWF")
-                if 'RWF' in message:
-                    amount_str = message.split('RWF')[0].split()[-1].replace(',', '')
-                    amount = clean_amount(amount_str)
-                # Convert timestamp to datetime string for clean_date
-                timestamp = sms.get('date')
-                date_str = None
-                if timestamp:
-                    try:
-                        date = datetime.fromtimestamp(int(timestamp) / 1000)
-                        date_str = date.strftime('%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        pass
+def parse_receiver(message):
+    """The counterparty named in a message body (basic parsing), or None."""
+    try:
+        if 'from' in message.lower():
+            # Example: "from Jane Smith (*********013)"
+            parts = message.split('from')
+            if '(' in parts[1]:
+                return parts[1].split('(')[0].strip()
+        elif 'to' in message.lower():
+            # Example: "to Jane Smith 12845"
+            parts = message.split('to')
+            return parts[1].split()[0].strip()
+    except IndexError:
+        # "From"/"To" without the lowercase word, or nothing after it
+        pass
+    return None
 
-                transaction = {
-                    'message': message,
-                    'sender': sender,
-                    'receiver': receiver,
-                    'amount': amount,
-                    'date': clean_date(date_str) if date_str else None
-                }
-                transaction['transaction_type'] = categorize_transaction(transaction['message'])
-                if transaction['transaction_type'] is None:
-                    print(f"Unprocessed SMS: {transaction['message']}")
-                    continue
-                transactions.append(transaction)
-            except Exception as e:
-                print(f"Error processing SMS: {message}, Error: {str(e)}")
+def _iter_chunk_transactions(chunk, dates):
+    """Build the transactions for a chunk of <sms> attributes and their dates"""
+    # Amounts are extracted for the whole chunk, as the smsdata ingestion does
+    amounts = field_values(extract_fields([sms.get('body', '') for sms in chunk]).amount)
+    for sms, date, amount in zip(chunk, dates, amounts):
+        try:
+            # Extract data from attributes
+            message = sms.get('body', '')
+            sender = sms.get('address')
+            receiver = parse_receiver(message)
+            transaction_type = categorize_transaction(message)
+            if transaction_type is None:
+                print(f"Unprocessed SMS: {message}")
                 continue
-    except Exception as e:
-        print(f"Error parsing XML file: {str(e)}")
+            yield TransactionRecord(
+                message=message,
+                sender=sender,
+                receiver=receiver,
+                amount=int(amount) if amount is not None else None,
+                date=date,
+                transaction_type=transaction_type
+            )
+        except Exception as e:
+            print(f"Error processing SMS: {message}, Error: {str(e)}")
+            continue
 
+def parse_sms_xml(xml_file):
+    transactions = list(iter_transactions(xml_file))
     print(f"Parsed {len(transactions)} transactions")  # Debug print
     return transactions
 
 if __name__ == '__main__':
     transactions = parse_sms_xml('modified_sms_v2.xml')
-    print(f"Parsed {len(transactions)} transactions")
\ No newline at end of file
+    print(f"Parsed {len(transactions)} transactions")
@@ -0,0 +1,129 @@
+"""Per-stage timings for the ingestion pipeline, plus optional profiler dumps.
+
+Ingestion works through the backup a chunk at a time and runs each stage
+(reading the XML, converting timestamps, extracting amounts, ...) over the
+whole chunk before the next, so a StageProfiler only reads the clocks twice
+per stage and chunk. Stages that run in worker processes are timed there
+and merged into the parent's profiler; their wall time is then summed
+across workers and can add up to more than the run took.
+"""
+import cProfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+try:
+    from pyinstrument import Profiler as Pyinstrument
+except ImportError:  # optional, only needed for --profiler pyinstrument
+    Pyinstrument = None
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+@dataclass
+class StageStats:
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    items: int = 0
+
+
+class StageProfiler:
+    """Wall time, CPU time and item counts per named stage, in order of first use."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, wall_seconds, cpu_seconds, items=0):
+        stats = self.stages.setdefault(name, StageStats())
+        stats.wall_seconds += wall_seconds
+        stats.cpu_seconds += cpu_seconds
+        stats.items += items
+
+    @contextmanager
+    def stage(self, name, items=0):
+        """Time the block as part of stage name, which handles items items."""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.thread_time() - cpu, items)
+
+    def iterate(self, name, chunks):
+        """Yield from an iterable of lists, timing each next() as stage name."""
+        chunks = iter(chunks)
+        while True:
+            with self.stage(name):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            self.stages[name].items += len(chunk)
+            yield chunk
+
+    def merge(self, other):
+        for name, stats in other.stages.items():
+            self.add(name, stats.wall_seconds, stats.cpu_seconds, stats.items)
+
+    def summary(self):
+        """One dict per stage, with its share of the total wall time."""
+        total = sum(stats.wall_seconds for stats in self.stages.values())
+        return [
+            {
+                "stage": name,
+                "wall_seconds": round(stats.wall_seconds, 4),
+                "cpu_seconds": round(stats.cpu_seconds, 4),
+                "items": stats.items,
+                "items_per_sec": (
+                    round(stats.items / stats.wall_seconds, 1) if stats.wall_seconds else None
+                ),
+                "share": round(stats.wall_seconds / total, 4) if total else 0.0,
+            }
+            for name, stats in self.stages.items()
+        ]
+
+    def table(self):
+        return self.format_summary(self.summary())
+
+    @staticmethod
+    def format_summary(summary):
+        """summary() as a text table."""
+        lines = [
+            f"{'stage':<14}{'wall s':>10}{'cpu s':>10}{'items':>12}{'items/sec':>14}{'share':>8}"
+        ]
+        for row in summary:
+            rate = f"{row['items_per_sec']:>14,.0f}" if row["items_per_sec"] else f"{'':>14}"
+            lines.append(
+                f"{row['stage']:<14}{row['wall_seconds']:>10.3f}{row['cpu_seconds']:>10.3f}"
+                f"{row['items']:>12,}{rate}{row['share']:>8.1%}"
+            )
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile_to(path, profiler="cprofile"):
+    """Profile the block and write the result to path.
+
+    cProfile writes a .prof file for pstats or snakeviz; pyinstrument, if
+    installed, writes an HTML report. Only the calling thread is profiled,
+    not worker processes.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler!r}, expected one of {PROFILERS}")
+    if profiler == "pyinstrument":
+        if Pyinstrument is None:
+            raise RuntimeError("pyinstrument is not installed")
+        session = Pyinstrument()
+        session.start()
+        try:
+            yield
+        finally:
+            session.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(session.output_html())
+        return
+    session = cProfile.Profile()
+    session.enable()
+    try:
+        yield
+    finally:
+        session.disable()
+        session.dump_stats(path)
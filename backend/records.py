@@ -0,0 +1,99 @@
+"""Compact rows for the parse -> classify -> write ingestion pipeline.
+
+Ingestion holds a chunk of parsed messages at a time and a batch of rows
+waiting in BulkWriter. These records keep their values in __slots__, which
+takes a fraction of the memory of a dict per row and one allocation instead
+of two. They are written with a plain INSERT, so no ORM or pydantic object
+is built for a row until the API reads it back.
+
+    python benchmarks.py records --rows 1000000    # bytes and allocations per row
+"""
+
+
+class Record:
+    """Base for the records; subclasses list their columns in __slots__."""
+
+    __slots__ = ()
+
+    def as_dict(self):
+        """The column values, as BulkWriter passes them to INSERT."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+class SmsRecord(Record):
+    """A smsdata row; id is set when the row is accepted for writing."""
+
+    __slots__ = (
+        "id",
+        "address",
+        "date_sent",
+        "date",
+        "message",
+        "service_center",
+        "amount",
+        "fee",
+        "balance",
+        "txid",
+        "message_type",
+        "category",
+        "fingerprint",
+    )
+
+    def __init__(
+        self,
+        address,
+        date_sent,
+        date,
+        message,
+        service_center,
+        amount,
+        fee,
+        balance,
+        txid,
+        message_type,
+        category,
+        fingerprint=None,
+        id=None,
+    ):
+        self.id = id
+        self.address = address
+        self.date_sent = date_sent
+        self.date = date
+        self.message = message
+        self.service_center = service_center
+        self.amount = amount
+        self.fee = fee
+        self.balance = balance
+        self.txid = txid
+        self.message_type = message_type
+        self.category = category
+        self.fingerprint = fingerprint
+
+
+class TransactionRecord(Record):
+    """A transactions row; the database assigns the id."""
+
+    __slots__ = (
+        "message",
+        "sender",
+        "receiver",
+        "amount",
+        "date",
+        "transaction_type",
+        "fingerprint",
+    )
+
+    def __init__(
+        self, message, sender, receiver, amount, date, transaction_type, fingerprint=None
+    ):
+        self.message = message
+        self.sender = sender
+        self.receiver = receiver
+        self.amount = amount
+        self.date = date
+        self.transaction_type = transaction_type
+        self.fingerprint = fingerprint
@@ -0,0 +1,147 @@
+"""In-process cache of GET responses, invalidated by a stored data version.
+
+The dashboard polls the read endpoints, but their data only changes when
+ingestion runs. Ingestion bumps a per-table counter in data_versions in the
+same transaction as the rows it writes; a cached response is served only
+while the version it was built from is still current. Every cached
+response carries an ETag, so clients revalidating with If-None-Match get a
+304 without the body being rebuilt or resent.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert, select, update
+
+metadata = MetaData()
+
+data_versions = Table(
+    "data_versions",
+    metadata,
+    Column("name", String, primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+CachedResponse = namedtuple("CachedResponse", "body media_type etag version expires")
+
+
+def create_data_versions(engine):
+    data_versions.create(engine, checkfirst=True)
+
+
+def bump_data_version(session, name):
+    """Increment the version of name inside the caller's transaction."""
+    bumped = session.execute(
+        update(data_versions)
+        .where(data_versions.c.name == name)
+        .values(version=data_versions.c.version + 1)
+    )
+    if bumped.rowcount == 0:
+        session.execute(insert(data_versions).values(name=name, version=1))
+
+
+def data_version_query(name):
+    """SELECT of name's version; no row means version 0."""
+    return select(data_versions.c.version).where(data_versions.c.name == name)
+
+
+def read_data_version(engine, name):
+    with engine.connect() as conn:
+        version = conn.execute(data_version_query(name)).scalar()
+    return version or 0
+
+
+def cache_key(path, params):
+    """Key for a request: its path plus query parameters in a stable order."""
+    return path, tuple(sorted(params))
+
+
+def make_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value covers etag."""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+class ResponseCache:
+    """LRU cache of response bodies with a TTL and a size bound.
+
+    Entries remember the data version they were built from and count as a
+    miss once it moves on. The version itself is re-read from the database
+    at most every version_ttl seconds, so a burst of requests costs one
+    primary-key lookup rather than one query per request.
+    """
+
+    def __init__(self, maxsize=256, ttl_seconds=300, version_ttl=1.0):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.version_ttl = version_ttl
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def data_version(self, name, load):
+        """Current version of name, calling load() when the last read is stale."""
+        now = time.monotonic()
+        with self._lock:
+            known = self._versions.get(name)
+            if known and known[1] > now:
+                return known[0]
+        version = load()
+        with self._lock:
+            self._versions[name] = (version, now + self.version_ttl)
+        return version
+
+    def get(self, key, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.version == version and entry.expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, body, media_type):
+        entry = CachedResponse(
+            body, media_type, make_etag(body), version, time.monotonic() + self.ttl_seconds
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", 256)),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", 300)),
+)
@@ -0,0 +1,123 @@
+import logging
+from collections import defaultdict
+
+from sqlalchemy import delete, func, select
+
+from models import Transaction, TransactionRollup
+from utils import lazy_import
+
+# Loaded when rollups are first written, not by the API's summary reads
+postgresql = lazy_import('sqlalchemy.dialects.postgresql')
+sqlite = lazy_import('sqlalchemy.dialects.sqlite')
+
+PERIODS = ('day', 'week', 'month')
+REBUILD_BATCH_SIZE = 5000
+
+
+def bucket_keys(date):
+    """The (period, bucket) pairs a transaction on this date contributes to."""
+    keys = [('all', '')]
+    if date is not None:
+        iso_year, iso_week, _ = date.isocalendar()
+        keys += [
+            ('day', date.strftime('%Y-%m-%d')),
+            ('week', f'{iso_year}-W{iso_week:02d}'),
+            ('month', date.strftime('%Y-%m')),
+        ]
+    return keys
+
+
+def aggregate(rows):
+    """Sum amounts and counts of transaction rows per (period, bucket, type).
+
+    rows are TransactionRecords or result rows with the same attributes.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        for period, bucket in bucket_keys(row.date):
+            entry = totals[(period, bucket, row.transaction_type or '')]
+            entry[0] += row.amount or 0
+            entry[1] += 1
+    return totals
+
+
+def apply_rollups(session, rows):
+    """Add newly written transaction rows to the rollup tables.
+
+    Runs inside the caller's transaction, so the rollups are committed
+    together with the rows they summarise.
+    """
+    totals = aggregate(rows)
+    if not totals:
+        return
+    table = TransactionRollup.__table__
+    values = [
+        {'period': period, 'bucket': bucket, 'transaction_type': transaction_type,
+         'total_amount': amount, 'count': count}
+        for (period, bucket, transaction_type), (amount, count) in totals.items()
+    ]
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['period', 'bucket', 'transaction_type'],
+            set_={
+                'total_amount': table.c.total_amount + statement.excluded.total_amount,
+                'count': table.c.count + statement.excluded.count,
+            },
+        )
+        session.execute(statement, values)
+        return
+    # Portable fallback: read-modify-write each bucket
+    for value in values:
+        rollup = session.get(
+            TransactionRollup, (value['period'], value['bucket'], value['transaction_type'])
+        )
+        if rollup is None:
+            session.add(TransactionRollup(**value))
+        else:
+            rollup.total_amount += value['total_amount']
+            rollup.count += value['count']
+    session.flush()
+
+
+def rebuild_rollups(session):
+    """Recompute every rollup from the transactions table."""
+    session.execute(delete(TransactionRollup))
+    batch = []
+    query = select(Transaction.date, Transaction.amount, Transaction.transaction_type)
+    for row in session.execute(query.execution_options(yield_per=REBUILD_BATCH_SIZE)):
+        batch.append(row)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            apply_rollups(session, batch)
+            batch = []
+    apply_rollups(session, batch)
+    session.commit()
+    logging.info('Rebuilt transaction rollups')
+
+
+def ensure_rollups(session):
+    """Build the rollups for a database that has transactions but no rollups yet."""
+    has_rollups = session.execute(select(func.count()).select_from(TransactionRollup)).scalar()
+    if not has_rollups and session.execute(select(func.count(Transaction.id))).scalar():
+        rebuild_rollups(session)
+
+
+def read_rollups(session, period):
+    """Summary rows (key, total_amount, count) for one period, read from the rollups."""
+    if period == 'type':
+        query = select(
+            TransactionRollup.transaction_type,
+            TransactionRollup.total_amount,
+            TransactionRollup.count,
+        ).where(TransactionRollup.period == 'all').order_by(TransactionRollup.transaction_type)
+    else:
+        query = select(
+            TransactionRollup.bucket,
+            func.sum(TransactionRollup.total_amount),
+            func.sum(TransactionRollup.count),
+        ).where(TransactionRollup.period == period).group_by(
+            TransactionRollup.bucket
+        ).order_by(TransactionRollup.bucket)
+    return session.execute(query).all()
@@ -5,7 +5,25 @@ CREATE TABLE transactions (
     receiver TEXT,
     amount FLOAT,
     date TIMESTAMP,
-    transaction_type TEXT
+    transaction_type TEXT,
+    fingerprint TEXT
 );
 
-CREATE INDEX idx_transaction_message_date ON transactions (message, date);
\ No newline at end of file
+CREATE INDEX idx_transaction_message_date ON transactions (message, date);
+CREATE UNIQUE INDEX ix_transactions_fingerprint ON transactions (fingerprint);
+CREATE INDEX ix_transactions_date_id ON transactions (date, id);
+CREATE INDEX ix_transactions_type_date_id ON transactions (transaction_type, date, id);
+CREATE INDEX ix_transactions_amount ON transactions (amount);
+
+CREATE TABLE transaction_rollups (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    transaction_type TEXT NOT NULL,
+    total_amount BIGINT NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, bucket, transaction_type)
+);
+CREATE TABLE data_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
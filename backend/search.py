@@ -0,0 +1,156 @@
+"""SQLite FTS5 full-text index over smsdata, used by /sms?mode=search.
+
+The index is an external-content FTS5 table: it stores only the index and
+reads the text back from smsdata, keyed on smsdata's integer rowid.
+Triggers keep it in sync, so every insert path (ingestion, migrations,
+manual fixes) updates it in the same transaction as the row itself, and a
+deleted or updated row is removed from the index by rowid rather than by
+scanning it. smsdata has no INTEGER PRIMARY KEY, so VACUUM may renumber
+its rowids; rebuild the index afterwards with
+
+    INSERT INTO smsdata_fts (smsdata_fts) VALUES ('rebuild');
+
+Other databases have no FTS5; there search falls back to the ILIKE filters
+in sms_data.
+"""
+import logging
+import re
+
+from sqlalchemy import column, func, literal_column, table, text
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+FTS_TABLE = "smsdata_fts"
+# Indexed columns, named as in smsdata, so "bank deposit" finds messages by
+# their type or category as well as by their text
+FTS_COLUMNS = ("message", "address", "service_center", "message_type", "category")
+# Prefix lengths FTS5 keeps extra index entries for, so "airt*" is a lookup.
+# FTS5 applies them to every column; message_type and category only add the
+# prefixes of their few distinct words.
+PREFIX_LENGTHS = "3"
+SNIPPET_TOKENS = 12
+
+fts = table(FTS_TABLE, column("rowid"), column("rank"))
+
+_columns = ", ".join(FTS_COLUMNS)
+_new_values = ", ".join(f"new.{name}" for name in FTS_COLUMNS)
+_old_values = ", ".join(f"old.{name}" for name in FTS_COLUMNS)
+_triggers = ("smsdata_fts_insert", "smsdata_fts_delete", "smsdata_fts_update")
+
+SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_columns},
+        content = 'smsdata', content_rowid = 'rowid',
+        tokenize = 'unicode61', prefix = '{PREFIX_LENGTHS}'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS smsdata_fts_insert AFTER INSERT ON smsdata BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, {_columns}) VALUES (new.rowid, {_new_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS smsdata_fts_delete AFTER DELETE ON smsdata BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {_columns})
+        VALUES ('delete', old.rowid, {_old_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS smsdata_fts_update AFTER UPDATE ON smsdata BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {_columns})
+        VALUES ('delete', old.rowid, {_old_values});
+        INSERT INTO {FTS_TABLE} (rowid, {_columns}) VALUES (new.rowid, {_new_values});
+    END
+    """,
+]
+
+
+def has_search_index(engine):
+    return engine.dialect.name == "sqlite"
+
+
+def create_search_index(engine):
+    """Create the FTS5 table and its triggers, indexing existing rows once.
+
+    Safe to run on every startup: the index is only built when the table is
+    created, after that the triggers keep it up to date. An index in an
+    earlier layout (its own copy of the text keyed on the UUID, or other
+    columns) is dropped and rebuilt.
+    """
+    if not has_search_index(engine):
+        return
+    with engine.begin() as conn:
+        existing = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).scalar()
+        if existing is not None and ("content" not in existing or _columns not in existing):
+            for trigger in _triggers:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+            existing = None
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        if existing is None:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"))
+            logging.info(f"Built {FTS_TABLE} from existing smsdata rows")
+
+
+def to_match_query(search):
+    """Turn free text into an FTS5 MATCH expression.
+
+    Each whitespace-separated word becomes a quoted phrase with a prefix
+    marker, and the phrases are ANDed: "airt 1,000" matches messages with a
+    token starting with "airt" and the phrase "1 000". Quoting keeps FTS5
+    operators and punctuation in user input from being parsed as syntax.
+    Returns None when the text has no searchable tokens.
+    """
+    phrases = []
+    for word in search.split():
+        tokens = re.findall(r"\w+", word)
+        if tokens:
+            phrases.append(f'"{" ".join(tokens)}"*')
+    return " ".join(phrases) or None
+
+
+def search_query(model, match, filters, limit):
+    snippet = func.snippet(
+        literal_column(FTS_TABLE), -1, "<mark>", "</mark>", "…", SNIPPET_TOKENS
+    )
+    return (
+        select(model, fts.c.rank, snippet)
+        .join(fts, fts.c.rowid == literal_column(f"{model.__tablename__}.rowid"))
+        .where(literal_column(FTS_TABLE).op("MATCH")(match), *filters)
+        .order_by(fts.c.rank)
+        .limit(limit)
+    )
+
+
+def search_results(rows):
+    return [
+        {**row.public_dict(), "rank": rank, "snippet": highlighted}
+        for row, rank, highlighted in rows
+    ]
+
+
+def search_sms(db: Session, model, search, filters, limit):
+    """Best-ranked SMS matching search, with a highlighted snippet each.
+
+    Results are ordered by FTS5's bm25 rank (best first) and further
+    narrowed by the usual /sms filters. Returns a list of dicts holding the
+    row's fields plus "rank" and "snippet".
+    """
+    match = to_match_query(search or "")
+    if match is None:
+        return []
+    return search_results(db.exec(search_query(model, match, filters, limit)).all())
+
+
+async def search_sms_async(db: AsyncSession, model, search, filters, limit):
+    """search_sms on an AsyncSession."""
+    match = to_match_query(search or "")
+    if match is None:
+        return []
+    rows = await db.exec(search_query(model, match, filters, limit))
+    return search_results(rows.all())
@@ -0,0 +1,218 @@
+"""The smsdata table and the queries the FastAPI app reads it with.
+
+Ingestion (sms_processing.py) writes these tables; the API only needs the
+models, prepare_database and the read paths below, so it can import them
+without loading the XML parser, classifier and writers.
+"""
+import logging
+from datetime import datetime, timedelta
+from functools import reduce
+from typing import ClassVar
+from uuid import UUID, uuid4
+
+from sqlalchemy import BigInteger, Index
+from sqlmodel import Field, Session, SQLModel, col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from migrations import upgrade
+from pagination import count_cache, keyset_after, keyset_order, next_cursor
+from response_cache import create_data_versions, data_version_query
+from search import create_search_index
+from utils import lazy_import
+
+# The transactions tables, loaded by prepare_database when it creates them
+models = lazy_import("models")
+rollups = lazy_import("rollups")
+
+# Errors of the API and of ingestion, and the messages ingestion skips
+log_file = "unprocessed_sms.log"
+
+DEFAULT_PAGE_SIZE = 100
+# Backup ingested by GET / and by ingest.py without --xml
+DEFAULT_XML = "modified_sms_v2.xml"
+
+logging.basicConfig(
+    filename=log_file,
+    level=logging.WARNING,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+
+class SmsData(SQLModel, table=True):
+    # Columns hashed into the fingerprint used to skip duplicate SMS
+    FINGERPRINT_COLUMNS: ClassVar[tuple] = ("message", "date", "date_sent")
+    # Bookkeeping columns left out of API responses and exports
+    INTERNAL_FIELDS: ClassVar[frozenset] = frozenset({"fingerprint"})
+    __table_args__ = (
+        # Keyset pagination order, also serves the /sms date filter
+        Index("ix_smsdata_date_id", "date", "id"),
+        # /sms type and amount filters, in keyset order within each value
+        Index("ix_smsdata_message_type_date_id", "message_type", "date", "id"),
+        Index("ix_smsdata_amount_date_id", "amount", "date", "id"),
+    )
+
+    id: UUID = Field(
+        default_factory=uuid4, primary_key=True, unique=True, nullable=False
+    )
+    address: str = Field(nullable=True)
+    date_sent: datetime = Field(nullable=True)
+    message: str = Field(nullable=True)
+    service_center: str = Field(nullable=True)
+    amount: float = Field(nullable=True)
+    # Also read from the message text, see message_fields.py
+    fee: float = Field(default=None, nullable=True)
+    balance: float = Field(default=None, nullable=True)
+    txid: int = Field(default=None, nullable=True, sa_type=BigInteger)
+    message_type: str = Field(nullable=True)
+    category: str = Field(nullable=True)
+    date: datetime = Field(nullable=True)
+    fingerprint: str = Field(default=None, nullable=True, unique=True, index=True)
+
+    @staticmethod
+    def search():
+        return [
+            SmsData.address,
+            SmsData.message,
+            SmsData.service_center,
+            SmsData.message_type,
+            SmsData.category,
+        ]
+
+    @classmethod
+    def public_fields(cls):
+        return [name for name in cls.model_fields if name not in cls.INTERNAL_FIELDS]
+
+    def public_dict(self, mode="python"):
+        """The row as served by /sms, /sms/all and /export."""
+        return self.model_dump(mode=mode, exclude=self.INTERNAL_FIELDS)
+
+
+class IngestionState(SQLModel, table=True):
+    """How far ingestion of a backup file has got, so reruns can resume."""
+
+    __tablename__ = "ingestion_state"
+
+    file_path: str = Field(primary_key=True)
+    file_size: int = Field(default=None, nullable=True, sa_type=BigInteger)
+    file_mtime: float = Field(default=None, nullable=True)
+    # Raw epoch-millis date and byte offset of the last SMS handled
+    last_date: int = Field(default=None, nullable=True, sa_type=BigInteger)
+    byte_offset: int = Field(default=0, sa_type=BigInteger)
+    completed: bool = Field(default=False)
+    updated_at: datetime = Field(default=None, nullable=True)
+
+
+def prepare_database(engine, transactions=False, sms=True):
+    """Create or upgrade the tables ingestion writes: smsdata, transactions or both."""
+    create_data_versions(engine)
+    if sms:
+        SQLModel.metadata.create_all(engine)
+        upgrade(engine, [SmsData, IngestionState])
+        create_search_index(engine)
+    if transactions:
+        models.Base.metadata.create_all(engine)
+        upgrade(engine, [models.Transaction, models.TransactionRollup])
+        with Session(engine) as db:
+            rollups.ensure_rollups(db)
+
+
+def get_search_query(table_model, search: str):
+    search_where = list(
+        map(lambda x: col(x).ilike(f"%{search}%"), table_model.search())
+    )
+    return reduce(lambda x, y: x | y, search_where)
+
+
+def get_sms_filters(search, type, date, amount):
+    fetching_query = []
+
+    if type:
+        fetching_query.append(SmsData.message_type == type)
+    # Add date filter as a half-open range so the date index can be used
+    if date:
+        day_start = datetime.combine(date, datetime.min.time())
+        fetching_query.append(SmsData.date >= day_start)
+        fetching_query.append(SmsData.date < day_start + timedelta(days=1))
+    if amount:
+        fetching_query.append(SmsData.amount == amount)
+
+    if search and len(search) > 0:
+        search_query = get_search_query(SmsData, search)
+        fetching_query.append(search_query)
+
+    return fetching_query
+
+
+def sms_page_query(filters, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One keyset page of SMS ordered by (date, id), plus one row to detect more."""
+    query = select(SmsData).where(*filters)
+    if cursor:
+        query = query.where(keyset_after(SmsData.date, SmsData.id, cursor, UUID))
+    return query.order_by(*keyset_order(SmsData.date, SmsData.id)).limit(limit + 1)
+
+
+def sms_count_query(filters):
+    return select(func.count()).select_from(SmsData).where(*filters)
+
+
+def paginate_sms(db: Session, filters, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Fetch one keyset page of SMS ordered by (date, id).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    rows = db.exec(sms_page_query(filters, cursor, limit)).all()
+    return rows[:limit], next_cursor(rows, limit)
+
+
+async def paginate_sms_async(
+    db: AsyncSession, filters, cursor=None, limit=DEFAULT_PAGE_SIZE
+):
+    """paginate_sms on an AsyncSession."""
+    rows = (await db.exec(sms_page_query(filters, cursor, limit))).all()
+    return rows[:limit], next_cursor(rows, limit)
+
+
+def count_sms(db: Session, filters, cache_key):
+    """Total number of SMS matching filters, served from the count cache."""
+    version = db.exec(data_version_query("smsdata")).first() or 0
+    return count_cache.get(
+        ("smsdata", version, *cache_key), lambda: db.exec(sms_count_query(filters)).one()
+    )
+
+
+async def count_sms_async(db: AsyncSession, filters, cache_key):
+    """count_sms on an AsyncSession."""
+    version = (await db.exec(data_version_query("smsdata"))).first() or 0
+
+    async def compute():
+        return (await db.exec(sms_count_query(filters))).one()
+
+    return await count_cache.get_async(("smsdata", version, *cache_key), compute)
+
+
+def get_all_sms(
+    db: Session,
+    search,
+    type,
+    date,
+    amount,
+    cursor=None,
+    limit=DEFAULT_PAGE_SIZE,
+):
+    """Return one page of filtered SMS as (rows, next_cursor)."""
+    filters = get_sms_filters(search, type, date, amount)
+    return paginate_sms(db, filters, cursor, limit)
+
+
+async def get_all_sms_async(
+    db: AsyncSession,
+    search,
+    type,
+    date,
+    amount,
+    cursor=None,
+    limit=DEFAULT_PAGE_SIZE,
+):
+    """get_all_sms on an AsyncSession."""
+    filters = get_sms_filters(search, type, date, amount)
+    return await paginate_sms_async(db, filters, cursor, limit)
@@ -1,43 +1,32 @@
 import logging
-import re
-import xml.etree.ElementTree as ET
+import os
+import time
+from contextlib import nullcontext
 from datetime import datetime
-from functools import reduce
-from uuid import UUID, uuid4
-
-from sqlmodel import Date, Field, Session, SQLModel, cast, col, select, text
-
-log_file = "unprocessed_sms.log"
-
-logging.basicConfig(
-    filename=log_file,
-    level=logging.WARNING,
-    format="%(asctime)s - %(levelname)s - %(message)s",
+from uuid import uuid4
+
+from sqlmodel import Session, col, select
+
+from bulk_writer import DEFAULT_BATCH_SIZE, BulkWriter
+from classifier import classify
+from message_fields import extract_amount, extract_fields, field_values
+from parallel import DEFAULT_CHUNK_SIZE, chunked, map_chunks
+from parse_xml import is_sms_offset, iter_sms_records
+from profiling import StageProfiler, profile_to
+from records import SmsRecord
+from response_cache import bump_data_version
+from sms_data import DEFAULT_XML, IngestionState, SmsData, log_file
+from sms_transactions import (
+    TransactionBatches,
+    TransactionWriter,
+    advance_synced_version,
+    backfill_pending,
 )
+from timestamps import epoch_ms_to_datetimes
+from utils import fingerprint, peak_rss_mb, throughput
 
-
-class SmsData(SQLModel, table=True):
-    id: UUID = Field(
-        default_factory=uuid4, primary_key=True, unique=True, nullable=False
-    )
-    address: str = Field(nullable=True)
-    date_sent: datetime = Field(nullable=True)
-    message: str = Field(nullable=True)
-    service_center: str = Field(nullable=True)
-    amount: float = Field(nullable=True)
-    message_type: str = Field(nullable=True)
-    category: str = Field(nullable=True)
-    date: datetime = Field(nullable=True)
-
-    @staticmethod
-    def search():
-        return [
-            SmsData.address,
-            SmsData.message,
-            SmsData.service_center,
-            SmsData.message_type,
-            SmsData.category,
-        ]
+# Outcomes of parsing a single <sms> element
+PARSED, UNKNOWN, FAILED = "parsed", "unknown", "failed"
 
 
 class SMSProcessor:
@@ -45,9 +34,20 @@ class SMSProcessor:
     data in the db, it contains a method for creating a db connection
     """
 
-    DEFAULT_XML = "modified_sms_v2.xml"
-
-    def __init__(self, db: Session, xml_file=DEFAULT_XML, log_file=log_file):
+    DEFAULT_XML = DEFAULT_XML
+
+    def __init__(
+        self,
+        db: Session,
+        xml_file=DEFAULT_XML,
+        log_file=log_file,
+        batch_size=DEFAULT_BATCH_SIZE,
+        workers=1,
+        profile=None,
+        profiler="cprofile",
+        transactions=False,
+        sms=True,
+    ):
         """
         Initialize the SMSProcessor with an XML file, database configuration, and a log file.
 
@@ -55,13 +55,32 @@ class SMSProcessor:
             xml_file (str): Path to the XML file.
             db_config (dict): Database configuration with keys 'host', 'user', 'password', 'database'.
             log_file (str): Path to the log file for unprocessed SMS messages.
+            batch_size (int): Number of rows written per insert transaction.
+            workers (int): Processes used to parse and classify messages.
+            profile (str): Optional path to write a profile of each ingest to.
+            profiler (str): "cprofile" (a .prof file) or "pyinstrument" (HTML).
+            transactions (bool): Also write the transactions table of the Flask
+                app, in the same pass and transactions (see sms_transactions.py).
+            sms (bool): Write smsdata (and its search index). With sms=False
+                and transactions=True only transactions are written, and no
+                checkpoint is kept.
         """
 
+        if not (sms or transactions):
+            raise ValueError("Nothing to write: sms and transactions are both off")
         self.xml_file = xml_file
         self.db = db
         self.log_file = log_file
+        self.batch_size = batch_size
+        self.workers = workers
+        self.profile = profile
+        self.profiler = profiler
+        self.transactions = transactions
+        self.sms = sms
+        self.fingerprints = None
 
-    def parse_message(self, message):
+    @staticmethod
+    def parse_message(message):
         """
         Parse the message to extract amount, message_type, and category.
 
@@ -77,194 +96,301 @@ class SMSProcessor:
 
         try:
             # Extract amount associated with each transaction
-            amount_search = re.search(r"(\d+(?:,\d{3})*)\s*RWF", message)
+            amount = extract_amount(message)
 
-            if amount_search:
-
-                amount = float(amount_search.group(1).replace(",", ""))
-            else:
-                amount = None
-
-            # Determine type and category based on keywords
-            # Incoming Money
-            if "received" in message.lower():
-                category = "Coming"
-                message_type_ = "Incoming Money"
-
-            # Transfers To Mobile Numbers
-            elif "transferred" in message.lower():
-                category = "Going"
-                message_type_ = "Transfers To Mobile Numbers"
-
-            # Payments to Code Holders
-            elif "payment" in message.lower():
-                category = "Going"
-                message_type_ = "Payments to Code Holders"
-
-            # Bank Deposits
-            elif "bank deposit" in message.lower():
-                category = "Coming"
-                message_type_ = "Bank Deposits"
-
-            # Airtime Bill Payments
-            elif "to Airtime" in message.lower():
-                category = "Going"
-                message_type_ = "Airtime Bill Payments"
-
-            # Cash Power Bill Payments
-            elif "Cash Power" in message.lower():
-                category = "Going"
-                message_type_ = "Cash Power Bill Payments"
-
-            # Transactions Initiated by Third Parties
-            elif "a transaction of" in message.lower():
-                category = "Going"
-                message_type_ = "Transactions Initiated by Third Parties"
-
-            # Withdrawals from Agents
-            elif "agent" in message.lower():
-                category = "Going"
-                message_type_ = "Withdrawals from Agents"
-
-            # Internet and Voice Bundle Purchases
-            elif "kugura" in message.lower():
-                category = "Going"
-                message_type_ = "Internet and Voice Bundle Purchases"
-
-            elif "failed" in message.lower():
-                category = "No change"
-                message_type_ = "Failed Transactions"
-
-            elif "reversed" in message.lower() or "reversal" in message.lower():
-                category = "both ways"
-                message_type_ = "Reversed Transactions"
-
-            else:
-                category = "Unknown"
-                message_type_ = "Unknown"
+            # Determine type and category from the shared rule table
+            message_type_, category = classify(message)
         except Exception as e:
             logging.warning(f"Error parsing message: {message}. Error: {e}")
         return amount, message_type_, category
 
-    def is_duplicates(self, message, date, date_sent) -> bool:
-        """Check if the SMS already exists in the database to avoid duplicates."""
-
-        query = select(SmsData).where(
-            SmsData.message == message,
-            SmsData.date == date,
-            SmsData.date_sent == date_sent,
+    def load_fingerprints(self):
+        """Load the fingerprints of every stored SMS, once per ingestion run."""
+        if not self.sms:
+            # Only repeats within the run; TransactionWriter skips stored rows
+            self.fingerprints = set()
+            return
+        self.fingerprints = set(
+            self.db.exec(
+                select(SmsData.fingerprint).where(col(SmsData.fingerprint).is_not(None))
+            ).all()
         )
 
-        result = self.db.exec(query).first()
-
-        return result if result else False
+    def get_ingestion_state(self):
+        """Return the stored ingestion state for the XML file, creating it if new."""
+        path = os.path.abspath(self.xml_file)
+        if not self.sms:
+            # Checkpoints track smsdata; a transactions-only run reads the whole file
+            return IngestionState(file_path=path)
+        return self.db.get(IngestionState, path) or IngestionState(file_path=path)
+
+    def save_checkpoint(self, state, offset, last_date, completed=False):
+        """Record how far ingestion got. Called after each committed batch."""
+        if not self.sms:
+            return
+        stat = os.stat(self.xml_file)
+        state.file_size = stat.st_size
+        state.file_mtime = stat.st_mtime
+        state.byte_offset = offset
+        state.last_date = last_date
+        state.completed = completed
+        state.updated_at = datetime.now()
+        self.db.add(state)
+        self.db.commit()
+
+    def iter_new_records(self, state):
+        """Stream (offset, attributes) for SMS not yet handled by an earlier run.
+
+        Resumes right after the checkpointed SMS when the file still has it at
+        the stored offset, e.g. after an interrupted run or when messages were
+        appended to the backup. Otherwise the whole file is read again and the
+        fingerprint check skips what is already stored.
+        """
+        if state.byte_offset and is_sms_offset(self.xml_file, state.byte_offset):
+            records = iter_sms_records(self.xml_file, start=state.byte_offset)
+            first = next(records, None)
+            if first is not None and first[1].get("date") == str(state.last_date):
+                logging.info(
+                    f"Resuming {self.xml_file} from byte offset {state.byte_offset}"
+                )
+                return records
+        return iter_sms_records(self.xml_file)
+
+    def select_new_rows(self, results):
+        """Rows to store for a chunk of parse results, None for the rest.
+
+        Unknown messages are logged to log_file and duplicates of stored or
+        earlier rows are dropped; both count as skipped. Returns the rows,
+        aligned with results, and the number skipped.
+        """
+        rows = []
+        skipped = 0
+        for _, _, outcome, payload in results:
+            row = None
+            if outcome == FAILED:
+                logging.error(f"Error processing SMS: {payload}")
+            elif outcome == UNKNOWN:
+                # Log unprocessed messages
+                logging.warning(f"Unprocessed message: {payload.get('body', '')}")
+                with open(self.log_file, "a") as log:
+                    log.write(f"{payload}\n")
+                skipped += 1
+            elif payload.fingerprint in self.fingerprints:
+                logging.warning(f"Duplicate SMS detected and skipped: {payload.message}")
+                skipped += 1
+            else:
+                # Rows still waiting in the writer count as seen too
+                self.fingerprints.add(payload.fingerprint)
+                row = payload
+                if self.sms:
+                    row.id = uuid4()
+            rows.append(row)
+        return rows, skipped
+
+    def is_unchanged(self, state):
+        if not state.completed:
+            return False
+        stat = os.stat(self.xml_file)
+        return state.file_size == stat.st_size and state.file_mtime == stat.st_mtime
+
+    def process_and_store_sms(self, progress=None):
+        """Stream the XML file and store SMS data into the database.
+
+        The backup is parsed incrementally, so memory use does not grow with
+        the size of the file. Each chunk of records goes through the stages
+        one after another (read, timestamps, fields, classify, fingerprint,
+        dedup, write), and the result has their wall time, CPU time and item
+        counts under "stages". A checkpoint is saved after every committed
+        batch: a rerun on an unchanged file returns straight away and an
+        interrupted run picks up where it stopped. SMS stored by an earlier
+        smsdata-only run are backfilled into transactions first, only when
+        the high-water mark says there are any (see sms_transactions.py).
+        The result reports the ingest throughput and the peak RSS of the
+        process.
 
-    def process_and_store_sms(self):
-        """Parse the XML file and store SMS data into the database."""
+        Args:
+            progress (callable): Optional progress(offset, records, processed,
+                skipped), called every batch_size records and at the end.
+        """
         try:
             logging.info(f"Starting to process SMS data from {self.xml_file}")
-            tree = ET.parse(self.xml_file)
-            root = tree.getroot()
-            processed_count = 0
+            started = time.perf_counter()
+            state = self.get_ingestion_state()
+            unchanged = self.is_unchanged(state)
+            backfill = self.transactions and self.sms and backfill_pending(self.db)
+            if unchanged and not backfill:
+                result = {"message": "No new SMS data",
+                          "processed": 0,
+                          "skipped": 0,
+                          "elapsed_seconds": round(time.perf_counter() - started, 3)}
+                if self.transactions:
+                    result["transactions"] = 0
+                return result
+            transactions = TransactionWriter(self.db) if self.transactions else None
+            if backfill:
+                # SMS stored by runs that did not write transactions
+                backfilled = transactions.backfill(self.db, SmsData, self.batch_size)
+                if backfilled:
+                    logging.info(f"Wrote {backfilled} transactions for stored SMS")
+            if unchanged:
+                result = {"message": "No new SMS data",
+                          "processed": 0,
+                          "skipped": 0,
+                          "elapsed_seconds": round(time.perf_counter() - started, 3)}
+                if transactions:
+                    result["transactions"] = transactions.written
+                return result
+
+            record_count = 0
             skipped_count = 0
-            
-            for sms in root.findall("sms"):
-                try:
-                    address = sms.attrib.get("address", "")
-                    message = sms.attrib.get("body", "")
-                    service_center = sms.attrib.get("service_center", "")
-                    date = datetime.fromtimestamp(
-                        int(sms.attrib["date"]) / 1000
-                    ).strftime("%Y-%m-%d%H:%M:%S")
-                    date_sent = datetime.fromtimestamp(
-                        int(sms.attrib["date_sent"]) / 1000
-                    ).strftime("%Y-%m-%d%H:%M:%S")
-
-                    date = datetime.strptime(date, "%Y-%m-%d%H:%M:%S")
-                    date_sent = datetime.strptime(date_sent, "%Y-%m-%d%H:%M:%S")
-
-                    # Parse message to extract additional fields
-                    amount, message_type_, category = self.parse_message(message)
-                    if message_type_ == "Unknown":
-                        # Log unprocessed messages
-                        logging.warning(f"Unprocessed message: {message}")
-                        with open(self.log_file, "a") as log:
-                            log.write(f"{sms.attrib}\n")
-                        skipped_count += 1
-                        continue
-
-                    if self.is_duplicates(message, date, date_sent):
-                        logging.warning(
-                            f"Duplicate SMS detected and skipped: {message}"
-                        )
-                        skipped_count += 1
-                        continue
-
-                    # Insert into the database
-                    add_sms = SmsData(
-                        address=address,
-                        date_sent=date_sent,
-                        date=date,
-                        message=message,
-                        service_center=service_center,
-                        amount=amount,
-                        message_type=message_type_,
-                        category=category,
-                    )
-                    self.db.add(add_sms)
-                    self.db.commit()
-                    processed_count += 1
-                    
-                    logging.info(f"Processed SMS: {message} - Type: {message_type_}")
-                except Exception as e:
-                    logging.error(f"Error processing SMS: {e}")
-                    self.db.rollback()
-                    continue
-            
-            logging.info(f"Processing complete. Processed: {processed_count}, Skipped: {skipped_count}")
-            return {"message": "Data stored successfully", 
-                   "processed": processed_count, 
-                   "skipped": skipped_count}
+            profiler = StageProfiler()
+
+            def after_write(session, rows):
+                record_batch(session, rows)
+                if transactions:
+                    transactions(session, rows)
+                    advance_synced_version(session)
+
+            if self.sms:
+                writer = BulkWriter(
+                    self.db,
+                    SmsData,
+                    batch_size=self.batch_size,
+                    ignore_conflicts=True,
+                    after_write=after_write,
+                )
+            else:
+                writer = TransactionBatches(self.db, transactions, self.batch_size)
+            self.load_fingerprints()
+            records = self.iter_new_records(state)
+            last_offset, last_date = state.byte_offset, state.last_date
+
+            chunks = profiler.iterate("read", chunked(records, DEFAULT_CHUNK_SIZE))
+            parsed = map_chunks(profiled_sms_chunk, chunks, self.workers)
+
+            # Parsing may run in worker processes; this loop owns the session
+            dump = profile_to(self.profile, self.profiler) if self.profile else nullcontext()
+            with dump:
+                for results, chunk_profile in parsed:
+                    profiler.merge(chunk_profile)
+                    with profiler.stage("dedup", len(results)):
+                        rows, skipped = self.select_new_rows(results)
+                    skipped_count += skipped
+
+                    with profiler.stage("write", len(results)):
+                        for (offset, date_attr, _, _), row in zip(results, rows):
+                            if writer.full:
+                                writer.flush()
+                                self.save_checkpoint(state, last_offset, last_date)
+                            record_count += 1
+                            last_offset = offset
+                            last_date = int(date_attr) if date_attr.isdigit() else None
+                            if progress and record_count % self.batch_size == 0:
+                                progress(offset, record_count, writer.written, skipped_count)
+                            if row is None:
+                                continue
+
+                            # Queue for the next batch insert
+                            writer.add(row)
+                            logging.info(
+                                f"Processed SMS: {row.message} - Type: {row.message_type}"
+                            )
+
+                with profiler.stage("write"):
+                    writer.flush()
+                    self.save_checkpoint(state, last_offset, last_date, completed=True)
+            processed_count = writer.written
+            if progress:
+                progress(last_offset, record_count, processed_count, skipped_count)
+            elapsed = time.perf_counter() - started
+            records_per_sec = throughput(record_count, elapsed)
+            peak_rss = peak_rss_mb()
+            logging.info(
+                f"Processing complete. Processed: {processed_count}, Skipped: {skipped_count}, "
+                f"{records_per_sec} records/sec, peak RSS {peak_rss} MB\n{profiler.table()}"
+            )
+            result = {"message": "Data stored successfully",
+                      "processed": processed_count,
+                      "skipped": skipped_count,
+                      "elapsed_seconds": round(elapsed, 3),
+                      "records_per_sec": records_per_sec,
+                      "peak_rss_mb": peak_rss,
+                      "stages": profiler.summary()}
+            if transactions:
+                result["transactions"] = transactions.written
+            return result
         except Exception as e:
             logging.error(f"Error processing XML file: {e}")
             return {"error": f"Failed to process XML file: {str(e)}"}
 
-    def data(self):
-        try:
-            # Get all SMS data from the database
-            results = self.db.exec(select(SmsData)).all()
-            return results
-        except Exception as e:
-            logging.error(f"Error fetching data: {e}")
-            return []
-
-
-def get_search_query(table_model, search: str):
-    search_where = list(
-        map(lambda x: col(x).ilike(f"%{search}%"), table_model.search())
-    )
-    return reduce(lambda x, y: x | y, search_where)
-
-
-def get_all_sms(
-    db: Session,
-    search,
-    type,
-    date,
-    amount,
-):
-    fetching_query = []
-
-    if type:
-        fetching_query.append(SmsData.message_type == type)
-    # Add date filter
-    if date:
-        fetching_query.append(cast(SmsData.date, Date) == date)
-    if amount:
-        fetching_query.append(SmsData.amount == amount)
-
-    if search and len(search) > 0:
-        search_query = get_search_query(SmsData, search)
-        fetching_query.append(search_query)
-
-    return db.exec(select(SmsData).where(*fetching_query)).all()
+
+def record_batch(session, rows):
+    """Runs in each batch's transaction so cached /sms responses are invalidated."""
+    bump_data_version(session, "smsdata")
+
+
+def parse_sms(sms):
+    """Turn the attributes of one <sms> element into a smsdata row.
+
+    Returns an (outcome, payload) pair: the SmsRecord for PARSED, the raw
+    attributes for UNKNOWN messages and the error text for FAILED ones.
+    """
+    _, _, outcome, payload = parse_sms_chunk([(None, sms)])[0]
+    return outcome, payload
+
+
+def parse_sms_chunk(records, profiler=None):
+    """Parse a list of (offset, attributes) pairs, one stage at a time.
+
+    Each stage runs over the whole chunk before the next one starts, and is
+    timed in profiler when one is given. Returns (offset, date attribute,
+    outcome, payload) for every record, as described in parse_sms.
+    """
+    profiler = profiler or StageProfiler()
+    count = len(records)
+    bodies = [sms.get("body", "") for _, sms in records]
+
+    with profiler.stage("timestamps", count):
+        dates = epoch_ms_to_datetimes([sms.get("date") for _, sms in records])
+        dates_sent = epoch_ms_to_datetimes([sms.get("date_sent") for _, sms in records])
+
+    with profiler.stage("fields", count):
+        fields = extract_fields(bodies)
+        amounts, fees, balances, txids = map(field_values, fields)
+
+    with profiler.stage("classify", count):
+        kinds = [classify(body) for body in bodies]
+
+    results = []
+    with profiler.stage("fingerprint", count):
+        for index, (offset, sms) in enumerate(records):
+            date_attr = sms.get("date", "")
+            message_type_, category = kinds[index]
+            if dates[index] is None or dates_sent[index] is None:
+                error = f"Invalid timestamp: date={date_attr!r}, date_sent={sms.get('date_sent')!r}"
+                results.append((offset, date_attr, FAILED, error))
+            elif message_type_ == "Unknown":
+                results.append((offset, date_attr, UNKNOWN, sms))
+            else:
+                message, date, date_sent = bodies[index], dates[index], dates_sent[index]
+                results.append((offset, date_attr, PARSED, SmsRecord(
+                    address=sms.get("address", ""),
+                    date_sent=date_sent,
+                    date=date,
+                    message=message,
+                    service_center=sms.get("service_center", ""),
+                    amount=amounts[index],
+                    fee=fees[index],
+                    balance=balances[index],
+                    txid=txids[index],
+                    message_type=message_type_,
+                    category=category,
+                    fingerprint=fingerprint(message, date, date_sent),
+                )))
+    return results
+
+
+def profiled_sms_chunk(records):
+    """parse_sms_chunk for map_chunks: the chunk's results with their stage timings."""
+    profiler = StageProfiler()
+    return [(parse_sms_chunk(records, profiler), profiler)]
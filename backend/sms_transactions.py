@@ -0,0 +1,204 @@
+"""The transactions rows written by SMSProcessor, with or without smsdata.
+
+The FastAPI app reads smsdata and the Flask app reads transactions. Both
+are filled by SMSProcessor: with transactions=True every smsdata batch is
+followed, inside the same database transaction, by the transactions rows
+derived from it, so a backup is read, parsed, classified and fingerprinted
+once for both apps. The transactions rollups and data version are updated
+in that transaction too. With sms=False only transactions are written
+(TransactionBatches), which is what load_data does for the Flask app.
+
+SMS stored without transactions (an smsdata-only run) are picked up by
+TransactionWriter.backfill on the next run that writes both. To tell when
+that is needed without scanning smsdata, data_versions keeps a high-water
+mark, SYNCED_VERSION: the smsdata version up to which every row has its
+transactions. Batches written with transactions move it along with the
+smsdata version; batches written without leave it behind.
+
+A transactions row is the smsdata row with the receiver parsed out of the
+body, the amount in whole RWF and its own (message, date) fingerprint.
+Unknown messages are never stored in either table.
+
+    python ingest.py --xml modified_sms_v2.xml --transactions
+"""
+from sqlalchemy import and_, exists, insert, select, update
+
+from bulk_writer import insert_ignoring_conflicts
+from models import Transaction
+from parse_xml import parse_receiver
+from records import TransactionRecord
+from response_cache import bump_data_version, data_version_query, data_versions
+from rollups import apply_rollups
+from utils import fingerprint
+
+# data_versions entry holding the smsdata version covered by transactions
+SYNCED_VERSION = "smsdata_transactions"
+
+
+def backfill_pending(session):
+    """Whether smsdata may have rows without transactions, i.e. it is past the mark."""
+    synced = session.execute(data_version_query(SYNCED_VERSION)).scalar()
+    current = session.execute(data_version_query("smsdata")).scalar() or 0
+    # No mark yet: the rows predate it, so check them once
+    return synced is None or synced < current
+
+
+def advance_synced_version(session):
+    """Keep the mark level with the smsdata version just bumped in this transaction.
+
+    Only moves it when it had caught up before the bump, so rows an
+    smsdata-only run stored earlier still count as pending.
+    """
+    current = data_version_query("smsdata").scalar_subquery()
+    session.execute(
+        update(data_versions)
+        .where(data_versions.c.name == SYNCED_VERSION, data_versions.c.version == current - 1)
+        .values(version=current)
+    )
+
+
+def set_synced_version(session, version):
+    updated = session.execute(
+        update(data_versions)
+        .where(data_versions.c.name == SYNCED_VERSION)
+        .values(version=version)
+    )
+    if updated.rowcount == 0:
+        session.execute(insert(data_versions).values(name=SYNCED_VERSION, version=version))
+
+
+def transaction_from_sms(row):
+    """The TransactionRecord for a parsed smsdata row."""
+    transaction = TransactionRecord(
+        message=row.message,
+        sender=row.address or None,
+        receiver=parse_receiver(row.message),
+        amount=int(row.amount) if row.amount is not None else None,
+        date=row.date,
+        transaction_type=row.message_type,
+    )
+    transaction.fingerprint = fingerprint(
+        *(getattr(transaction, column) for column in Transaction.FINGERPRINT_COLUMNS)
+    )
+    return transaction
+
+
+class TransactionWriter:
+    """Writes the transactions for each batch of smsdata rows BulkWriter stores.
+
+    Call it from BulkWriter's after_write, so the rows share the batch's
+    transaction. Fingerprints of the transactions stored before the run are
+    loaded once and skipped; anything else that collides with the unique
+    fingerprint (two messages differing only in date_sent) is dropped by the
+    database, and only the rows it actually inserted reach the rollups.
+    """
+
+    def __init__(self, session):
+        self.statement = insert_ignoring_conflicts(
+            Transaction.__table__, session.get_bind().dialect.name
+        )
+        self.stored = set(
+            session.scalars(
+                select(Transaction.fingerprint).where(Transaction.fingerprint.isnot(None))
+            )
+        )
+        self.written = 0
+
+    def __call__(self, session, rows):
+        transactions = {}
+        for row in rows:
+            transaction = transaction_from_sms(row)
+            if transaction.fingerprint not in self.stored:
+                transactions.setdefault(transaction.fingerprint, transaction)
+        if not transactions:
+            return
+        inserted = self._insert(session, list(transactions.values()))
+        if inserted:
+            apply_rollups(session, inserted)
+            bump_data_version(session, "transactions")
+            self.written += len(inserted)
+
+    def backfill(self, session, model, batch_size):
+        """Write the transactions missing for smsdata rows, e.g. from smsdata-only runs.
+
+        Reads the rows of model (SmsData) that have no transaction with the
+        same message and date, in id order and batch_size rows at a time,
+        committing after each batch, then moves the high-water mark to the
+        smsdata version read at the start. Returns the number of
+        transactions written. Callers check backfill_pending first, as this
+        reads all of smsdata.
+        """
+        written = self.written
+        version = session.execute(data_version_query("smsdata")).scalar() or 0
+        missing = ~exists().where(
+            and_(
+                Transaction.date.is_not_distinct_from(model.date),
+                Transaction.message == model.message,
+            )
+        )
+        last_id = None
+        while True:
+            query = select(
+                model.id, model.message, model.address, model.amount, model.date,
+                model.message_type,
+            ).where(missing).order_by(model.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(model.id > last_id)
+            rows = session.execute(query).all()
+            if not rows:
+                set_synced_version(session, version)
+                session.commit()
+                return self.written - written
+            self(session, rows)
+            session.commit()
+            last_id = rows[-1].id
+
+    def _insert(self, session, transactions):
+        """Insert the rows and return the ones the database kept."""
+        savepoint = session.begin_nested()
+        result = session.execute(self.statement, [t.as_dict() for t in transactions])
+        if result.rowcount < 0 or result.rowcount == len(transactions):
+            savepoint.commit()
+            return transactions
+        # Some rows were conflicts and there is no telling which, so undo
+        # the insert, keeping the smsdata rows, and redo it row by row
+        savepoint.rollback()
+        return [t for t in transactions if session.execute(self.statement, [t.as_dict()]).rowcount]
+
+
+class TransactionBatches:
+    """BulkWriter's interface over TransactionWriter, for runs without smsdata.
+
+    Parsed smsdata rows are queued and every batch_size of them becomes a
+    batch of transactions, committed with its rollups.
+    """
+
+    def __init__(self, session, transactions, batch_size):
+        self.session = session
+        self.transactions = transactions
+        self.batch_size = batch_size
+        self.pending = []
+
+    @property
+    def written(self):
+        return self.transactions.written
+
+    @property
+    def full(self):
+        return len(self.pending) >= self.batch_size
+
+    def add(self, row):
+        if self.full:
+            self.flush()
+        self.pending.append(row)
+
+    def flush(self):
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        try:
+            self.transactions(self.session, rows)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
@@ -0,0 +1,168 @@
+"""Columnar snapshots of the transactions table, rewritten after every ingest.
+
+Each snapshot is a directory holding:
+
+- parquet/, the cleaned transactions as a Parquet dataset partitioned by
+  month and transaction_type (month=2024-05/transaction_type=.../*.parquet),
+  for pandas, DuckDB or Spark;
+- columns.arrow, an uncompressed Arrow IPC file of the three columns the
+  summaries need, which analytics.py memory-maps.
+
+columns.arrow follows the rollup conventions: a missing amount counts as 0,
+a missing type as "" and a missing date as NO_DATE, so its columns have no
+nulls and map straight onto NumPy arrays without a copy.
+
+Snapshots are written to a new directory and published by replacing the
+CURRENT file with its name, so readers never see a half-written one. pyarrow
+is optional; without it no snapshot is written.
+
+    python snapshot.py            # snapshot the database in DATABASE_URL
+"""
+import logging
+import os
+import shutil
+import time
+
+from sqlalchemy import create_engine, select
+
+from config import Config
+from models import Transaction
+from response_cache import read_data_version
+from utils import lazy_import
+
+# Optional, snapshots are skipped without them. Loaded on first use, and the
+# pyarrow submodules only by the functions that write snapshots, so that
+# importing the API does not load them.
+np = lazy_import("numpy")
+pa = lazy_import("pyarrow")
+
+CURRENT = "CURRENT"
+COLUMNS_FILE = "columns.arrow"
+PARQUET_DIR = "parquet"
+# Rows read from the database per Arrow record batch
+SNAPSHOT_BATCH_SIZE = 50000
+# Earlier snapshots kept for readers that still have them open
+KEEP_SNAPSHOTS = 2
+# date_seconds of transactions without a date
+NO_DATE = -(2**63)
+
+EXPORT_COLUMNS = ("id", "message", "sender", "receiver", "amount", "date", "transaction_type")
+
+
+def available():
+    return np is not None and pa is not None
+
+
+def current_path(directory):
+    """Path of the published snapshot in directory, or None if there is none."""
+    try:
+        with open(os.path.join(directory, CURRENT), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+
+def _record_batches(engine, schema, analytic):
+    """Stream transactions as record batches, collecting the analytic columns."""
+    import pyarrow.compute as pc
+
+    query = select(*(getattr(Transaction, name) for name in EXPORT_COLUMNS)).order_by(
+        Transaction.date, Transaction.id
+    )
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=SNAPSHOT_BATCH_SIZE).execute(query)
+        for rows in result.partitions():
+            columns = dict(zip(EXPORT_COLUMNS, zip(*rows)))
+            batch = pa.RecordBatch.from_pydict(
+                {
+                    **columns,
+                    "month": [d.strftime("%Y-%m") if d else None for d in columns["date"]],
+                },
+                schema=schema,
+            )
+            # Wall-clock seconds: naive dates are stored as if they were UTC
+            seconds = pc.divide(batch.column("date").cast(pa.int64()), 1_000_000)
+            analytic["date_seconds"].append(seconds.fill_null(NO_DATE).to_numpy())
+            analytic["amount"].append(batch.column("amount").fill_null(0).to_numpy())
+            analytic["transaction_type"].append(batch.column("transaction_type").fill_null(""))
+            yield batch
+
+
+def write_snapshot(engine, directory):
+    """Write a snapshot of the transactions in engine and publish it.
+
+    Returns the snapshot's path, or None when pyarrow is not installed.
+    """
+    if not available():
+        logging.info("pyarrow is not installed, skipping the analytics snapshot")
+        return None
+    import pyarrow.dataset as ds
+
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    version = read_data_version(engine, "transactions")
+    name = f"v{version}-{time.time_ns()}"
+    path = os.path.join(directory, name)
+
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("message", pa.string()),
+            ("sender", pa.string()),
+            ("receiver", pa.string()),
+            ("amount", pa.int64()),
+            ("date", pa.timestamp("us")),
+            ("transaction_type", pa.string()),
+            ("month", pa.string()),
+        ]
+    )
+    analytic = {"date_seconds": [], "amount": [], "transaction_type": []}
+    ds.write_dataset(
+        _record_batches(engine, schema, analytic),
+        os.path.join(path, PARQUET_DIR),
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([("month", pa.string()), ("transaction_type", pa.string())]),
+            flavor="hive",
+        ),
+        existing_data_behavior="error",
+    )
+
+    types = pa.chunked_array(analytic["transaction_type"], pa.string())
+    columns = pa.table(
+        {
+            "date_seconds": np.concatenate(analytic["date_seconds"] or [np.empty(0, np.int64)]),
+            "amount": np.concatenate(analytic["amount"] or [np.empty(0, np.int64)]),
+            "transaction_type": types.combine_chunks().dictionary_encode(),
+        }
+    ).replace_schema_metadata({"data_version": str(version)})
+    with pa.OSFile(os.path.join(path, COLUMNS_FILE), "wb") as sink:
+        with pa.ipc.new_file(sink, columns.schema) as writer:
+            writer.write_table(columns, max_chunksize=max(len(columns), 1))
+
+    pointer = os.path.join(directory, f"{CURRENT}.tmp")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(directory, CURRENT))
+    _remove_old_snapshots(directory, name)
+    logging.info(
+        f"Wrote snapshot {name} of {len(columns)} transactions "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return path
+
+
+def _remove_old_snapshots(directory, current):
+    snapshots = sorted(
+        (entry for entry in os.scandir(directory) if entry.is_dir() and entry.name != current),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in snapshots[: max(0, len(snapshots) - (KEEP_SNAPSHOTS - 1))]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    write_snapshot(create_engine(Config.SQLALCHEMY_DATABASE_URI), Config.SNAPSHOT_DIR)
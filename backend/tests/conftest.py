@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Both apps connect when they are imported; keep the tests off the
+# databases in .env. The FastAPI app needs a file, as its sync and async
+# engines must see the same database.
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ["SMS_DB_URL"] = f"sqlite:///{tempfile.mkdtemp()}/sms.db"
@@ -0,0 +1,34 @@
+"""Synthetic messages are classified as the kind they were generated as."""
+import random
+from datetime import datetime
+
+import pytest
+
+from classifier import classify
+from generate_sms import MESSAGE_MIX, MessageFactory, generate
+
+MESSAGE_TYPES = {
+    "payment": "Payments to Code Holders",
+    "transfer": "Transfers To Mobile Numbers",
+    "bank_deposit": "Bank Deposits",
+    "incoming": "Incoming Money",
+    "third_party": "Transactions Initiated by Third Parties",
+    "bundle": "Internet and Voice Bundle Purchases",
+    "airtime": "Airtime Bill Payments",
+    "cash_power": "Cash Power Bill Payments",
+    "agent_withdrawal": "Withdrawals from Agents",
+    "failed": "Failed Transactions",
+    "reversal": "Reversed Transactions",
+}
+
+
+@pytest.mark.parametrize("kind", MESSAGE_MIX)
+def test_kind_classifies_as_its_type(kind):
+    factory = MessageFactory(random.Random(kind))
+    for _ in range(20):
+        assert classify(factory.body(kind, datetime(2024, 5, 10)))[0] == MESSAGE_TYPES[kind]
+
+
+def test_duplicates_by_default(tmp_path):
+    counts = generate(tmp_path / "sms.xml", 2000, seed=1)
+    assert counts["duplicate"] > 0
@@ -0,0 +1,65 @@
+"""The ingest queue: uploaded backups and shutting down."""
+import os
+import shutil
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlmodel import Session, select
+
+from jobs import CANCELLED, DONE, IngestQueue
+from sms_data import IngestionState, SmsData, prepare_database
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.dirname(__file__)), "modified_sms_v2.xml")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    prepare_database(engine)
+    yield engine
+    engine.dispose()
+
+
+def wait(job, timeout=60):
+    deadline = time.monotonic() + timeout
+    while job.finished is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def test_upload_and_its_checkpoint_are_removed(engine, tmp_path):
+    upload = tmp_path / "upload.xml"
+    shutil.copy(SAMPLE_XML, upload)
+    jobs = IngestQueue(engine)
+    job = jobs.submit(str(upload), remove_file=True)
+    wait(job)
+    assert job.status == DONE
+    assert not upload.exists()
+    with Session(engine) as db:
+        assert db.exec(select(IngestionState)).all() == []
+        assert db.exec(select(SmsData.id)).first() is not None
+    jobs.shutdown(timeout=5)
+
+
+def test_shutdown_cancels_queued_jobs(engine, tmp_path, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def run(self, job):
+        started.set()
+        release.wait(5)
+        job.status, job.finished = DONE, time.monotonic()
+
+    monkeypatch.setattr(IngestQueue, "_run", run)
+    jobs = IngestQueue(engine)
+    running = jobs.submit(SAMPLE_XML)
+    assert started.wait(5)
+    upload = tmp_path / "upload.xml"
+    upload.write_text("<smses></smses>")
+    queued = jobs.submit(str(upload), remove_file=True)
+
+    threading.Timer(0.2, release.set).start()
+    jobs.shutdown(timeout=5)
+    assert running.status == DONE
+    assert queued.status == CANCELLED
+    assert not upload.exists()
@@ -0,0 +1,90 @@
+"""Fields read by message_fields for both ingestion paths."""
+import os
+import random
+
+import pytest
+
+from message_fields import (
+    FIELDS, LABEL_GAP, extract_amount, extract_fields, extract_fields_one, field_values,
+)
+from parse_xml import iter_sms_records, iter_transactions
+from sms_processing import PARSED, parse_sms_chunk
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.dirname(__file__)), "modified_sms_v2.xml")
+
+
+@pytest.mark.parametrize(
+    "body, amount",
+    [
+        ("You have received 2000 RWF from Jane Smith. Your new balance:2000 RWF.", 2000.0),
+        ("Your payment of 1,000 RWF to Jane Smith has been completed. Fee was 0 RWF.", 1000.0),
+        ("*165*S*10000 RWF transferred. Fee was: 100 RWF. New balance: 28300 RWF.", 10000.0),
+        ("Fee was: 100 RWF. You paid 300 RWF", 300.0),
+        ("Your NEW BALANCE :40400 RWF", None),
+        # The fee label shares its "F" with the amount's "RWF"
+        ("Paid 500 RWFee was 20 RWF", 500.0),
+        # A transaction ID followed by "RWF" is not an amount
+        ("TxId: 12345 RWF. Your payment of 700 RWF", 700.0),
+        ("Transaction Id: 987 RWF", None),
+        ("1234567890123456 RWF", None),
+        ("No amount here", None),
+        ("", None),
+    ],
+)
+def test_extract_amount(body, amount):
+    assert extract_amount(body) == amount
+
+
+def test_label_gap():
+    assert extract_amount("Fee" + "." * LABEL_GAP + "100 RWF") is None
+    assert extract_amount("Fee" + "." * (LABEL_GAP + 1) + "100 RWF") == 100.0
+
+
+@pytest.mark.parametrize(
+    "body, fields",
+    [
+        (
+            "*165*S*10000 RWF transferred. Fee was: 100 RWF. New balance: 28300 RWF.",
+            {"amount": 10000.0, "fee": 100.0, "balance": 28300.0, "txid": None},
+        ),
+        (
+            "TxId: 50185533867. Your payment of 1,500 RWF. Your new balance: 29,237 RWF. Fee was 0 RWF.",
+            {"amount": 1500.0, "fee": 0.0, "balance": 29237.0, "txid": 50185533867},
+        ),
+        (
+            "Your NEW BALANCE :40400 RWF. Transaction Id: 987 RWF",
+            {"amount": None, "fee": None, "balance": 40400.0, "txid": 987},
+        ),
+        ("", dict.fromkeys(FIELDS)),
+    ],
+)
+def test_extract_fields_one(body, fields):
+    assert extract_fields_one(body) == fields
+
+
+def test_batches_match_single_messages():
+    words = [
+        "RWF", "Fee", "balance", "Balance", "BALANCE", "TxId:", "Transaction Id:", "1,000",
+        "250", "12", "1234567890123456", ",", ":", " ", "\t", "e", "\u00e9",
+    ]
+    rng = random.Random(0)
+    bodies = ["".join(rng.choices(words, k=rng.randint(0, 14))) for _ in range(5000)]
+    columns = [field_values(column) for column in extract_fields(bodies)]
+    assert [dict(zip(FIELDS, row)) for row in zip(*columns)] == [
+        extract_fields_one(body) for body in bodies
+    ]
+    assert columns[0] == [extract_amount(body) for body in bodies]
+
+
+def test_ingestion_paths_agree():
+    records = list(iter_sms_records(SAMPLE_XML))
+    sms_amounts = {
+        payload.message: payload.amount
+        for _, _, outcome, payload in parse_sms_chunk(records)
+        if outcome == PARSED
+    }
+    transaction_amounts = {t.message: t.amount for t in iter_transactions(SAMPLE_XML)}
+    assert sms_amounts.keys() == transaction_amounts.keys()
+    for message, amount in sms_amounts.items():
+        expected = int(amount) if amount is not None else None
+        assert transaction_amounts[message] == expected, message
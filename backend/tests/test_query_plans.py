@@ -0,0 +1,108 @@
+"""Check that the /sms, /sms/all, /transactions and /filter queries use an index.
+
+Builds an empty SQLite database with the current schema and runs each
+endpoint's query through EXPLAIN QUERY PLAN. Every step reading smsdata or
+transactions must be an index SEARCH: a SCAN, even one USING INDEX, walks
+the whole table or index.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlmodel import Session, SQLModel, select
+from werkzeug.datastructures import MultiDict
+
+from app import transaction_filters, transactions_page_query
+from migrations import upgrade
+from models import Base, Transaction
+from pagination import encode_cursor
+from sms_data import IngestionState, SmsData, get_sms_filters, paginate_sms
+
+DAY = datetime(2024, 5, 10)
+SMS_CURSOR = encode_cursor(DAY, "00000000000000000000000000000000")
+TRANSACTION_CURSOR = encode_cursor(DAY, 1)
+
+# (name, get_sms_filters arguments) for the /sms endpoint
+SMS_CASES = [
+    ("type", (None, "Incoming Money", None, None)),
+    ("date", (None, None, DAY, None)),
+    ("amount", (None, None, None, 2000.0)),
+    ("type + date", (None, "Incoming Money", DAY, None)),
+    ("type + amount", (None, "Incoming Money", None, 2000.0)),
+]
+
+# (name, query string) for /filter and /export
+TRANSACTION_CASES = [
+    ("type", {"type": "Incoming Money"}),
+    ("date range", {"start_date": "2024-05-01", "end_date": "2024-05-31"}),
+    ("amount range", {"min_amount": "1000", "max_amount": "5000"}),
+    ("type + date range", {"type": "Incoming Money", "start_date": "2024-05-01"}),
+]
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    Base.metadata.create_all(engine)
+    SQLModel.metadata.create_all(engine)
+    upgrade(engine, [Transaction, SmsData, IngestionState])
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, run):
+    """EXPLAIN QUERY PLAN details for the statement run(session) executes."""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with Session(engine) as session:
+            run(session)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    statement, parameters = captured[-1]
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in rows]
+
+
+def assert_index_search(engine, table, run):
+    plan = query_plan(engine, run)
+    reads = [detail for detail in plan if detail.split()[1:2] == [table]]
+    assert reads, plan
+    assert all(detail.startswith(f"SEARCH {table} USING ") for detail in reads), plan
+
+
+@pytest.mark.parametrize("page, cursor", [("first page", None), ("next page", SMS_CURSOR)])
+@pytest.mark.parametrize("name, arguments", SMS_CASES, ids=[name for name, _ in SMS_CASES])
+def test_sms_filters(engine, name, arguments, page, cursor):
+    filters = get_sms_filters(*arguments)
+    assert_index_search(engine, "smsdata", lambda db: paginate_sms(db, filters, cursor))
+
+
+def test_sms_all_next_page(engine):
+    assert_index_search(engine, "smsdata", lambda db: paginate_sms(db, [], SMS_CURSOR))
+
+
+def test_transactions_next_page(engine):
+    assert_index_search(
+        engine,
+        "transactions",
+        lambda db: db.exec(transactions_page_query(TRANSACTION_CURSOR)).all(),
+    )
+
+
+@pytest.mark.parametrize(
+    "name, args", TRANSACTION_CASES, ids=[name for name, _ in TRANSACTION_CASES]
+)
+def test_transaction_filters(engine, name, args):
+    assert_index_search(
+        engine,
+        "transactions",
+        lambda db: db.exec(
+            select(Transaction).where(*transaction_filters(MultiDict(args)))
+        ).all(),
+    )
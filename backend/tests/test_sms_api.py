@@ -0,0 +1,97 @@
+"""The FastAPI /sms endpoints serve the public columns of smsdata."""
+import json
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlmodel import Session
+
+from database import get_engine
+from generate_sms import generate
+import main
+from search import create_search_index
+from sms_data import prepare_database
+from sms_processing import SMSProcessor
+
+SAMPLE_XML = os.path.join(os.path.dirname(os.path.dirname(__file__)), "modified_sms_v2.xml")
+PUBLIC_FIELDS = {
+    "id", "address", "date_sent", "message", "service_center", "amount", "fee",
+    "balance", "txid", "message_type", "category", "date",
+}
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        with Session(get_engine()) as db:
+            SMSProcessor(db=db, xml_file=SAMPLE_XML).process_and_store_sms()
+        yield client
+
+
+@pytest.mark.parametrize("url", ["/sms/all?limit=5", "/sms?type=Incoming%20Money&limit=5"])
+def test_pages_leave_out_fingerprint(client, url):
+    items = client.get(url).json()["items"]
+    assert items
+    assert all(set(item) == PUBLIC_FIELDS for item in items)
+
+
+def test_search_leaves_out_fingerprint(client):
+    items = client.get("/sms?mode=search&search=airtime&limit=5").json()["items"]
+    assert items
+    assert all(set(item) == PUBLIC_FIELDS | {"rank", "snippet"} for item in items)
+
+
+def test_search_matches_type_and_category(client):
+    items = client.get("/sms?mode=search&search=bundle%20purchases&limit=5").json()["items"]
+    assert items
+    assert {item["message_type"] for item in items} == {"Internet and Voice Bundle Purchases"}
+
+
+def test_search_index_in_older_layout_is_rebuilt(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sms.db'}")
+    prepare_database(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE smsdata_fts"))
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE smsdata_fts USING fts5(message, address, service_center,"
+            " content = 'smsdata', content_rowid = 'rowid')"
+        ))
+    create_search_index(engine)
+    with engine.connect() as conn:
+        schema = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'smsdata_fts'")).scalar()
+    assert "message_type, category" in schema
+
+
+def test_exports_leave_out_fingerprint(client):
+    header = client.get("/export?format=csv").text.splitlines()[0]
+    assert set(header.split(",")) == PUBLIC_FIELDS
+    row = json.loads(client.get("/export").text.splitlines()[0])
+    assert set(row) == PUBLIC_FIELDS
+
+
+def test_totals_follow_ingests(client, tmp_path):
+    before = client.get("/sms/all?include_total=true&limit=1").json()["total"]
+    more = tmp_path / "more.xml"
+    generate(more, 200, duplicate_rate=0, unknown_rate=0, seed=7)
+    with Session(get_engine()) as db:
+        SMSProcessor(db=db, xml_file=str(more)).process_and_store_sms()
+    # Another page size, so the response cache cannot answer
+    after = client.get("/sms/all?include_total=true&limit=2").json()["total"]
+    assert after == before + 200
+
+
+def test_uploaded_backup_is_queued(client, tmp_path):
+    backup = tmp_path / "upload.xml"
+    generate(backup, 20, duplicate_rate=0, unknown_rate=0, seed=11)
+    response = client.post("/ingest", content=backup.read_bytes())
+    assert response.status_code == 202
+    status_url = response.json()["status_url"]
+    for _ in range(100):
+        job = client.get(status_url).json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    assert job["processed"] == 20
@@ -0,0 +1,34 @@
+"""Transactions for SMS stored by smsdata-only runs are backfilled once."""
+from sqlalchemy import create_engine, func, select
+from sqlmodel import Session
+
+from generate_sms import generate
+from models import Transaction
+from sms_data import prepare_database
+from sms_processing import SMSProcessor
+from sms_transactions import backfill_pending
+
+
+def test_backfill_runs_only_past_the_mark(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sms.db'}")
+    prepare_database(engine, transactions=True)
+    xml_file = tmp_path / "sms.xml"
+    generate(xml_file, 300, duplicate_rate=0, unknown_rate=0, seed=3)
+
+    with Session(engine) as db:
+        SMSProcessor(db=db, xml_file=str(xml_file)).process_and_store_sms()
+        assert backfill_pending(db)
+
+        # The file is unchanged, but its SMS have no transactions yet
+        result = SMSProcessor(
+            db=db, xml_file=str(xml_file), transactions=True
+        ).process_and_store_sms()
+        assert result["processed"] == 0
+        assert result["transactions"] > 0
+        assert db.exec(select(func.count()).select_from(Transaction)).one()[0] == result["transactions"]
+        assert not backfill_pending(db)
+
+        rerun = SMSProcessor(
+            db=db, xml_file=str(xml_file), transactions=True
+        ).process_and_store_sms()
+        assert rerun["transactions"] == 0
@@ -0,0 +1,24 @@
+"""Importing the API modules leaves connecting to the database to startup."""
+import os
+import subprocess
+import sys
+
+import app
+
+BACKEND = os.path.dirname(os.path.dirname(__file__))
+
+
+def test_imports_do_not_connect():
+    code = (
+        "import sys, app, main\n"
+        "assert app.engine is None and app.Session is None\n"
+        "assert 'sqlalchemy.dialects.sqlite' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND, check=True)
+
+
+def test_flask_app_connects_on_first_request():
+    response = app.app.test_client().get("/transactions")
+    assert response.status_code == 200
+    assert response.get_json()["transactions"] == []
+    assert app.Session is not None
@@ -0,0 +1,33 @@
+"""The Flask /filter and /export endpoints check their parameters up front."""
+import pytest
+
+import app
+from export import iter_export
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("url", ["/filter", "/export", "/export?format=csv"])
+@pytest.mark.parametrize(
+    "query", ["min_amount=abc", "max_amount=1.5", "start_date=yesterday", "end_date=2024-13-01"]
+)
+def test_malformed_filters_are_rejected(client, url, query):
+    separator = "&" if "?" in url else "?"
+    response = client.get(f"{url}{separator}{query}")
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid ")
+
+
+def test_filters_are_applied(client):
+    response = client.get("/filter?start_date=2024-05-01&end_date=2024-05-31&min_amount=1000")
+    assert response.status_code == 200
+    assert client.get("/export?format=csv&min_amount=1000").status_code == 200
+
+
+def test_ndjson_export_sends_the_first_row_at_once():
+    rows = iter_export(iter(range(3)), ["n"], lambda n: {"n": n}, "ndjson")
+    assert next(rows) == '{"n": 0}\n'
+    assert next(rows) == '{"n": 1}\n{"n": 2}\n'
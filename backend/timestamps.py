@@ -0,0 +1,105 @@
+"""Batch conversion of SMS backup timestamps to datetimes.
+
+Backups store times as epoch milliseconds. Ingestion wants naive datetimes
+in one explicit time zone, truncated to the second: SMS_TIMEZONE when set
+(e.g. Africa/Kigali), otherwise the server's local zone, which is what
+datetime.fromtimestamp() used before. Keep it fixed once data is stored;
+fingerprints include the dates, so changing it makes re-ingested messages
+look new.
+
+With NumPy the arithmetic runs over the whole batch as datetime64. The
+zone's UTC offset is not looked up per message: the moments where it
+changes within the batch's time range are found by bisection, which takes
+a couple of lookups for a batch spanning a few days. Without NumPy each
+value goes through datetime.fromtimestamp.
+"""
+import os
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from utils import lazy_import
+
+# Optional, the per-value path is used instead; loaded on first use
+np = lazy_import("numpy")
+
+# Assumed to be too short for a zone's UTC offset to change and change back
+STEADY_SECONDS = 7 * 86400
+# Epoch milliseconds a datetime can hold, a day inside years 1 and 9999
+MIN_MS = int(datetime(1, 1, 2, tzinfo=timezone.utc).timestamp()) * 1000
+MAX_MS = int(datetime(9999, 12, 30, tzinfo=timezone.utc).timestamp()) * 1000
+
+
+def get_zone(name=None):
+    """The zone named by name or SMS_TIMEZONE, or None for the local zone."""
+    name = name or os.getenv("SMS_TIMEZONE")
+    return ZoneInfo(name) if name else None
+
+
+TIMEZONE = get_zone()
+
+
+def parse_epoch_ms(values):
+    """Each value as an int, or None when it is missing, not a number or out of range."""
+    parsed = []
+    for value in values:
+        try:
+            ms = int(value)
+        except (TypeError, ValueError):
+            ms = None
+        parsed.append(ms if ms is not None and MIN_MS <= ms <= MAX_MS else None)
+    return parsed
+
+
+def utc_offset(seconds, zone):
+    """Offset of zone (None for local time) from UTC at epoch seconds, in seconds."""
+    moment = datetime.fromtimestamp(seconds, timezone.utc).astimezone(zone)
+    return int(moment.utcoffset().total_seconds())
+
+
+def epoch_ms_to_datetimes(values, zone=TIMEZONE):
+    """Convert a batch of epoch-millisecond values to naive datetimes in zone.
+
+    values may be ints or strings as read from the XML. Results are
+    truncated to the second and come back in the same order, with None for
+    values that are missing or not numbers.
+    """
+    milliseconds = parse_epoch_ms(values)
+    valid = [ms for ms in milliseconds if ms is not None]
+    if not valid:
+        return [None] * len(milliseconds)
+    if np is None:
+        converted = iter(
+            datetime.fromtimestamp(ms // 1000, zone).replace(tzinfo=None) for ms in valid
+        )
+    else:
+        converted = iter(_convert_with_numpy(valid, zone))
+    return [None if ms is None else next(converted) for ms in milliseconds]
+
+
+def offset_changes(start, end, zone):
+    """(epoch second, new offset) for every change of zone's UTC offset in (start, end]."""
+    changes = []
+
+    def scan(low, high, low_offset, high_offset):
+        if low_offset == high_offset and high - low <= STEADY_SECONDS:
+            return
+        if high - low == 1:
+            changes.append((high, high_offset))
+            return
+        middle = (low + high) // 2
+        middle_offset = utc_offset(middle, zone)
+        scan(low, middle, low_offset, middle_offset)
+        scan(middle, high, middle_offset, high_offset)
+
+    scan(start, end, utc_offset(start, zone), utc_offset(end, zone))
+    return changes
+
+
+def _convert_with_numpy(milliseconds, zone):
+    seconds = np.floor_divide(np.asarray(milliseconds, dtype=np.int64), 1000)
+    start, end = int(seconds.min()), int(seconds.max())
+    changes = offset_changes(start, end, zone)
+    bounds = np.array([moment for moment, _ in changes], dtype=np.int64)
+    offsets = np.array([utc_offset(start, zone)] + [offset for _, offset in changes])
+    local = seconds + offsets[np.searchsorted(bounds, seconds, side="right")]
+    return local.astype("datetime64[s]").tolist()
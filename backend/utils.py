@@ -1,2 +1,54 @@
+import hashlib
+import importlib
+import importlib.util
+import sys
+import types
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 def format_error(message, status_code):
-    return {'error': message}, status_code
\ No newline at end of file
+    return {'error': message}, status_code
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+def throughput(count, elapsed):
+    return round(count / elapsed, 1) if elapsed > 0 else None
+
+def fingerprint(*values):
+    """Stable content hash used to detect duplicate rows."""
+    key = '\x1f'.join('' if value is None else str(value) for value in values)
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is first used."""
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.__name__)
+        # Later lookups find the module's attributes without coming here
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+def lazy_import(name):
+    """Module name, imported on first attribute access; None if it is not installed.
+
+    For modules only ingestion and analytics use (numpy, pyarrow, the SQL
+    dialects' inserts), so that importing the API modules does not load them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+    except ModuleNotFoundError:  # a parent package is missing
+        spec = None
+    return LazyModule(name) if spec is not None else None
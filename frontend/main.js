@@ -4,6 +4,11 @@ const SUPABASE_ANON_KEY = 'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBh
 
 const supabase = supabase.createClient(SUPABASE_URL, SUPABASE_ANON_KEY);
 
+// Flask API (backend/app.py) serving the pre-aggregated chart summaries, set
+// in index.html; an empty value means the origin that served the page
+const API_BASE_URL =
+  document.querySelector('meta[name="api-base-url"]')?.content ?? '';
+
 
 document.addEventListener('DOMContentLoaded', () => {
   const searchInput = document.getElementById('search');
@@ -14,6 +19,7 @@ document.addEventListener('DOMContentLoaded', () => {
   const searchResults = document.getElementById('search-results');
 
   let transactions = [];
+  let charts = [];
 
   async function fetchTransactions() {
   try {
@@ -29,13 +35,46 @@ document.addEventListener('DOMContentLoaded', () => {
     }));
 
     renderTransactionsTable(transactions);
-    renderCharts(transactions);
   } catch (error) {
     console.error('Error fetching transactions:', error.message);
   }
 }
 
+  async function fetchSummary(groupBy) {
+    const response = await fetch(`${API_BASE_URL}/summary?group_by=${groupBy}`);
+    if (!response.ok) {
+      throw new Error(`Summary request failed with status ${response.status}`);
+    }
+    const { summary } = await response.json();
+    return summary;
+  }
+
+  async function fetchCharts() {
+    try {
+      const [byType, byMonth] = await Promise.all([
+        fetchSummary('type'),
+        fetchSummary('month'),
+      ]);
+      // Totals come pre-aggregated from /summary instead of every row
+      drawCharts(
+        Object.fromEntries(byType.map((row) => [row.key, row.total_amount])),
+        Object.fromEntries(
+          byMonth.map((row) => [
+            monthLabel(new Date(`${row.key}-01T00:00:00`)),
+            row.total_amount,
+          ])
+        )
+      );
+    } catch (error) {
+      console.error('Error fetching summaries:', error.message);
+    }
+  }
+
+  function monthLabel(date) {
+    return date.toLocaleString('default', { month: 'long', year: 'numeric' });
+  }
 
+  // Charts for rows already loaded, such as the filtered transactions
   function renderCharts(data) {
     const transactionTypes = data.reduce((acc, transaction) => {
       const amount = parseFloat(transaction.amount.replace(' RWF', ''));
@@ -45,15 +84,20 @@ document.addEventListener('DOMContentLoaded', () => {
     }, {});
 
     const monthlySummaries = data.reduce((acc, transaction) => {
-      const month = new Date(transaction.date).toLocaleString('default', {
-        month: 'long',
-      });
+      const month = monthLabel(new Date(transaction.date));
       const amount = parseFloat(transaction.amount.replace(' RWF', ''));
       acc[month] = (acc[month] || 0) + amount;
       return acc;
     }, {});
 
-    new Chart(document.getElementById('transactionTypeChart'), {
+    drawCharts(transactionTypes, monthlySummaries);
+  }
+
+  function drawCharts(transactionTypes, monthlySummaries) {
+    // A canvas holds one chart at a time
+    charts.forEach((chart) => chart.destroy());
+
+    charts = [new Chart(document.getElementById('transactionTypeChart'), {
       type: 'bar',
       data: {
         labels: Object.keys(transactionTypes),
@@ -73,7 +117,7 @@ document.addEventListener('DOMContentLoaded', () => {
           },
         },
       },
-    });
+    }),
 
     new Chart(document.getElementById('monthlySummaryChart'), {
       type: 'line',
@@ -101,7 +145,7 @@ document.addEventListener('DOMContentLoaded', () => {
           },
         },
       },
-    });
+    }),
 
     new Chart(document.getElementById('paymentDistributionChart'), {
       type: 'pie',
@@ -115,7 +159,7 @@ document.addEventListener('DOMContentLoaded', () => {
           },
         ],
       },
-    });
+    })];
   }
 
   function filterTransactions() {
@@ -197,4 +241,5 @@ document.addEventListener('DOMContentLoaded', () => {
   }
 
   fetchTransactions();
+  fetchCharts();
 });